@@ -10,6 +10,7 @@ import wx
 # end wxGlade
 
 # begin wxGlade: extracode
+from listview import FileListView
 # end wxGlade
 
 
@@ -148,9 +149,12 @@ class ShowFileListDialog(wx.Dialog):
 		sizer_v_1 = wx.BoxSizer(wx.VERTICAL)
 		sizer_h.Add(sizer_v_1, 12, wx.ALL | wx.EXPAND, 5)
 
-		self.text_ctrl_1 = wx.TextCtrl(self, wx.ID_ANY, "", style=wx.HSCROLL | wx.TE_DONTWRAP | wx.TE_MULTILINE | wx.TE_READONLY | wx.TE_RICH2)
-		self.text_ctrl_1.SetMinSize((700, 1100))
-		sizer_v_1.Add(self.text_ctrl_1, 0, 0, 0)
+		self.label_progress = wx.StaticText(self, wx.ID_ANY, "")
+		sizer_v_1.Add(self.label_progress, 0, wx.BOTTOM | wx.EXPAND, 5)
+
+		self.list_view = FileListView(self, wx.ID_ANY, style=wx.LC_HRULES | wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_VRULES)
+		self.list_view.SetMinSize((700, 800))
+		sizer_v_1.Add(self.list_view, 1, wx.EXPAND, 0)
 
 		sizer_v_2 = wx.BoxSizer(wx.VERTICAL)
 		sizer_h.Add(sizer_v_2, 1, wx.ALL, 5)
@@ -164,6 +168,15 @@ class ShowFileListDialog(wx.Dialog):
 		self.btn_csv = wx.Button(self, wx.ID_ANY, u"保存为 csv(&S)")
 		sizer_v_2.Add(self.btn_csv, 0, wx.ALL, 5)
 
+		self.btn_cancel = wx.Button(self, wx.ID_ANY, u"取消扫描(&A)")
+		self.btn_cancel.Enable(False)
+		sizer_v_2.Add(self.btn_cancel, 0, wx.ALL, 5)
+
+		self.checkbox_watch = wx.CheckBox(self, wx.ID_ANY, u"监视变化(&W)")
+		self.checkbox_watch.SetToolTip(u"扫描完成后监视目标文件夹：有变化的文件夹合并一段时间后重新读取，只更新清单和文件夹树中相应的部分")
+		self.checkbox_watch.Enable(False)
+		sizer_v_2.Add(self.checkbox_watch, 0, wx.ALL, 5)
+
 		self.btn_close = wx.Button(self, wx.ID_CLOSE, "")
 		self.btn_close.SetDefault()
 		self.btn_close.SetLabel('关闭(&X)')
@@ -180,6 +193,8 @@ class ShowFileListDialog(wx.Dialog):
 		self.Bind(wx.EVT_BUTTON, self.OnCopyBtn, self.btn_copy)
 		self.Bind(wx.EVT_BUTTON, self.OnSaveTxtBtn, self.btn_txt)
 		self.Bind(wx.EVT_BUTTON, self.OnSaveCsvBtn, self.btn_csv)
+		self.Bind(wx.EVT_BUTTON, self.OnCancelBtn, self.btn_cancel)
+		self.Bind(wx.EVT_CHECKBOX, self.OnWatchCheckbox, self.checkbox_watch)
 		# end wxGlade
 
 	def OnCopyBtn(self, event):  # wxGlade: ShowFileListDialog.<event_handler>
@@ -194,6 +209,14 @@ class ShowFileListDialog(wx.Dialog):
 		print("Event handler 'OnSaveCsvBtn' not implemented!")
 		event.Skip()
 
+	def OnCancelBtn(self, event):  # wxGlade: ShowFileListDialog.<event_handler>
+		print("Event handler 'OnCancelBtn' not implemented!")
+		event.Skip()
+
+	def OnWatchCheckbox(self, event):  # wxGlade: ShowFileListDialog.<event_handler>
+		print("Event handler 'OnWatchCheckbox' not implemented!")
+		event.Skip()
+
 # end of class ShowFileListDialog
 
 class FileListBaseUIFrame(wx.Frame):
@@ -268,6 +291,52 @@ class FileListBaseUIFrame(wx.Frame):
 		self.checkbox_access = wx.CheckBox(self.panel_1, wx.ID_ANY, u"访问时间")
 		sizer_5h.Add(self.checkbox_access, 0, 0, 0)
 
+		self.checkbox_hash = wx.CheckBox(self.panel_1, wx.ID_ANY, u"内容哈希")
+		self.checkbox_hash.SetToolTip(u"计算每个文件内容的 SHA-256，需要读取全部文件内容")
+		sizer_5h.Add(self.checkbox_hash, 0, 0, 0)
+
+		sizer_6_h = wx.BoxSizer(wx.HORIZONTAL)
+		sizer_v_1.Add(sizer_6_h, 0, wx.EXPAND, 0)
+
+		label_workers = wx.StaticText(self.panel_1, wx.ID_ANY, u"同时读取的目录数[网络共享建议 8~32](&W)")
+		sizer_6_h.Add(label_workers, 0, wx.ALIGN_CENTER_VERTICAL, 0)
+
+		self.spin_workers = wx.SpinCtrl(self.panel_1, wx.ID_ANY, "1", min=1, max=64)
+		sizer_6_h.Add(self.spin_workers, 0, 0, 0)
+
+		self.checkbox_index = wx.CheckBox(self.panel_1, wx.ID_ANY, u"增量索引(&I)")
+		self.checkbox_index.SetToolTip(u"只重新读取修改时间变化了的文件夹，其余从上次扫描的索引中读取；内容哈希也缓存起来，未变化的文件不再重新计算")
+		sizer_6_h.Add(self.checkbox_index, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 10)
+
+		self.checkbox_prefetch = wx.CheckBox(self.panel_1, wx.ID_ANY, u"预读子文件夹(&P)")
+		self.checkbox_prefetch.SetToolTip(u"展开文件夹树的节点时在后台读取下一层子文件夹；网络共享很慢或不希望额外访问时可以关闭")
+		self.checkbox_prefetch.SetValue(1)
+		sizer_6_h.Add(self.checkbox_prefetch, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 10)
+
+		sizer_7_h = wx.BoxSizer(wx.HORIZONTAL)
+		sizer_v_1.Add(sizer_7_h, 0, wx.EXPAND, 0)
+
+		label_remote = wx.StaticText(self.panel_1, wx.ID_ANY, u"远程扫描端(&R)")
+		sizer_7_h.Add(label_remote, 0, wx.ALIGN_CENTER_VERTICAL, 0)
+
+		self.tc_remote = wx.TextCtrl(self.panel_1, wx.ID_ANY, "")
+		self.tc_remote.SetToolTip(u"由数据所在机器上的 remote.py 扫描：host:port 或 unix:路径，多个用空格分隔；写成 地址=目录 时扫描对方机器上的目录。留空在本机扫描")
+		sizer_7_h.Add(self.tc_remote, 1, wx.LEFT, 5)
+
+		sizer_8_h = wx.BoxSizer(wx.HORIZONTAL)
+		sizer_v_1.Add(sizer_8_h, 0, wx.EXPAND, 0)
+
+		label_sort = wx.StaticText(self.panel_1, wx.ID_ANY, u"结果排序(&Y)")
+		sizer_8_h.Add(label_sort, 0, wx.ALIGN_CENTER_VERTICAL, 0)
+
+		self.choice_sort = wx.Choice(self.panel_1, wx.ID_ANY, choices=[u"扫描顺序", u"名称", u"路径", u"大小", u"修改时间", u"创建时间", u"访问时间"])
+		self.choice_sort.SetToolTip(u"按文件的原始大小和时间排序；文件很多时分段排序后写入临时文件再归并，不会占用过多内存")
+		self.choice_sort.SetSelection(0)
+		sizer_8_h.Add(self.choice_sort, 0, wx.LEFT, 5)
+
+		self.checkbox_sort_desc = wx.CheckBox(self.panel_1, wx.ID_ANY, u"降序")
+		sizer_8_h.Add(self.checkbox_sort_desc, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 10)
+
 		sizer_btn_h = wx.BoxSizer(wx.HORIZONTAL)
 		sizer_v_1.Add(sizer_btn_h, 0, wx.ALL, 4)
 
@@ -275,6 +344,9 @@ class FileListBaseUIFrame(wx.Frame):
 		self.button_OK.SetDefault()
 		sizer_btn_h.Add(self.button_OK, 0, 0, 0)
 
+		self.btn_export = wx.Button(self.panel_1, wx.ID_ANY, u"直接导出(&E)")
+		sizer_btn_h.Add(self.btn_export, 0, 0, 0)
+
 		self.button_CANCEL = wx.Button(self.panel_1, wx.ID_ANY, u"关闭(&C)")
 		sizer_btn_h.Add(self.button_CANCEL, 0, 0, 0)
 
@@ -293,7 +365,9 @@ class FileListBaseUIFrame(wx.Frame):
 		self.Bind(wx.EVT_RADIOBOX, self.OnPriorityRB, self.rb_priority)
 		self.Bind(wx.EVT_RADIOBOX, self.OnFileTypeRb, self.rb_file_type)
 		self.Bind(wx.EVT_BUTTON, self.OnGenerateFilelistBtn, self.button_OK)
+		self.Bind(wx.EVT_BUTTON, self.OnExportBtn, self.btn_export)
 		self.Bind(wx.EVT_BUTTON, self.OnCloseBTN, self.button_CANCEL)
+		self.Bind(wx.EVT_CHECKBOX, self.OnPrefetchCheckbox, self.checkbox_prefetch)
 		# end wxGlade
 
 	def OnBrowseBtn(self, event):  # wxGlade: FileListBaseUIFrame.<event_handler>
@@ -312,10 +386,18 @@ class FileListBaseUIFrame(wx.Frame):
 		print("Event handler 'OnGenerateFilelistBtn' not implemented!")
 		event.Skip()
 
+	def OnExportBtn(self, event):  # wxGlade: FileListBaseUIFrame.<event_handler>
+		print("Event handler 'OnExportBtn' not implemented!")
+		event.Skip()
+
 	def OnCloseBTN(self, event):  # wxGlade: FileListBaseUIFrame.<event_handler>
 		print("Event handler 'OnCloseBTN' not implemented!")
 		event.Skip()
 
+	def OnPrefetchCheckbox(self, event):  # wxGlade: FileListBaseUIFrame.<event_handler>
+		print("Event handler 'OnPrefetchCheckbox' not implemented!")
+		event.Skip()
+
 # end of class FileListBaseUIFrame
 
 class MyApp(wx.App):
@@ -1,13 +1,36 @@
-import os, re
+import io
+import os
 import wx
 import BaseUI
-import csv
-from datetime import datetime
-import platform
-if platform.architecture()[0] == '32bit':
-	import formatter
-else:
-	import formatter_64 as formatter
+import threading
+import time
+import scanner
+import rowstore
+import exporter
+import dircache
+import dirreport
+import hashing
+import snapshot
+import watcher
+import remote
+import scanindex
+import filterexpr
+from pathtrie import PathTrie
+
+
+# 保存和直接导出时可选的格式，jsonl、parquet、arrow 保存原始数值，parquet、arrow 需要安装 pyarrow
+EXPORT_FORMATS = [('CSV 文件', 'csv'), ('文本文件', 'txt'), ('gzip 压缩的 CSV', 'csv.gz'), ('JSON Lines', 'jsonl'),
+	('Parquet', 'parquet'), ('Arrow IPC', 'arrow')]
+# 结果窗口最多预览的行数，其余的行只在末尾的说明行中合计
+PREVIEW_ROWS = 100000
+# 复制的文本预计超过这个大小时先提醒，可以改为只复制前 PREVIEW_ROWS 行
+COPY_WARN_SIZE = 32 << 20
+# 与“结果排序”的选项一一对应，见 extsort.SORT_KEYS
+SORT_CHOICES = (None, 'name', 'path', 'size', 'mtime', 'ctime', 'atime')
+
+
+def _Wildcard(formats):
+	return '|'.join(f'{title} (*.{ext})|*.{ext}' for title, ext in formats)
 
 
 class FileListFrame(BaseUI.FileListBaseUIFrame):
@@ -15,8 +38,16 @@ class FileListFrame(BaseUI.FileListBaseUIFrame):
 		super().__init__(*args, **kwargs)
 		self.root_folder = None
 		self.folder_tree.Bind(wx.EVT_CONTEXT_MENU, self.OnTreeContextMenu)
+		self.folder_tree.Bind(wx.EVT_TREE_ITEM_EXPANDING, self.OnTreeItemExpanding)
 		self.MakeTreeContextMenu()
-		self.deleted_nodes = set()
+		# 文件夹树、生成清单和还原树共用同一份目录缓存，每个目录只从磁盘读取一次
+		self.dir_cache = dircache.DirCache()
+		self.tree_prefetcher = scanner.SubfolderPrefetcher(lister=self.dir_cache.list_subfolders,
+			enabled=self.checkbox_prefetch.GetValue())
+		self.tc_file_type.SetToolTip(filterexpr.SYNTAX_HELP)
+		self.deleted_nodes = PathTrie()
+		self.folder_sizes = {}
+		self.scan_stats = scanner.ScanStats()
 
 	def OnBrowseBtn(self, evt):
 		dlg = wx.DirDialog(self, '选择文件夹', '')
@@ -26,23 +57,37 @@ class FileListFrame(BaseUI.FileListBaseUIFrame):
 			self._LoadFolderTree()
 		dlg.Destroy()
 
+	def OnPrefetchCheckbox(self, evt):
+		self.tree_prefetcher.enabled = self.checkbox_prefetch.GetValue()
+		if not self.tree_prefetcher.enabled:
+			self.tree_prefetcher.reset()
+
 	def _LoadFolderTree(self):
-		"""目标文件夹内的所有子文件夹结构展示在 folder tree 中"""
+		"""目标文件夹内的子文件夹结构展示在 folder tree 中，子节点在展开时才加载"""
 		self.folder_tree.DeleteAllItems()
+		self.tree_prefetcher.reset()
+		self.deleted_nodes = PathTrie()
+		self.folder_sizes = {}
 		if not self.root_folder:
 			return
 
-		root = self.folder_tree.AddRoot(os.path.basename(self.root_folder))
+		root = self.folder_tree.AddRoot(self._TreeLabel(self.root_folder), data=self.root_folder)
 		self._AddTreeNodes(root, self.root_folder)
 		self.folder_tree.Expand(root)
-		self.deleted_nodes = set()
 
 	def _AddTreeNodes(self, parent_item, folder_path):
-		for item in os.listdir(folder_path):
-			item_path = os.path.join(folder_path, item)
-			if os.path.isdir(item_path):
-				new_item = self.folder_tree.AppendItem(parent_item, item)
-				self._AddTreeNodes(new_item, item_path)
+		"""只添加一层子文件夹，子节点先标记为可展开，并在后台预读下一层"""
+		subfolders = [entry for entry in self.tree_prefetcher.get(folder_path) if entry.path not in self.deleted_nodes]
+		for entry in subfolders:
+			new_item = self.folder_tree.AppendItem(parent_item, self._TreeLabel(entry.path), data=entry.path)
+			self.folder_tree.SetItemHasChildren(new_item, True)
+			self.tree_prefetcher.prefetch(entry.path)
+		self.folder_tree.SetItemHasChildren(parent_item, bool(subfolders))
+
+	def OnTreeItemExpanding(self, evt):
+		item = evt.GetItem()
+		if self.folder_tree.GetChildrenCount(item, False) == 0:
+			self._AddTreeNodes(item, self.folder_tree.GetItemData(item))
 
 	def OnTreeContextMenu(self, evt):
 		if self.root_folder is None:
@@ -55,8 +100,18 @@ class FileListFrame(BaseUI.FileListBaseUIFrame):
 		self.tree_menu = wx.Menu()
 		delete = self.tree_menu.Append(wx.ID_ANY, '删除(&D)')
 		restore = self.tree_menu.Append(wx.ID_ANY, '还原(&R)')
+		refresh = self.tree_menu.Append(wx.ID_ANY, '从磁盘刷新(&F)')
+		import_excluded = self.tree_menu.Append(wx.ID_ANY, '导入排除列表(&I)...')
+		summarize = self.tree_menu.Append(wx.ID_ANY, '统计文件夹大小(&S)')
+		duplicates = self.tree_menu.Append(wx.ID_ANY, '查找重复文件(&U)...')
+		compare = self.tree_menu.Append(wx.ID_ANY, '比较快照(&C)...')
 		self.Bind(wx.EVT_MENU, self.OnDeleteTreeNode, delete)
 		self.Bind(wx.EVT_MENU, self.OnRestoreTree, restore)
+		self.Bind(wx.EVT_MENU, self.OnRefreshTree, refresh)
+		self.Bind(wx.EVT_MENU, self.OnImportExcluded, import_excluded)
+		self.Bind(wx.EVT_MENU, self.OnSummarizeFolder, summarize)
+		self.Bind(wx.EVT_MENU, self.OnFindDuplicates, duplicates)
+		self.Bind(wx.EVT_MENU, self.OnCompareSnapshots, compare)
 
 	def OnDeleteTreeNode(self, evt):
 		# 删除当前选中的节点
@@ -66,19 +121,182 @@ class FileListFrame(BaseUI.FileListBaseUIFrame):
 			if root_item == item:
 				wx.MessageBox('不可以删除根节点', '提示')
 				return
-			# 获取绝对路径
-			path_parts = []
-			current = item
-			while current.IsOk() and current != root_item:
-				path_parts.insert(0, self.folder_tree.GetItemText(current))
-				current = self.folder_tree.GetItemParent(current)
-			absolute_path = os.path.join(self.root_folder, *path_parts)
-			self.deleted_nodes.add(absolute_path)
+			self.deleted_nodes.add(self.folder_tree.GetItemData(item))
 			self.folder_tree.Delete(item)
 
 	def OnRestoreTree(self, evt):
 		self._LoadFolderTree()
 
+	def OnRefreshTree(self, evt):
+		"""丢弃选中的文件夹（未选中时为目标文件夹）及其子文件夹的缓存，重新从磁盘读取，排除的文件夹保持不变"""
+		item = self.folder_tree.GetSelection()
+		if not item.IsOk():
+			item = self.folder_tree.GetRootItem()
+		if not item.IsOk():
+			return
+		folder = self.folder_tree.GetItemData(item)
+		self.dir_cache.invalidate(folder)
+		self.tree_prefetcher.reset()
+		prefix = os.path.join(folder, '')
+		self.folder_sizes = {path: summary for path, summary in self.folder_sizes.items() if path != folder and not path.startswith(prefix)}
+		expanded = self.folder_tree.IsExpanded(item)
+		self.folder_tree.DeleteChildren(item)
+		self.folder_tree.SetItemText(item, self._TreeLabel(folder))
+		self._AddTreeNodes(item, folder)
+		if expanded:
+			self.folder_tree.Expand(item)
+
+	def PatchFolderTree(self, folders):
+		"""监视模式下按有变化的文件夹更新已加载的树节点：加入新建的子文件夹，去掉已删除的"""
+		for folder in folders:
+			item = self._FindTreeItem(folder)
+			if item is None or not os.path.isdir(folder):
+				continue
+			subfolders = [entry for entry in self.dir_cache.list_subfolders(folder) if entry.path not in self.deleted_nodes]
+			if self.folder_tree.GetChildrenCount(item, False) == 0:
+				# 还没有展开过，展开时再加载
+				self.folder_tree.SetItemHasChildren(item, bool(subfolders))
+				continue
+			existing = {}
+			child, cookie = self.folder_tree.GetFirstChild(item)
+			while child.IsOk():
+				existing[self.folder_tree.GetItemData(child)] = child
+				child, cookie = self.folder_tree.GetNextChild(item, cookie)
+			current = {entry.path for entry in subfolders}
+			for path, child in existing.items():
+				if path not in current:
+					self.folder_tree.Delete(child)
+			for entry in subfolders:
+				if entry.path not in existing:
+					new_item = self.folder_tree.AppendItem(item, self._TreeLabel(entry.path), data=entry.path)
+					self.folder_tree.SetItemHasChildren(new_item, True)
+
+	def _FindTreeItem(self, folder_path):
+		"""从根节点逐层查找 folder_path 对应的已加载节点，没有加载时返回 None"""
+		item = self.folder_tree.GetRootItem()
+		if not item.IsOk():
+			return None
+		while self.folder_tree.GetItemData(item) != folder_path:
+			child, cookie = self.folder_tree.GetFirstChild(item)
+			while child.IsOk():
+				child_path = self.folder_tree.GetItemData(child)
+				if folder_path == child_path or folder_path.startswith(os.path.join(child_path, '')):
+					break
+				child, cookie = self.folder_tree.GetNextChild(item, cookie)
+			if not child.IsOk():
+				return None
+			item = child
+		return item
+
+	def OnImportExcluded(self, evt):
+		"""从文本文件导入排除的子文件夹，每行一个，相对路径以目标文件夹为基准"""
+		with wx.FileDialog(self, '导入排除列表', wildcard='文本文件 (*.txt)|*.txt|所有文件|*', style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as dlg:
+			if dlg.ShowModal() != wx.ID_OK:
+				return
+			try:
+				self.deleted_nodes.load(dlg.GetPath(), root=self.root_folder)
+			except (OSError, UnicodeDecodeError) as e:
+				wx.MessageBox(f'无法读取排除列表：{e}', '错误', wx.ICON_ERROR)
+				return
+		self._RemoveExcludedTreeNodes(self.folder_tree.GetRootItem())
+
+	def _RemoveExcludedTreeNodes(self, parent_item):
+		"""删除已加载的树节点中被排除的文件夹"""
+		stack = [parent_item]
+		while stack:
+			item, cookie = self.folder_tree.GetFirstChild(stack.pop())
+			excluded = []
+			while item.IsOk():
+				if self.folder_tree.GetItemData(item) in self.deleted_nodes:
+					excluded.append(item)
+				else:
+					stack.append(item)
+				item, cookie = self.folder_tree.GetNextChild(item, cookie)
+			for item in excluded:
+				self.folder_tree.Delete(item)
+
+	def OnSummarizeFolder(self, evt):
+		"""在后台按文件夹汇总选中节点（未选中时为根节点）的文件数和大小，标注在树节点上"""
+		item = self.folder_tree.GetSelection()
+		if not item.IsOk():
+			item = self.folder_tree.GetRootItem()
+		options = self._GetScanOptions()
+		if options is None:
+			return
+		# 文件夹树来自本机，汇总也在本机进行；只遍历选中的子树，层数过滤仍以目标文件夹为基准，与清单一致
+		worker = SummaryWorker(dirreport.report_options(options.replace(remote=())), self.folder_tree.GetItemData(item))
+		worker.start()
+		_WaitForWorker(self, worker, '统计文件夹大小')
+		if worker.error is not None:
+			wx.MessageBox(f'统计失败：{worker.error}', '错误', wx.ICON_ERROR)
+		elif not worker.IsCancelled():
+			self.folder_sizes.update(worker.summaries)
+			self._AnnotateTreeNodes(item)
+
+	def OnFindDuplicates(self, evt):
+		"""在选中的文件夹（未选中时为目标文件夹）中查找内容相同的文件，结果写入 csv"""
+		item = self.folder_tree.GetSelection()
+		if not item.IsOk():
+			item = self.folder_tree.GetRootItem()
+		options = self._GetScanOptions()
+		if options is None:
+			return
+		folder = self.folder_tree.GetItemData(item)
+		with wx.FileDialog(self, '保存重复文件报告', defaultFile=f'{os.path.basename(folder) or "root"}-重复文件', wildcard='CSV 文件 (*.csv)|*.csv', style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+			if dlg.ShowModal() != wx.ID_OK:
+				return
+			file_path = dlg.GetPath()
+
+		# 需要读取文件内容，总在本机扫描
+		worker = DuplicateWorker(options.replace(root=folder, show_size=True, show_modify=True, show_hash=False, remote=(), sort_key=None), file_path)
+		worker.start()
+		_WaitForWorker(self, worker, '查找重复文件')
+		if worker.error is not None:
+			wx.MessageBox(f'查找失败：{worker.error}', '错误', wx.ICON_ERROR)
+		elif not worker.IsCancelled():
+			wx.MessageBox(f'找到 {worker.count} 个重复文件，报告已保存到\n{file_path}', '提示')
+
+	def OnCompareSnapshots(self, evt):
+		"""选择先后两个快照，把新增、删除、大小变化和修改的文件写入 csv"""
+		wildcard = f'快照 (*.{snapshot.SNAPSHOT_EXT})|*.{snapshot.SNAPSHOT_EXT}'
+		paths = []
+		for title in ('选择较早的快照', '选择较新的快照'):
+			with wx.FileDialog(self, title, wildcard=wildcard, style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as dlg:
+				if dlg.ShowModal() != wx.ID_OK:
+					return
+				paths.append(dlg.GetPath())
+		with wx.FileDialog(self, '保存比较结果', defaultFile='快照比较', wildcard='CSV 文件 (*.csv)|*.csv', style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+			if dlg.ShowModal() != wx.ID_OK:
+				return
+			file_path = dlg.GetPath()
+
+		worker = DiffWorker(*paths, file_path)
+		worker.start()
+		_WaitForWorker(self, worker, '比较快照')
+		if worker.error is not None:
+			wx.MessageBox(f'比较失败：{worker.error}', '错误', wx.ICON_ERROR)
+		elif not worker.IsCancelled():
+			summary = '，'.join(f'{snapshot.CHANGE_TITLES[kind]} {count} 个' for kind, count in worker.counts.items())
+			wx.MessageBox(f'{summary}\n结果已保存到\n{file_path}', '提示')
+
+	def _AnnotateTreeNodes(self, parent_item):
+		"""按 folder_sizes 更新已加载的树节点的标题"""
+		stack = [parent_item]
+		while stack:
+			parent_item = stack.pop()
+			self.folder_tree.SetItemText(parent_item, self._TreeLabel(self.folder_tree.GetItemData(parent_item)))
+			item, cookie = self.folder_tree.GetFirstChild(parent_item)
+			while item.IsOk():
+				stack.append(item)
+				item, cookie = self.folder_tree.GetNextChild(item, cookie)
+
+	def _TreeLabel(self, folder_path):
+		label = os.path.basename(folder_path) or folder_path
+		summary = self.folder_sizes.get(folder_path)
+		if summary is not None:
+			label += f'  ({rowstore.format_size(summary.size)}，{summary.files} 个文件)'
+		return label
+
 	def _GenerateHeader(self):
 		header = ['文件名']
 		if self.checkbox_size.GetValue():
@@ -89,76 +307,54 @@ class FileListFrame(BaseUI.FileListBaseUIFrame):
 			header.append('修改时间')
 		if self.checkbox_access.GetValue():
 			header.append('访问时间')
+		if self.checkbox_hash.GetValue():
+			header.append('内容哈希')
 		return header
 
-	def GenerateFileList(self):
-		"""生成文件清单"""
-		root_file_before = self.rb_priority.GetSelection() == 0
-		show_only_root = self.rb_priority.GetSelection() == 2
-		file_format = self.rb_filename.GetSelection()
-		include_types = self.rb_file_type.GetSelection() == 0
-		type_filter = [t for t in re.split(r'[,; ]+', self.tc_file_type.GetValue().strip()) if t]
-		show_size = self.checkbox_size.GetValue()
-		show_create = self.checkbox_create.GetValue()
-		show_modify = self.checkbox_modify.GetValue()
-		show_access = self.checkbox_access.GetValue()
-
-		file_list = []
-
-		# 处理根目录文件
-		if show_only_root:
-			for file in os.listdir(self.root_folder):
-				file_path = os.path.join(self.root_folder, file)
-				if os.path.isfile(file_path):
-					file_info = self._GetFileInfo(file_path, file_format, show_size, show_create, show_modify, show_access)
-					if self._FilterFile(file_path, type_filter, include_types):
-						yield file_info
-			return
-
-		# 递归处理文件夹
-		for dirpath, dirnames, filenames in os.walk(self.root_folder, topdown=root_file_before):
-			if not root_file_before:
-				if any(dirpath.startswith(excluded) for excluded in self.deleted_nodes):
-					continue
-			else: #root_file_before is True
-				dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) not in self.deleted_nodes]
-
-			for file in filenames:
-				file_path = os.path.join(dirpath, file)
-				file_info = self._GetFileInfo(file_path, file_format, show_size, show_create, show_modify, show_access)
-				if self._FilterFile(file_path, type_filter, include_types):
-					yield file_info
-
-
-	def _GetFileInfo(self, file_path, file_format, show_size, show_create, show_modify, show_access):
-		"""根据用户选择获取文件信息"""
-		if file_format == 1:
-			display_name = os.path.relpath(file_path, self.root_folder)
-		elif file_format == 2:
-			display_name = file_path
-		else:
-			display_name = os.path.basename(file_path)
-
-		file_info = [display_name]
-		if show_size:
-			file_info.append(formatter.format_file_size(os.path.getsize(file_path)))
-		if show_create:
-			file_info.append(datetime.fromtimestamp(os.path.getctime(file_path)).strftime('%Y-%m-%d %H:%M:%S'))
-		if show_modify:
-			file_info.append(datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d %H:%M:%S'))
-		if show_access:
-			file_info.append(datetime.fromtimestamp(os.path.getatime(file_path)).strftime('%Y-%m-%d %H:%M:%S'))
-
-		return file_info
-
-	def _FilterFile(self, file_path, type_filter, include_types):
-		"""根据文件类型过滤"""
-		if not type_filter:
-			return True
-
-		file_ext = os.path.splitext(file_path)[1].lstrip('.')
-		match = file_ext in type_filter
-		return match if include_types else not match
+	def _GetScanOptions(self):
+		"""在界面线程读取控件设置，后台扫描只使用这份快照；过滤表达式或远程扫描端有误时提示并返回 None"""
+		try:
+			remote.parse_remotes(self.tc_remote.GetValue())
+		except ValueError as e:
+			wx.MessageBox(str(e), '提示')
+			return None
+		try:
+			return self._BuildScanOptions()
+		except ValueError as e:
+			wx.MessageBox(f'文件类型过滤表达式有误：{e}', '提示')
+			return None
+
+	def _BuildScanOptions(self):
+		use_index = self.checkbox_index.GetValue()
+		return scanner.ScanOptions(
+			self.root_folder,
+			priority=self.rb_priority.GetSelection(),
+			file_format=self.rb_filename.GetSelection(),
+			include_types=self.rb_file_type.GetSelection() == 0,
+			type_filter=filterexpr.split_terms(self.tc_file_type.GetValue()),
+			show_size=self.checkbox_size.GetValue(),
+			show_create=self.checkbox_create.GetValue(),
+			show_modify=self.checkbox_modify.GetValue(),
+			show_access=self.checkbox_access.GetValue(),
+			excluded=self.deleted_nodes,
+			workers=self.spin_workers.GetValue(),
+			index_path=scanindex.DEFAULT_INDEX_PATH if use_index else None,
+			show_hash=self.checkbox_hash.GetValue(),
+			hash_cache_path=hashing.DEFAULT_CACHE_PATH if use_index else None,
+			dir_cache=self.dir_cache,
+			remote=remote.parse_remotes(self.tc_remote.GetValue()),
+			sort_key=SORT_CHOICES[self.choice_sort.GetSelection()],
+			sort_reverse=self.checkbox_sort_desc.GetValue(),
+		)
+
+	def GenerateFileList(self, options=None, stats=None):
+		"""生成文件清单，产出 scanner.FileRecord，格式化留到显示或导出时再做"""
+		if options is None:
+			options = self._BuildScanOptions()
+		if stats is None:
+			stats = scanner.ScanStats()
+		self.scan_stats = stats
+		return scanner.scan_records(options, stats)
 
 	def OnFileTypeRb(self, evt):
 		selection = evt.GetSelection()
@@ -174,21 +370,58 @@ class FileListFrame(BaseUI.FileListBaseUIFrame):
 		else:
 			self.folder_tree.Enable()
 
-	def OnGenerateFilelistBtn(self, event):
+	def _CheckRootFolder(self):
 		if not self.root_folder:
 			if (path:=self.tc_folder_path.GetValue()) and os.path.exists(path):
 				self.root_folder = os.path.abspath(path)
 				self._LoadFolderTree()
 			else:
 				wx.MessageBox('请先选择一个文件夹', '提示')
-				return
+				return False
+		return True
+
+	def OnGenerateFilelistBtn(self, event):
+		if not self._CheckRootFolder():
+			return
 		header = self._GenerateHeader()
-		file_list = self.GenerateFileList()
-		dlg = ShowFilelistDialog(self, -1, file_list=list(file_list), root_folder=self.root_folder)
+		options = self._GetScanOptions()
+		if options is None:
+			return
+		dlg = ShowFilelistDialog(self, -1, file_list=rowstore.RowStore(options, keep_sorted=True), root_folder=self.root_folder)
 		dlg.DisplayFileList(header)#, file_list)
+		worker = ScanWorker(self.GenerateFileList, options, dlg)
+		dlg.StartScan(worker)
 		dlg.ShowModal()
+		worker.Cancel()
+		dlg.StopWatching()
 		dlg.Destroy()
 
+	def OnExportBtn(self, event):
+		"""不预览，扫描结果直接流式写入文件"""
+		if not self._CheckRootFolder():
+			return
+		options = self._GetScanOptions()
+		if options is None:
+			return
+		formats = EXPORT_FORMATS + [('快照', snapshot.SNAPSHOT_EXT)]
+		with wx.FileDialog(self, '直接导出文件清单', defaultFile=f'{os.path.basename(self.root_folder)}-文件清单', wildcard=_Wildcard(formats), style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+			if dlg.ShowModal() != wx.ID_OK:
+				return
+			file_path = dlg.GetPath()
+			ext = formats[dlg.GetFilterIndex()][1]
+
+		if ext == snapshot.SNAPSHOT_EXT:
+			# 快照按固定顺序保存，以后可以用“比较快照”找出变化
+			options = snapshot.snapshot_options(options)
+		worker = ExportWorker(options, file_path, ext)
+		worker.start()
+		_WaitForWorker(self, worker, '直接导出')
+
+		if worker.error is not None:
+			wx.MessageBox(f'导出失败：{worker.error}', '错误', wx.ICON_ERROR)
+		elif not worker.IsCancelled():
+			wx.MessageBox(f'已导出 {worker.count} 个文件到\n{file_path}', '提示')
+
 	def OnCloseBTN(self, evt):
 		self.Close()
 
@@ -199,8 +432,15 @@ class FileListDialog(BaseUI.FileListBaseUIDialog):
 		super().__init__(*args, **kwargs)
 		self.root_folder = None
 		self.folder_tree.Bind(wx.EVT_CONTEXT_MENU, self.OnTreeContextMenu)
+		self.folder_tree.Bind(wx.EVT_TREE_ITEM_EXPANDING, self.OnTreeItemExpanding)
 		self.MakeTreeContextMenu()
-		self.deleted_nodes = set()
+		# 文件夹树、生成清单和还原树共用同一份目录缓存，每个目录只从磁盘读取一次
+		self.dir_cache = dircache.DirCache()
+		self.tree_prefetcher = scanner.SubfolderPrefetcher(lister=self.dir_cache.list_subfolders)
+		self.tc_file_type.SetToolTip(filterexpr.SYNTAX_HELP)
+		self.deleted_nodes = PathTrie()
+		self.folder_sizes = {}
+		self.scan_stats = scanner.ScanStats()
 
 	def OnBrowseBtn(self, evt):
 		dlg = wx.DirDialog(self, '选择文件夹', '')
@@ -211,22 +451,31 @@ class FileListDialog(BaseUI.FileListBaseUIDialog):
 		dlg.Destroy()
 
 	def _LoadFolderTree(self):
-		"""目标文件夹内的所有子文件夹结构展示在 folder tree 中"""
+		"""目标文件夹内的子文件夹结构展示在 folder tree 中，子节点在展开时才加载"""
 		self.folder_tree.DeleteAllItems()
+		self.tree_prefetcher.reset()
+		self.deleted_nodes = PathTrie()
+		self.folder_sizes = {}
 		if not self.root_folder:
 			return
 
-		root = self.folder_tree.AddRoot(os.path.basename(self.root_folder))
+		root = self.folder_tree.AddRoot(self._TreeLabel(self.root_folder), data=self.root_folder)
 		self._AddTreeNodes(root, self.root_folder)
 		self.folder_tree.Expand(root)
-		self.deleted_nodes = set()
 
 	def _AddTreeNodes(self, parent_item, folder_path):
-		for item in os.listdir(folder_path):
-			item_path = os.path.join(folder_path, item)
-			if os.path.isdir(item_path):
-				new_item = self.folder_tree.AppendItem(parent_item, item)
-				self._AddTreeNodes(new_item, item_path)
+		"""只添加一层子文件夹，子节点先标记为可展开，并在后台预读下一层"""
+		subfolders = [entry for entry in self.tree_prefetcher.get(folder_path) if entry.path not in self.deleted_nodes]
+		for entry in subfolders:
+			new_item = self.folder_tree.AppendItem(parent_item, self._TreeLabel(entry.path), data=entry.path)
+			self.folder_tree.SetItemHasChildren(new_item, True)
+			self.tree_prefetcher.prefetch(entry.path)
+		self.folder_tree.SetItemHasChildren(parent_item, bool(subfolders))
+
+	def OnTreeItemExpanding(self, evt):
+		item = evt.GetItem()
+		if self.folder_tree.GetChildrenCount(item, False) == 0:
+			self._AddTreeNodes(item, self.folder_tree.GetItemData(item))
 
 	def OnTreeContextMenu(self, evt):
 		if self.root_folder is None:
@@ -239,8 +488,18 @@ class FileListDialog(BaseUI.FileListBaseUIDialog):
 		self.tree_menu = wx.Menu()
 		delete = self.tree_menu.Append(wx.ID_ANY, '删除(&D)')
 		restore = self.tree_menu.Append(wx.ID_ANY, '还原(&R)')
+		refresh = self.tree_menu.Append(wx.ID_ANY, '从磁盘刷新(&F)')
+		import_excluded = self.tree_menu.Append(wx.ID_ANY, '导入排除列表(&I)...')
+		summarize = self.tree_menu.Append(wx.ID_ANY, '统计文件夹大小(&S)')
+		duplicates = self.tree_menu.Append(wx.ID_ANY, '查找重复文件(&U)...')
+		compare = self.tree_menu.Append(wx.ID_ANY, '比较快照(&C)...')
 		self.Bind(wx.EVT_MENU, self.OnDeleteTreeNode, delete)
 		self.Bind(wx.EVT_MENU, self.OnRestoreTree, restore)
+		self.Bind(wx.EVT_MENU, self.OnRefreshTree, refresh)
+		self.Bind(wx.EVT_MENU, self.OnImportExcluded, import_excluded)
+		self.Bind(wx.EVT_MENU, self.OnSummarizeFolder, summarize)
+		self.Bind(wx.EVT_MENU, self.OnFindDuplicates, duplicates)
+		self.Bind(wx.EVT_MENU, self.OnCompareSnapshots, compare)
 
 	def OnDeleteTreeNode(self, evt):
 		# 删除当前选中的节点
@@ -250,19 +509,182 @@ class FileListDialog(BaseUI.FileListBaseUIDialog):
 			if root_item == item:
 				wx.MessageBox('不可以删除根节点', '提示')
 				return
-			# 获取绝对路径
-			path_parts = []
-			current = item
-			while current.IsOk() and current != root_item:
-				path_parts.insert(0, self.folder_tree.GetItemText(current))
-				current = self.folder_tree.GetItemParent(current)
-			absolute_path = os.path.join(self.root_folder, *path_parts)
-			self.deleted_nodes.add(absolute_path)
+			self.deleted_nodes.add(self.folder_tree.GetItemData(item))
 			self.folder_tree.Delete(item)
 
 	def OnRestoreTree(self, evt):
 		self._LoadFolderTree()
 
+	def OnRefreshTree(self, evt):
+		"""丢弃选中的文件夹（未选中时为目标文件夹）及其子文件夹的缓存，重新从磁盘读取，排除的文件夹保持不变"""
+		item = self.folder_tree.GetSelection()
+		if not item.IsOk():
+			item = self.folder_tree.GetRootItem()
+		if not item.IsOk():
+			return
+		folder = self.folder_tree.GetItemData(item)
+		self.dir_cache.invalidate(folder)
+		self.tree_prefetcher.reset()
+		prefix = os.path.join(folder, '')
+		self.folder_sizes = {path: summary for path, summary in self.folder_sizes.items() if path != folder and not path.startswith(prefix)}
+		expanded = self.folder_tree.IsExpanded(item)
+		self.folder_tree.DeleteChildren(item)
+		self.folder_tree.SetItemText(item, self._TreeLabel(folder))
+		self._AddTreeNodes(item, folder)
+		if expanded:
+			self.folder_tree.Expand(item)
+
+	def PatchFolderTree(self, folders):
+		"""监视模式下按有变化的文件夹更新已加载的树节点：加入新建的子文件夹，去掉已删除的"""
+		for folder in folders:
+			item = self._FindTreeItem(folder)
+			if item is None or not os.path.isdir(folder):
+				continue
+			subfolders = [entry for entry in self.dir_cache.list_subfolders(folder) if entry.path not in self.deleted_nodes]
+			if self.folder_tree.GetChildrenCount(item, False) == 0:
+				# 还没有展开过，展开时再加载
+				self.folder_tree.SetItemHasChildren(item, bool(subfolders))
+				continue
+			existing = {}
+			child, cookie = self.folder_tree.GetFirstChild(item)
+			while child.IsOk():
+				existing[self.folder_tree.GetItemData(child)] = child
+				child, cookie = self.folder_tree.GetNextChild(item, cookie)
+			current = {entry.path for entry in subfolders}
+			for path, child in existing.items():
+				if path not in current:
+					self.folder_tree.Delete(child)
+			for entry in subfolders:
+				if entry.path not in existing:
+					new_item = self.folder_tree.AppendItem(item, self._TreeLabel(entry.path), data=entry.path)
+					self.folder_tree.SetItemHasChildren(new_item, True)
+
+	def _FindTreeItem(self, folder_path):
+		"""从根节点逐层查找 folder_path 对应的已加载节点，没有加载时返回 None"""
+		item = self.folder_tree.GetRootItem()
+		if not item.IsOk():
+			return None
+		while self.folder_tree.GetItemData(item) != folder_path:
+			child, cookie = self.folder_tree.GetFirstChild(item)
+			while child.IsOk():
+				child_path = self.folder_tree.GetItemData(child)
+				if folder_path == child_path or folder_path.startswith(os.path.join(child_path, '')):
+					break
+				child, cookie = self.folder_tree.GetNextChild(item, cookie)
+			if not child.IsOk():
+				return None
+			item = child
+		return item
+
+	def OnImportExcluded(self, evt):
+		"""从文本文件导入排除的子文件夹，每行一个，相对路径以目标文件夹为基准"""
+		with wx.FileDialog(self, '导入排除列表', wildcard='文本文件 (*.txt)|*.txt|所有文件|*', style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as dlg:
+			if dlg.ShowModal() != wx.ID_OK:
+				return
+			try:
+				self.deleted_nodes.load(dlg.GetPath(), root=self.root_folder)
+			except (OSError, UnicodeDecodeError) as e:
+				wx.MessageBox(f'无法读取排除列表：{e}', '错误', wx.ICON_ERROR)
+				return
+		self._RemoveExcludedTreeNodes(self.folder_tree.GetRootItem())
+
+	def _RemoveExcludedTreeNodes(self, parent_item):
+		"""删除已加载的树节点中被排除的文件夹"""
+		stack = [parent_item]
+		while stack:
+			item, cookie = self.folder_tree.GetFirstChild(stack.pop())
+			excluded = []
+			while item.IsOk():
+				if self.folder_tree.GetItemData(item) in self.deleted_nodes:
+					excluded.append(item)
+				else:
+					stack.append(item)
+				item, cookie = self.folder_tree.GetNextChild(item, cookie)
+			for item in excluded:
+				self.folder_tree.Delete(item)
+
+	def OnSummarizeFolder(self, evt):
+		"""在后台按文件夹汇总选中节点（未选中时为根节点）的文件数和大小，标注在树节点上"""
+		item = self.folder_tree.GetSelection()
+		if not item.IsOk():
+			item = self.folder_tree.GetRootItem()
+		options = self._GetScanOptions()
+		if options is None:
+			return
+		# 文件夹树来自本机，汇总也在本机进行；只遍历选中的子树，层数过滤仍以目标文件夹为基准，与清单一致
+		worker = SummaryWorker(dirreport.report_options(options.replace(remote=())), self.folder_tree.GetItemData(item))
+		worker.start()
+		_WaitForWorker(self, worker, '统计文件夹大小')
+		if worker.error is not None:
+			wx.MessageBox(f'统计失败：{worker.error}', '错误', wx.ICON_ERROR)
+		elif not worker.IsCancelled():
+			self.folder_sizes.update(worker.summaries)
+			self._AnnotateTreeNodes(item)
+
+	def OnFindDuplicates(self, evt):
+		"""在选中的文件夹（未选中时为目标文件夹）中查找内容相同的文件，结果写入 csv"""
+		item = self.folder_tree.GetSelection()
+		if not item.IsOk():
+			item = self.folder_tree.GetRootItem()
+		options = self._GetScanOptions()
+		if options is None:
+			return
+		folder = self.folder_tree.GetItemData(item)
+		with wx.FileDialog(self, '保存重复文件报告', defaultFile=f'{os.path.basename(folder) or "root"}-重复文件', wildcard='CSV 文件 (*.csv)|*.csv', style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+			if dlg.ShowModal() != wx.ID_OK:
+				return
+			file_path = dlg.GetPath()
+
+		# 需要读取文件内容，总在本机扫描
+		worker = DuplicateWorker(options.replace(root=folder, show_size=True, show_modify=True, show_hash=False, remote=(), sort_key=None), file_path)
+		worker.start()
+		_WaitForWorker(self, worker, '查找重复文件')
+		if worker.error is not None:
+			wx.MessageBox(f'查找失败：{worker.error}', '错误', wx.ICON_ERROR)
+		elif not worker.IsCancelled():
+			wx.MessageBox(f'找到 {worker.count} 个重复文件，报告已保存到\n{file_path}', '提示')
+
+	def OnCompareSnapshots(self, evt):
+		"""选择先后两个快照，把新增、删除、大小变化和修改的文件写入 csv"""
+		wildcard = f'快照 (*.{snapshot.SNAPSHOT_EXT})|*.{snapshot.SNAPSHOT_EXT}'
+		paths = []
+		for title in ('选择较早的快照', '选择较新的快照'):
+			with wx.FileDialog(self, title, wildcard=wildcard, style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as dlg:
+				if dlg.ShowModal() != wx.ID_OK:
+					return
+				paths.append(dlg.GetPath())
+		with wx.FileDialog(self, '保存比较结果', defaultFile='快照比较', wildcard='CSV 文件 (*.csv)|*.csv', style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+			if dlg.ShowModal() != wx.ID_OK:
+				return
+			file_path = dlg.GetPath()
+
+		worker = DiffWorker(*paths, file_path)
+		worker.start()
+		_WaitForWorker(self, worker, '比较快照')
+		if worker.error is not None:
+			wx.MessageBox(f'比较失败：{worker.error}', '错误', wx.ICON_ERROR)
+		elif not worker.IsCancelled():
+			summary = '，'.join(f'{snapshot.CHANGE_TITLES[kind]} {count} 个' for kind, count in worker.counts.items())
+			wx.MessageBox(f'{summary}\n结果已保存到\n{file_path}', '提示')
+
+	def _AnnotateTreeNodes(self, parent_item):
+		"""按 folder_sizes 更新已加载的树节点的标题"""
+		stack = [parent_item]
+		while stack:
+			parent_item = stack.pop()
+			self.folder_tree.SetItemText(parent_item, self._TreeLabel(self.folder_tree.GetItemData(parent_item)))
+			item, cookie = self.folder_tree.GetFirstChild(parent_item)
+			while item.IsOk():
+				stack.append(item)
+				item, cookie = self.folder_tree.GetNextChild(item, cookie)
+
+	def _TreeLabel(self, folder_path):
+		label = os.path.basename(folder_path) or folder_path
+		summary = self.folder_sizes.get(folder_path)
+		if summary is not None:
+			label += f'  ({rowstore.format_size(summary.size)}，{summary.files} 个文件)'
+		return label
+
 	def _GenerateHeader(self):
 		header = ['文件名']
 		if self.checkbox_size.GetValue():
@@ -275,74 +697,37 @@ class FileListDialog(BaseUI.FileListBaseUIDialog):
 			header.append('访问时间')
 		return header
 
-	def GenerateFileList(self):
-		"""生成文件清单"""
-		root_file_before = self.rb_priority.GetSelection() == 0
-		show_only_root = self.rb_priority.GetSelection() == 2
-		file_format = self.rb_filename.GetSelection()
-		include_types = self.rb_file_type.GetSelection() == 0
-		type_filter = [t for t in re.split(r'[,; ]+', self.tc_file_type.GetValue().strip()) if t]
-		show_size = self.checkbox_size.GetValue()
-		show_create = self.checkbox_create.GetValue()
-		show_modify = self.checkbox_modify.GetValue()
-		show_access = self.checkbox_access.GetValue()
-
-		file_list = []
-
-		# 处理根目录文件
-		if show_only_root:
-			for file in os.listdir(self.root_folder):
-				file_path = os.path.join(self.root_folder, file)
-				if os.path.isfile(file_path):
-					file_info = self._GetFileInfo(file_path, file_format, show_size, show_create, show_modify, show_access)
-					if self._FilterFile(file_path, type_filter, include_types):
-						yield file_info
-			return
-
-		# 递归处理文件夹
-		for dirpath, dirnames, filenames in os.walk(self.root_folder, topdown=root_file_before):
-			if not root_file_before:
-				if any(dirpath.startswith(excluded) for excluded in self.deleted_nodes):
-					continue
-			else: #root_file_before is True
-				dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) not in self.deleted_nodes]
-
-			for file in filenames:
-				file_path = os.path.join(dirpath, file)
-				file_info = self._GetFileInfo(file_path, file_format, show_size, show_create, show_modify, show_access)
-				if self._FilterFile(file_path, type_filter, include_types):
-					yield file_info
-
-
-	def _GetFileInfo(self, file_path, file_format, show_size, show_create, show_modify, show_access):
-		"""根据用户选择获取文件信息"""
-		if file_format == 1:
-			display_name = os.path.relpath(file_path, self.root_folder)
-		elif file_format == 2:
-			display_name = file_path
-		else:
-			display_name = os.path.basename(file_path)
-
-		file_info = [display_name]
-		if show_size:
-			file_info.append(formatter.format_file_size(os.path.getsize(file_path)))
-		if show_create:
-			file_info.append(datetime.fromtimestamp(os.path.getctime(file_path)).strftime('%Y-%m-%d %H:%M:%S'))
-		if show_modify:
-			file_info.append(datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d %H:%M:%S'))
-		if show_access:
-			file_info.append(datetime.fromtimestamp(os.path.getatime(file_path)).strftime('%Y-%m-%d %H:%M:%S'))
-
-		return file_info
-
-	def _FilterFile(self, file_path, type_filter, include_types):
-		"""根据文件类型过滤"""
-		if not type_filter:
-			return True
-
-		file_ext = os.path.splitext(file_path)[1].lstrip('.')
-		match = file_ext in type_filter
-		return match if include_types else not match
+	def _GetScanOptions(self):
+		"""在界面线程读取控件设置，后台扫描只使用这份快照；过滤表达式有误时提示并返回 None"""
+		try:
+			return self._BuildScanOptions()
+		except ValueError as e:
+			wx.MessageBox(f'文件类型过滤表达式有误：{e}', '提示')
+			return None
+
+	def _BuildScanOptions(self):
+		return scanner.ScanOptions(
+			self.root_folder,
+			priority=self.rb_priority.GetSelection(),
+			file_format=self.rb_filename.GetSelection(),
+			include_types=self.rb_file_type.GetSelection() == 0,
+			type_filter=filterexpr.split_terms(self.tc_file_type.GetValue()),
+			show_size=self.checkbox_size.GetValue(),
+			show_create=self.checkbox_create.GetValue(),
+			show_modify=self.checkbox_modify.GetValue(),
+			show_access=self.checkbox_access.GetValue(),
+			excluded=self.deleted_nodes,
+			dir_cache=self.dir_cache,
+		)
+
+	def GenerateFileList(self, options=None, stats=None):
+		"""生成文件清单，产出 scanner.FileRecord，格式化留到显示或导出时再做"""
+		if options is None:
+			options = self._BuildScanOptions()
+		if stats is None:
+			stats = scanner.ScanStats()
+		self.scan_stats = stats
+		return scanner.scan_records(options, stats)
 
 	def OnFileTypeRb(self, evt):
 		selection = evt.GetSelection()
@@ -358,48 +743,407 @@ class FileListDialog(BaseUI.FileListBaseUIDialog):
 		else:
 			self.folder_tree.Enable()
 
-	def OnGenerateFilelistBtn(self, event):
+	def _CheckRootFolder(self):
 		if not self.root_folder:
 			if (path:=self.tc_folder_path.GetValue()) and os.path.exists(path):
 				self.root_folder = os.path.abspath(path)
 				self._LoadFolderTree()
 			else:
 				wx.MessageBox('请先选择一个文件夹', '提示')
-				return
+				return False
+		return True
+
+	def OnGenerateFilelistBtn(self, event):
+		if not self._CheckRootFolder():
+			return
 		header = self._GenerateHeader()
-		file_list = self.GenerateFileList()
-		dlg = ShowFilelistDialog(self, -1, file_list=list(file_list), root_folder=self.root_folder)
+		options = self._GetScanOptions()
+		if options is None:
+			return
+		dlg = ShowFilelistDialog(self, -1, file_list=rowstore.RowStore(options, keep_sorted=True), root_folder=self.root_folder)
 		dlg.DisplayFileList(header)#, file_list)
+		worker = ScanWorker(self.GenerateFileList, options, dlg)
+		dlg.StartScan(worker)
 		dlg.ShowModal()
+		worker.Cancel()
+		dlg.StopWatching()
 		dlg.Destroy()
 
 
+class ScanWorker(threading.Thread):
+	"""后台扫描线程，FileRecord 分批通过 wx.CallAfter 送回 ShowFilelistDialog"""
+	def __init__(self, generate, options, dialog, batch_size=2000, interval=0.25):
+		super().__init__(daemon=True)
+		self.generate = generate
+		self.options = options
+		self.dialog = dialog
+		self.batch_size = batch_size
+		self.interval = interval
+		self.stats = scanner.ScanStats(self._OnDir)
+		self.error = None
+		self._cancel = threading.Event()
+		self._last_post = time.monotonic()
+
+	def Cancel(self):
+		self._cancel.set()
+
+	def IsCancelled(self):
+		return self._cancel.is_set()
+
+	def _OnDir(self, stats):
+		# 每读完一个目录调用一次：长时间没有记录产出（过滤条件很严、排序时）也能取消和更新进度
+		if self._cancel.is_set():
+			raise scanner.ScanCancelled
+		now = time.monotonic()
+		if now - self._last_post >= self.interval:
+			self._Post('AppendRows', [])
+			self._last_post = now
+
+	def run(self):
+		batch = []
+		self._last_post = time.monotonic()
+		records = self.generate(self.options, self.stats)
+		try:
+			for record in records:
+				if self._cancel.is_set():
+					break
+				batch.append(record)
+				now = time.monotonic()
+				if len(batch) >= self.batch_size or now - self._last_post >= self.interval:
+					self._Post('AppendRows', batch)
+					batch = []
+					self._last_post = now
+		except scanner.ScanCancelled:
+			pass
+		except Exception as e:
+			# 远程扫描端断开或扫描出错，已收到的部分照常显示
+			self.error = e
+		finally:
+			records.close()
+			# 无论是否出错都要通知界面，否则对话框一直停在扫描中
+			self._Post('OnScanFinished', batch)
+
+	def _Post(self, method, rows):
+		wx.CallAfter(self._Deliver, self.dialog, method, rows, self.stats)
+
+	@staticmethod
+	def _Deliver(dialog, method, rows, stats):
+		# 对话框可能已经关闭
+		if dialog:
+			getattr(dialog, method)(rows, stats)
+
+
+class ExportWorker(threading.Thread):
+	"""后台直接导出线程，扫描结果不经过界面，按块写入文件"""
+	def __init__(self, options, file_path, ext):
+		super().__init__(daemon=True)
+		self.options = options
+		self.file_path = file_path
+		self.ext = ext
+		self.top = None
+		self.stats = scanner.ScanStats(self._CheckCancel)
+		self.count = 0
+		self.error = None
+		self._cancel = threading.Event()
+
+	def Cancel(self):
+		self._cancel.set()
+
+	def IsCancelled(self):
+		return self._cancel.is_set()
+
+	def _CheckCancel(self, stats):
+		if self._cancel.is_set():
+			raise scanner.ScanCancelled
+
+	def _Records(self):
+		for record in scanner.scan_records(self.options, self.stats, self.top):
+			if self._cancel.is_set():
+				return
+			yield record
+
+	def run(self):
+		try:
+			self.count = exporter.write_records(self._Records(), self.file_path, self.ext, self.options)
+		except scanner.ScanCancelled:
+			pass
+		except Exception as e:
+			# 包括可选的 pyarrow/zstandard 等抛出的其他异常，都交给界面显示
+			self.error = e
+
+
+class DuplicateWorker(ExportWorker):
+	"""后台查找重复文件并写出报告"""
+	def __init__(self, options, file_path):
+		super().__init__(options, file_path, 'csv')
+
+	def run(self):
+		try:
+			self.count = exporter.write_duplicates(self._Records(), self.file_path, self.ext, self.options)
+		except scanner.ScanCancelled:
+			pass
+		except Exception as e:
+			self.error = e
+
+
+class DiffWorker(ExportWorker):
+	"""后台比较两个快照，stats.files 记录两个快照中已读取的文件数"""
+	def __init__(self, old_path, new_path, file_path):
+		super().__init__(None, file_path, 'csv')
+		self.old_path = old_path
+		self.new_path = new_path
+		self.counts = {}
+
+	def _Entries(self, snapshot_path):
+		for entry in snapshot.read_snapshot(snapshot_path):
+			if self._cancel.is_set():
+				return
+			self.stats.files += 1
+			yield entry
+
+	def run(self):
+		try:
+			snapshot.read_meta(self.old_path)
+			snapshot.read_meta(self.new_path)
+			changes = snapshot.diff(self._Entries(self.old_path), self._Entries(self.new_path))
+			self.counts = exporter.write_diff(changes, self.file_path, self.ext)
+		except Exception as e:
+			self.error = e
+
+
+class SummaryWorker(ExportWorker):
+	"""后台按文件夹汇总 top（缺省为 options.root）的子树，只保留 top 以下前 ANNOTATE_DEPTH 层的结果用于标注文件夹树"""
+	ANNOTATE_DEPTH = 3
+
+	def __init__(self, options, top=None):
+		super().__init__(options, None, None)
+		self.top = top
+		self.summaries = {}
+
+	def run(self):
+		try:
+			for summary in dirreport.summarize(self._Records(), self.top or self.options.root):
+				if summary.depth <= self.ANNOTATE_DEPTH:
+					self.summaries[summary.path] = summary
+		except scanner.ScanCancelled:
+			pass
+		except Exception as e:
+			self.error = e
+
+
+class CopyWorker(threading.Thread):
+	"""后台把要复制的行按块格式化、拼接为文本，界面只等待结果，可以取消
+
+	rows 为行号列表时只复制这些行（列表中选中的行），为 None 时复制前 limit 行，limit 为 None 时复制全部。
+	"""
+	def __init__(self, file_list, rows=None, limit=None):
+		super().__init__(daemon=True)
+		self.file_list = file_list
+		self.rows = rows
+		self.total = len(rows) if rows is not None else min(len(file_list), limit if limit is not None else len(file_list))
+		self.done = 0
+		self.text = None
+		self._cancel = threading.Event()
+
+	def Cancel(self):
+		self._cancel.set()
+
+	def IsCancelled(self):
+		return self._cancel.is_set()
+
+	def run(self):
+		buffer = io.StringIO()
+		for start in range(0, self.total, rowstore.ROW_BLOCK):
+			if self._cancel.is_set():
+				return
+			stop = min(start + rowstore.ROW_BLOCK, self.total)
+			if self.rows is None:
+				buffer.write(self.file_list.text_block(start, stop))
+			else:
+				buffer.write(''.join(','.join(self.file_list.row(index)) + '\n' for index in self.rows[start:stop]))
+			self.done = stop
+		self.text = buffer.getvalue()
+
+
+def _WaitForWorker(parent, worker, title):
+	"""显示可取消的进度对话框，直到后台线程结束"""
+	progress = wx.ProgressDialog(title, '正在扫描…', parent=parent, style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+	while worker.is_alive():
+		worker.join(0.2)
+		stats = worker.stats
+		keep_going, _ = progress.Pulse(f'已扫描 {stats.dirs} 个文件夹、{stats.files} 个文件，{stats.files_per_sec():.0f} 个/秒')
+		if not keep_going:
+			worker.Cancel()
+	progress.Destroy()
+
+
 class ShowFilelistDialog(BaseUI.ShowFileListDialog):
-	def __init__(self, *args, file_list = [], root_folder='', **kwargs):
+	def __init__(self, *args, file_list=None, root_folder='', scan_stats=None, **kwargs):
 		super().__init__(*args, **kwargs)
+		if file_list is None:
+			file_list = rowstore.RowStore(scanner.ScanOptions(root_folder))
 		self.file_list = file_list
-		self.SetTitle(f'文件清单 - 共{len(self.file_list)}个文件')
 		self.root_folder = root_folder
 		self.header = ['文件名']
+		self.worker = None
+		self.watcher = None
+		self._UpdateTitle(scan_stats)
+
+	def _UpdateTitle(self, scan_stats=None):
+		title = f'文件清单 - 共{len(self.file_list)}个文件'
+		if 'size' in self.file_list.columns:
+			title += f'，合计 {rowstore.format_size(self.file_list.total_size())}'
+		if scan_stats is not None and scan_stats.stats_saved:
+			title += f'（预筛选省去 {scan_stats.stats_saved} 次 stat）'
+		self.SetTitle(title)
 
 	def DisplayFileList(self, header):#, file_list):
-		"""在文本框中显示文件清单"""
-		# self.file_list = list(file_list)
+		"""在虚拟列表中显示文件清单，列表直接读取 RowStore，只格式化可见的行"""
 		self.header = header
-		self.text_ctrl_1.SetValue('')
-
-		rows = [','.join(row) for row in self.file_list]
-		self.text_ctrl_1.SetValue('\n'.join([','.join(header)] + rows))
+		self.list_view.SetSource(header, self.file_list, limit=PREVIEW_ROWS)
+
+	def StartScan(self, worker):
+		"""启动后台扫描，结果到达时逐批追加显示"""
+		self.worker = worker
+		self.btn_cancel.Enable()
+		for btn in (self.btn_copy, self.btn_txt, self.btn_csv, self.checkbox_watch):
+			btn.Disable()
+		self.SetTitle('文件清单 - 正在扫描…')
+		worker.start()
+
+	def AppendRows(self, rows, stats):
+		if rows:
+			self.file_list.extend(rows)
+			self.list_view.RefreshRows()
+		self._ShowProgress(stats)
+
+	def OnScanFinished(self, rows, stats):
+		self.AppendRows(rows, stats)
+		self.btn_cancel.Disable()
+		for btn in (self.btn_copy, self.btn_txt, self.btn_csv, self.checkbox_watch):
+			btn.Enable()
+		self._UpdateTitle(stats)
+		if self.worker is None:
+			return
+		if self.worker.options.remote:
+			# 远程扫描的路径在扫描端的机器上，本机无法监视
+			self.checkbox_watch.Disable()
+		if self.worker.error is not None:
+			self.label_progress.SetLabel(self.label_progress.GetLabel() + f'（扫描出错：{self.worker.error}）')
+		elif self.worker.IsCancelled():
+			self.label_progress.SetLabel(self.label_progress.GetLabel() + '（已取消）')
+
+	def _ShowProgress(self, stats):
+		self.label_progress.SetLabel(
+			f'已扫描 {stats.dirs} 个文件夹、{stats.files} 个文件，'
+			f'{stats.files_per_sec():.0f} 个/秒，用时 {stats.elapsed():.1f} 秒')
+
+	def OnCancelBtn(self, event):
+		if self.worker is not None:
+			self.worker.Cancel()
+
+	def OnWatchCheckbox(self, event):
+		if event.IsChecked():
+			self.StartWatching()
+		else:
+			self.StopWatching()
+			self.label_progress.SetLabel('已停止监视')
+
+	def StartWatching(self, factory=watcher.create_watcher):
+		"""监视目标文件夹，有变化的文件夹在监视线程中合并后交给 ApplyFolderChanges"""
+		self.StopWatching()
+		options = self.worker.options
+		cache = options.dir_cache
+		self.watcher = factory(
+			options.root,
+			lambda folders: wx.CallAfter(self._DeliverWatch, self, 'ApplyFolderChanges', folders),
+			skip=options.excluded.covers if options.excluded else None,
+			recursive=options.priority != 2,
+			lister=cache.list_subfolders if cache is not None else scanner.list_subfolders,
+			on_error=lambda error: wx.CallAfter(self._DeliverWatch, self, 'OnWatchError', error),
+		)
+		self.watcher.start()
+		mode = '轮询' if isinstance(self.watcher, watcher.PollingWatcher) else 'inotify'
+		self.label_progress.SetLabel(f'正在监视 {options.root} 的变化（{mode}）')
+
+	def StopWatching(self):
+		if self.watcher is not None:
+			self.watcher.stop()
+			self.watcher = None
+
+	@staticmethod
+	def _DeliverWatch(dialog, method, arg):
+		# 对话框可能已经关闭
+		if dialog:
+			getattr(dialog, method)(arg)
+
+	def ApplyFolderChanges(self, folders):
+		"""重新读取有变化的文件夹，替换清单中这些文件夹的行，再更新文件夹树"""
+		if self.watcher is None:
+			return
+		removed, added = self.file_list.replace_folders(scanner.rescan_folders(self.worker.options, folders))
+		self.list_view.ResetRows()
+		self._UpdateTitle()
+		self.label_progress.SetLabel(f'{time.strftime("%H:%M:%S")} 更新了 {len(folders)} 个文件夹，文件数 {added - removed:+d}')
+		parent = self.GetParent()
+		if hasattr(parent, 'PatchFolderTree'):
+			parent.PatchFolderTree(folders)
+
+	def OnWatchError(self, error):
+		if self.watcher is None or self.watcher.error is not error:
+			return
+		if isinstance(self.watcher, watcher.InotifyWatcher):
+			# 例如 inotify watch 数量超过系统上限，改为轮询
+			self.StartWatching(watcher.PollingWatcher)
+			return
+		self.StopWatching()
+		self.checkbox_watch.SetValue(False)
+		self.label_progress.SetLabel(f'监视已停止：{error}')
 
 	def OnCopyBtn(self, event):
+		"""列表中有选中的行时只复制选中的行，否则复制全部；文本较大时先提醒，在后台拼接"""
 		if not self.file_list:
 			return
-		# data = '\n'.join([','.join(map(str, row)) for row in self.file_list])
-		data = '\n'.join([','.join(row) for row in self.file_list])
+		selected = self.list_view.GetSelectedRows()
+		if selected:
+			worker = CopyWorker(self.file_list, rows=selected)
+		else:
+			limit = None
+			estimate = self.file_list.estimate_text_size()
+			if estimate > COPY_WARN_SIZE:
+				count = len(self.file_list)
+				dlg = wx.MessageDialog(self,
+					f'清单共 {count} 行，复制到剪贴板的文本预计约 {rowstore.format_size(estimate)}，'
+					f'会占用较多内存，其他程序粘贴时也可能很慢。\n\n数据较多时建议使用“保存为 csv”。',
+					'复制到剪贴板', wx.YES_NO | wx.CANCEL | wx.ICON_WARNING)
+				dlg.SetYesNoCancelLabels(f'只复制前 {min(count, PREVIEW_ROWS)} 行', '全部复制', '取消')
+				answer = dlg.ShowModal()
+				dlg.Destroy()
+				if answer == wx.ID_CANCEL:
+					return
+				if answer == wx.ID_YES:
+					limit = PREVIEW_ROWS
+			worker = CopyWorker(self.file_list, limit=limit)
+		worker.start()
+		progress = None
+		while worker.is_alive():
+			worker.join(0.2)
+			if worker.is_alive() and progress is None:
+				progress = wx.ProgressDialog('复制到剪贴板', '正在生成文本…', maximum=max(worker.total, 1), parent=self,
+					style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
+			if progress is not None:
+				keep_going, _ = progress.Update(min(worker.done, worker.total), f'已处理 {worker.done} / {worker.total} 行')
+				if not keep_going:
+					worker.Cancel()
+		if progress is not None:
+			progress.Destroy()
+		if worker.text is None:
+			return
 		if wx.TheClipboard.Open() or wx.TheClipboard.IsOpened():
-			wx.TheClipboard.SetData(wx.TextDataObject(data))
+			wx.TheClipboard.SetData(wx.TextDataObject(worker.text))
 			wx.TheClipboard.Flush()
 			wx.TheClipboard.Close()
+		self.label_progress.SetLabel(f'已复制 {worker.total} 行到剪贴板')
 
 	def OnSaveTxtBtn(self, event):
 		self._SaveFile('txt')
@@ -408,19 +1152,20 @@ class ShowFilelistDialog(BaseUI.ShowFileListDialog):
 		self._SaveFile('csv')
 
 	def _SaveFile(self, ext):
+		"""txt 只保存为文本文件，csv 按钮还可以选择压缩和列式格式"""
 		if not self.file_list:
 			return
 
-		with wx.FileDialog(self, f"保存为{ext.upper()}文件", defaultFile=f'{os.path.basename(self.root_folder)}-文件清单', wildcard=f"*.{ext}", style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
-			if dlg.ShowModal() == wx.ID_OK:
-				file_path = dlg.GetPath()
-				with open(file_path, 'w', newline='', encoding='utf-8') as file:
-					writer = csv.writer(file) if ext == 'csv' else file.write
-					if ext == 'csv':
-						writer.writerow(self.header)#['文件名', '大小', '创建时间', '修改时间'])
-						writer.writerows(self.file_list)
-					else:
-						file.write('\n'.join([','.join(row) for row in self.file_list]))
+		formats = [fmt for fmt in EXPORT_FORMATS if fmt[1] != 'txt'] if ext == 'csv' else [('文本文件', 'txt')]
+		with wx.FileDialog(self, f"保存为{ext.upper()}文件", defaultFile=f'{os.path.basename(self.root_folder)}-文件清单', wildcard=_Wildcard(formats), style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+			if dlg.ShowModal() != wx.ID_OK:
+				return
+			file_path = dlg.GetPath()
+			ext = formats[dlg.GetFilterIndex()][1]
+		try:
+			exporter.write_store(self.file_list, file_path, ext)
+		except (OSError, ValueError) as e:
+			wx.MessageBox(f'保存失败：{e}', '错误', wx.ICON_ERROR)
 
 
 class MyApp(wx.App):
@@ -0,0 +1,258 @@
+"""批量生成多个文件夹的文件清单
+
+按清单文件（JSON）列出的多个目标文件夹，在进程池中并行扫描和导出，每个文件夹可以有自己的过滤、排除和属性列设置。
+较大的文件夹按一级子文件夹拆成多个分片，分片分别写入临时文件，再按原来的顺序拼接，结果与单独扫描时相同。
+每个进程有自己的解释器，stat 较多的扫描之间不会争用 GIL。
+
+	python batch.py nightly.json                         每个文件夹一个输出文件
+	python batch.py nightly.json --merge -o all.csv.gz   合并为一个文件
+	python batch.py nightly.json --merge -o - -f jsonl   合并输出到标准输出
+
+清单文件示例：
+	{
+		"output": "inventory/{label}.csv.gz",
+		"workers": 8,
+		"defaults": {"columns": "size,mtime", "time_format": "iso", "name": "absolute"},
+		"roots": [
+			{"label": "share1", "root": "/mnt/share1", "include": "pdf docx", "skip": ["tmp", "cache"]},
+			{"label": "projects", "root": "/srv/projects", "exclude": "*.tmp size<1K", "split": false}
+		]
+	}
+每个文件夹的设置与 filelist_cli.py 的参数对应：order、name、include、exclude、columns、time_format、
+skip（列表）、skip_from、jobs、index、hash_cache、sort、reverse、raw；defaults 中的设置对所有文件夹生效。
+label 缺省为文件夹名，output 可以为单个文件夹单独指定，split 为 false 时不拆分。
+合并输出时各文件夹的属性列必须相同，文件名建议使用 absolute，以便区分来自哪个文件夹。
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import exporter
+import filelist_cli
+import rowstore
+import scanner
+import snapshot
+
+
+# 每个文件夹最多拆成 进程数 * SHARDS_PER_WORKER 个分片，一级子文件夹更多时相邻的几个合为一片
+SHARDS_PER_WORKER = 4
+_ENTRY_OPTIONS = {
+	'order': '--order', 'name': '--name', 'include': '--include', 'exclude': '--exclude', 'columns': '--columns',
+	'time_format': '--time-format', 'skip_from': '--skip-from', 'jobs': '--jobs', 'index': '--index', 'hash_cache': '--hash-cache',
+	'sort': '--sort',
+}
+_ENTRY_KEYS = set(_ENTRY_OPTIONS) | {'label', 'root', 'output', 'format', 'skip', 'raw', 'split', 'reverse'}
+
+BatchRoot = namedtuple('BatchRoot', 'label root argv options output ext raw split')
+RootResult = namedtuple('RootResult', 'label output files dirs shards error')
+
+
+def _option_value(value):
+	if isinstance(value, (list, tuple)):
+		return ' '.join(f'"{item}"' if ' ' in str(item) else str(item) for item in value)
+	return str(value)
+
+
+def _entry_argv(entry):
+	"""把清单中一个文件夹的设置转换为 filelist_cli 的命令行参数"""
+	argv = [entry['root'], '-o', '-']
+	for key, option in _ENTRY_OPTIONS.items():
+		value = entry.get(key)
+		if value is None:
+			continue
+		if key == 'columns' and isinstance(value, (list, tuple)):
+			value = ','.join(value)
+		argv += [option, _option_value(value)]
+	for path in entry.get('skip') or ():
+		argv += ['--skip', path]
+	if entry.get('reverse'):
+		argv.append('--reverse')
+	return argv
+
+
+def load_manifest(manifest, output=None, ext=None, merge=None):
+	"""检查清单并为每个文件夹生成 BatchRoot，返回 (BatchRoot 列表, 是否合并, 合并输出的文件)；有误时抛出 ValueError"""
+	merge = manifest.get('merge', False) if merge is None else merge
+	output = output or manifest.get('output')
+	ext = ext or manifest.get('format')
+	if not output:
+		raise ValueError('清单中没有指定 output，也没有使用 -o')
+	defaults = manifest.get('defaults', {})
+	entries = manifest.get('roots') or []
+	if not entries:
+		raise ValueError('清单中没有 roots')
+
+	parser = filelist_cli.build_parser()
+	roots = []
+	labels = set()
+	for entry in entries:
+		entry = dict(defaults, **entry)
+		unknown = set(entry) - _ENTRY_KEYS
+		if unknown:
+			raise ValueError(f'清单中有未知的设置: {",".join(sorted(unknown))}')
+		if not entry.get('root'):
+			raise ValueError('清单中的每一项都需要 root')
+		if not os.path.isdir(entry['root']):
+			raise ValueError(f'文件夹不存在: {entry["root"]}')
+		label = entry.get('label') or os.path.basename(os.path.normpath(entry['root'])) or entry['root']
+		if label in labels:
+			raise ValueError(f'label 重复: {label}')
+		labels.add(label)
+		argv = _entry_argv(entry)
+		try:
+			args = parser.parse_args(argv)
+		except SystemExit:
+			raise ValueError(f'{label} 的设置有误') from None
+		options = filelist_cli.options_from_args(args)
+		root_output = output if merge else entry.get('output') or output.replace('{label}', label)
+		root_ext = ext or entry.get('format') or exporter.detect_format(root_output)
+		if root_ext == snapshot.SNAPSHOT_EXT or root_ext not in exporter.FORMATS:
+			raise ValueError(f'批量任务不支持的格式: {root_ext}')
+		roots.append(BatchRoot(label, options.root, argv, options, root_output, root_ext, bool(entry.get('raw')), entry.get('split', True)))
+
+	if merge:
+		layouts = {(tuple(rowstore.RowStore(root.options).columns), root.raw, root.ext) for root in roots}
+		if len(layouts) > 1:
+			raise ValueError('合并输出时各文件夹的属性列、raw 和格式必须相同')
+	elif len({root.output for root in roots}) < len(roots):
+		raise ValueError('多个文件夹写入同一个文件，output 中应包含 {label}，或使用 --merge')
+	return roots, merge, output
+
+
+def plan_shards(root, workers):
+	"""按一级子文件夹拆分，返回 [(argv, 遍历起点列表或 None)]，顺序与整体扫描的输出顺序相同
+
+	使用增量索引或哈希缓存时不拆分，这两个文件不能由多个进程同时写入；排序时也不拆分，分片各自有序不等于整体有序。
+	"""
+	options = root.options
+	if (not root.split or options.priority == 2 or options.file_filter.max_depth == 0
+			or options.index_path or options.hash_cache_path or options.sort_key):
+		return [(root.argv, None)]
+	skip = options.excluded.covers if options.excluded else None
+	tops = [entry.path for entry in scanner.list_subfolders(root.root)
+		if not entry.is_symlink() and not (skip and skip(entry.path))]
+	if not tops:
+		return [(root.argv, None)]
+	size = math.ceil(len(tops) / max(1, workers * SHARDS_PER_WORKER))
+	shards = [(root.argv, tops[i:i + size]) for i in range(0, len(tops), size)]
+	# 根目录本身的文件单独一片，按 order 放在子文件夹之前或之后
+	root_files = (root.argv + ['--order', 'root-only'], None)
+	return [root_files] + shards if options.priority == 0 else shards + [root_files]
+
+
+def run_shard(argv, tops, part_path, ext, raw, write_header):
+	"""在工作进程中扫描一个分片并写入 part_path，返回 (行数, 文件夹数)"""
+	options = filelist_cli.options_from_args(filelist_cli.build_parser().parse_args(argv))
+	stats = scanner.ScanStats()
+	if tops is None:
+		records = scanner.scan_records(options, stats)
+	else:
+		records = chain.from_iterable(scanner.scan_records(options, stats, top) for top in tops)
+	count = exporter.write_records(records, part_path, ext, options, raw=raw, write_header=write_header)
+	return count, stats.dirs
+
+
+def run_batch(roots, merge=False, output=None, workers=None, temp_dir=None, log=None):
+	"""在进程池中扫描全部分片，按顺序拼接输出，产出每个文件夹的 RootResult
+
+	合并输出时任一分片出错即停止并抛出异常；分别输出时出错的文件夹不留下不完整的文件，其余照常完成。
+	"""
+	workers = workers or os.cpu_count() or 1
+	with tempfile.TemporaryDirectory(prefix='filelister-batch-', dir=temp_dir) as tmp, ProcessPoolExecutor(workers) as pool:
+		planned = []
+		for root_index, root in enumerate(roots):
+			futures = []
+			for shard_index, (argv, tops) in enumerate(plan_shards(root, workers)):
+				part_path = os.path.join(tmp, f'{root_index:04d}-{shard_index:05d}.part')
+				# csv 只有输出文件中的第一个分片写表头
+				write_header = shard_index == 0 and (root_index == 0 or not merge)
+				futures.append((part_path, pool.submit(run_shard, argv, tops, part_path, root.ext, root.raw, write_header)))
+			planned.append(futures)
+
+		joiner = exporter.PartJoiner(output, roots[0].ext) if merge else None
+		try:
+			for root, futures in zip(roots, planned):
+				if not merge:
+					joiner = exporter.PartJoiner(root.output, root.ext)
+				files = dirs = 0
+				try:
+					with joiner if not merge else nullcontext():
+						for part_path, future in futures:
+							count, shard_dirs = future.result()
+							joiner.append(part_path, count)
+							os.remove(part_path)
+							files += count
+							dirs += shard_dirs
+				except (OSError, ValueError) as e:
+					if merge:
+						raise
+					for _, future in futures:
+						future.cancel()
+					if root.output != '-' and os.path.exists(root.output):
+						os.remove(root.output)
+					yield RootResult(root.label, root.output, files, dirs, len(futures), e)
+					continue
+				if log is not None:
+					print(f'{root.label}: {files} 个文件，{dirs} 个文件夹，{len(futures)} 个分片', file=log)
+				yield RootResult(root.label, root.output, files, dirs, len(futures), None)
+		except BaseException:
+			for futures in planned:
+				for _, future in futures:
+					future.cancel()
+			raise
+		finally:
+			if merge:
+				joiner.close()
+
+
+def build_parser():
+	parser = argparse.ArgumentParser(description='按清单文件批量生成多个文件夹的文件清单')
+	parser.add_argument('manifest', help='清单文件（JSON）')
+	parser.add_argument('-o', '--output', help='覆盖清单中的 output；分别输出时应包含 {label}')
+	parser.add_argument('-f', '--format', choices=exporter.FORMATS, metavar='FORMAT', help='输出格式，缺省按输出文件后缀判断')
+	parser.add_argument('--merge', action='store_true', default=None, help='把所有文件夹合并为一个输出')
+	parser.add_argument('-w', '--workers', type=int, help='进程数，缺省为清单中的 workers 或 CPU 核数')
+	parser.add_argument('--temp-dir', help='分片临时文件所在的文件夹，缺省为系统临时文件夹')
+	parser.add_argument('-q', '--quiet', action='store_true', help='不输出统计信息')
+	return parser
+
+
+def main(argv=None):
+	parser = build_parser()
+	args = parser.parse_args(argv)
+	try:
+		with open(args.manifest, encoding='utf-8-sig') as file:
+			manifest = json.load(file)
+		roots, merge, output = load_manifest(manifest, args.output, args.format, args.merge)
+	except (OSError, ValueError) as e:
+		parser.error(str(e))
+
+	started = time.monotonic()
+	log = None if args.quiet else sys.stderr
+	failed = 0
+	total = 0
+	try:
+		for result in run_batch(roots, merge, output, args.workers or manifest.get('workers'), args.temp_dir, log):
+			total += result.files
+			if result.error is not None:
+				failed += 1
+				print(f'{result.label}: 导出失败: {result.error}', file=sys.stderr)
+	except (OSError, ValueError) as e:
+		print(f'导出失败: {e}', file=sys.stderr)
+		return 1
+	if log is not None:
+		elapsed = time.monotonic() - started
+		print(f'共 {len(roots)} 个文件夹、{total} 个文件，用时 {elapsed:.1f} 秒，{total / elapsed if elapsed else 0:.0f} 个/秒', file=log)
+	return 1 if failed else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
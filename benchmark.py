@@ -0,0 +1,314 @@
+"""性能基准：生成合成的目录树，分阶段测量耗时、吞吐量和内存峰值
+
+	python benchmark.py                                   按 wide 形状生成目录树并测量
+	python benchmark.py --shape deep --scale 4 -o deep.json
+	python benchmark.py --root D:\\share -j 16             测量已有的文件夹，不生成目录树
+	python benchmark.py -o new.json --compare old.json    与之前保存的结果逐项对比
+
+各阶段与程序中的调用路径对应：
+	tree     逐层读取子文件夹，即展开文件夹树（_AddTreeNodes）
+	walk     遍历目录，不 stat
+	stat     对 walk 得到的每个文件 stat 一次，生成 FileRecord（_GetFileInfo）
+	filter   编译并执行过滤表达式
+	store    写入 RowStore
+	sort     按大小排序；sort:spill 把记录分成 SPILL_RUNS 段写入临时文件再归并
+	format   格式化全部行
+	export   按各种格式导出
+	scan     完整的扫描（GenerateFileList），-j 大于 1 时另测并发读取
+每个阶段重复运行取最快的一次，再在 tracemalloc 下单独运行一次，取 Python 对象的内存峰值。
+生成的文件是稀疏文件；目录树刚生成时在系统缓存中，测到的是热缓存下的成绩。
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+import exporter
+import extsort
+import filterexpr
+import rowstore
+import scanner
+
+
+Shape = namedtuple('Shape', 'top fanout depth files unicode')
+Shape.__doc__ = '目录树的形状：根目录下 top 个子树，每个子树 depth 层、每个文件夹 fanout 个子文件夹和 files 个文件'
+SHAPES = {
+	'wide': Shape(top=2000, fanout=0, depth=1, files=10, unicode=False),
+	'deep': Shape(top=10, fanout=1, depth=100, files=20, unicode=False),
+	'small': Shape(top=20, fanout=4, depth=3, files=200, unicode=False),
+	'unicode': Shape(top=10, fanout=3, depth=3, files=100, unicode=True),
+}
+EXTENSIONS = ('txt', 'pdf', 'docx', 'xlsx', 'jpg', 'png', 'log', 'csv', 'py', 'mp4', 'zip', '')
+# 长文件名使用的字符：中日韩文字、带重音的拉丁字母、emoji 和空格
+UNICODE_CHARS = '文件清单测试目录报告数据备份照片视频资料日本語のファイル한국어파일éèêëàâäöüßçñ ✓★☃😀🎉📁'
+MAX_FILE_SIZE = 64 << 20
+MTIME_SPAN = 2 * 365 * 86400
+FILTER_EXPR = 'pdf docx *.log size>4K mtime>180d'
+EXPORT_FORMATS = ('csv', 'txt', 'jsonl', 'csv.gz')
+SPILL_RUNS = 8
+SOURCE_FILES = ('DK_FileList.py', 'scanner.py', 'rowstore.py', 'formatting.py', 'exporter.py', 'filterexpr.py', 'extsort.py')
+# 对比时耗时或内存超过之前结果的这个倍数即标记为变慢
+REGRESSION_RATIO = 1.1
+
+
+def _file_name(rng, shape, index):
+	ext = rng.choice(EXTENSIONS)
+	if shape.unicode:
+		stem = f'{index:04d} ' + ''.join(rng.choice(UNICODE_CHARS) for _ in range(rng.randint(20, 60)))
+	else:
+		stem = f'file_{index:05d}_{rng.randrange(1 << 16):04x}'
+	return f'{stem}.{ext}' if ext else stem
+
+
+def _dir_name(rng, shape, index):
+	if shape.unicode:
+		return f'{index:03d} ' + ''.join(rng.choice(UNICODE_CHARS) for _ in range(rng.randint(10, 30)))
+	return f'd{index:03d}'
+
+
+def generate_tree(root, shape, scale=1.0, seed=0):
+	"""在 root 下按 shape 生成目录树，scale 放大子树的数量，返回 (文件夹数, 文件数)
+
+	文件大小按对数正态分布、修改时间在两年之内随机，同一个 seed 生成的目录树相同。
+	"""
+	rng = random.Random(seed)
+	now = time.time()
+	dirs = files = 0
+	stack = [(os.path.join(root, _dir_name(rng, shape, i)), 1) for i in range(max(1, round(shape.top * scale)))]
+	while stack:
+		path, level = stack.pop()
+		os.mkdir(path)
+		dirs += 1
+		for i in range(shape.files):
+			file_path = os.path.join(path, _file_name(rng, shape, i))
+			with open(file_path, 'wb') as file:
+				file.truncate(min(int(rng.lognormvariate(8, 3)), MAX_FILE_SIZE))
+			mtime = now - rng.random() * MTIME_SPAN
+			os.utime(file_path, (mtime, mtime))
+			files += 1
+		if level < shape.depth:
+			stack.extend((os.path.join(path, _dir_name(rng, shape, i)), level + 1) for i in range(shape.fanout))
+	return dirs, files
+
+
+def measure(run, setup=None, repeat=3):
+	"""运行 run(setup()) repeat 次取最快的一次，再在 tracemalloc 下运行一次；run 返回处理的项数
+
+	setup 不计入耗时和内存峰值。
+	"""
+	best = None
+	for _ in range(repeat):
+		arg = setup() if setup is not None else None
+		start = time.perf_counter()
+		items = run(arg)
+		seconds = time.perf_counter() - start
+		best = seconds if best is None else min(best, seconds)
+		del arg
+	arg = setup() if setup is not None else None
+	gc.collect()
+	tracemalloc.start()
+	try:
+		run(arg)
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	return {'seconds': best, 'items': items, 'items_per_sec': items / best if best else None, 'peak_bytes': peak}
+
+
+def _read_tree(root):
+	# 与文件夹树相同，每展开一层只读取子文件夹
+	count = 0
+	pending = [root]
+	while pending:
+		subfolders = scanner.list_subfolders(pending.pop())
+		count += len(subfolders)
+		pending.extend(entry.path for entry in subfolders if not entry.is_symlink())
+	return count
+
+
+def _stat_all(tree):
+	records = (scanner.make_record(entry, dirpath) for dirpath, _, files in tree for entry in files)
+	return [record for record in records if record is not None]
+
+
+def _filter_all(records_with_depth):
+	file_filter = filterexpr.compile_filter(filterexpr.split_terms(FILTER_EXPR))
+	for record, depth in records_with_depth:
+		file_filter.accept_name(record.name, depth) and file_filter.accept_record(record, depth)
+	return len(records_with_depth)
+
+
+def _count(iterable):
+	return sum(1 for _ in iterable)
+
+
+def run_benchmark(root, repeat=3, workers=1, formats=EXPORT_FORMATS, out_dir=None):
+	"""测量 root 的各个阶段，返回 {阶段名: 结果}，结果见 measure；导出阶段另有输出文件的字节数"""
+	options = scanner.ScanOptions(root, file_format=1, show_size=True, show_modify=True)
+	stages = {}
+	stages['tree'] = measure(lambda _: _read_tree(root), repeat=repeat)
+	stages['walk'] = measure(lambda _: sum(len(files) for _, _, files in scanner.walk(root)), repeat=repeat)
+	# DirEntry 会缓存 stat 的结果，每次重新遍历得到新的 DirEntry
+	stages['stat'] = measure(lambda tree: len(_stat_all(tree)), lambda: list(scanner.walk(root)), repeat=repeat)
+
+	records = _stat_all(scanner.walk(root))
+	depths = {}
+	records_with_depth = []
+	for record in records:
+		depth = depths.get(record.dirpath)
+		if depth is None:
+			depth = depths[record.dirpath] = scanner.folder_depth(record.dirpath, root)
+		records_with_depth.append((record, depth))
+	stages['filter'] = measure(_filter_all, lambda: records_with_depth, repeat=repeat)
+	del records_with_depth
+
+	def fill(records):
+		store = rowstore.RowStore(options)
+		store.extend(records)
+		return len(store)
+	stages['store'] = measure(fill, lambda: records, repeat=repeat)
+	stages['sort'] = measure(lambda records: _count(extsort.sort_records(records, 'size')), lambda: records, repeat=repeat)
+	run_size = max(1, len(records) // SPILL_RUNS)
+	stages['sort:spill'] = measure(lambda records: _count(extsort.sort_records(records, 'size', run_size=run_size)),
+		lambda: records, repeat=repeat)
+	store = rowstore.RowStore(options)
+	store.extend(records)
+	del records
+	stages['format'] = measure(lambda store: _count(store), lambda: store, repeat=repeat)
+
+	own_dir = out_dir is None
+	if own_dir:
+		out_dir = tempfile.mkdtemp(prefix='filelister-export-')
+	try:
+		for ext in formats:
+			file_path = os.path.join(out_dir, f'benchmark.{ext}')
+			try:
+				result = measure(lambda store: exporter.write_store(store, file_path, ext), lambda: store, repeat=repeat)
+			except ValueError as e:
+				# 例如没有安装 pyarrow 或 zstandard
+				stages[f'export:{ext}'] = {'error': str(e)}
+				continue
+			result['output_bytes'] = os.path.getsize(file_path)
+			stages[f'export:{ext}'] = result
+	finally:
+		if own_dir:
+			shutil.rmtree(out_dir, ignore_errors=True)
+	del store
+
+	stages['scan'] = measure(lambda _: _count(scanner.scan_records(options)), repeat=repeat)
+	if workers > 1:
+		parallel = options.replace(workers=workers)
+		stages[f'scan:j{workers}'] = measure(lambda _: _count(scanner.scan_records(parallel)), repeat=repeat)
+	return stages
+
+
+def source_version():
+	"""git 提交号（不在仓库中时为 None）和主要源文件的哈希，用于区分不同版本的结果"""
+	here = os.path.dirname(os.path.abspath(__file__))
+	try:
+		commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=here, capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		commit = None
+	sources = {}
+	for name in SOURCE_FILES:
+		try:
+			with open(os.path.join(here, name), 'rb') as file:
+				sources[name] = hashlib.sha256(file.read()).hexdigest()[:12]
+		except OSError:
+			sources[name] = None
+	return {'commit': commit, 'sources': sources}
+
+
+def compare(old, new):
+	"""逐个阶段对比两次结果的耗时和内存峰值，产出 (阶段, 耗时倍数, 内存倍数, 是否变慢)"""
+	for name, result in new['stages'].items():
+		before = old.get('stages', {}).get(name)
+		if not before or 'seconds' not in before or 'seconds' not in result:
+			continue
+		time_ratio = result['seconds'] / before['seconds'] if before['seconds'] else None
+		memory_ratio = result['peak_bytes'] / before['peak_bytes'] if before['peak_bytes'] else None
+		slower = any(ratio is not None and ratio > REGRESSION_RATIO for ratio in (time_ratio, memory_ratio))
+		yield name, time_ratio, memory_ratio, slower
+
+
+def build_parser():
+	parser = argparse.ArgumentParser(description='生成合成目录树，分阶段测量扫描、过滤、格式化和导出的性能')
+	parser.add_argument('--shape', choices=SHAPES, default='wide', help='目录树形状：wide 很多并列的文件夹，deep 很深的文件夹，'
+		'small 大量小文件，unicode 很长的 Unicode 文件名')
+	parser.add_argument('--scale', type=float, default=1.0, help='按比例增减子树的数量')
+	parser.add_argument('--seed', type=int, default=0, help='随机数种子，相同的种子生成相同的目录树')
+	parser.add_argument('--root', help='测量已有的文件夹，不生成目录树')
+	parser.add_argument('--keep', action='store_true', help='保留生成的目录树，输出其路径')
+	parser.add_argument('-r', '--repeat', type=int, default=3, help='每个阶段重复的次数，取最快的一次')
+	parser.add_argument('-j', '--jobs', type=int, default=1, help='大于 1 时另外测量并发读取目录的完整扫描')
+	parser.add_argument('-f', '--formats', type=lambda value: [t for t in value.split(',') if t], default=list(EXPORT_FORMATS),
+		help=f'导出阶段测量的格式，逗号分隔，可选 {", ".join(exporter.FORMATS)}')
+	parser.add_argument('-o', '--output', help='把结果保存为 JSON 文件')
+	parser.add_argument('--compare', metavar='FILE', help='与之前保存的 JSON 结果对比')
+	return parser
+
+
+def main(argv=None):
+	parser = build_parser()
+	args = parser.parse_args(argv)
+	unknown = set(args.formats) - set(exporter.FORMATS)
+	if unknown:
+		parser.error(f'未知的导出格式: {",".join(sorted(unknown))}')
+	if args.root is not None and not os.path.isdir(args.root):
+		parser.error(f'文件夹不存在: {args.root}')
+	baseline = None
+	if args.compare:
+		with open(args.compare, encoding='utf-8') as file:
+			baseline = json.load(file)
+
+	result = {
+		'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'version': source_version(),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+	}
+	root = args.root
+	if root is None:
+		root = tempfile.mkdtemp(prefix='filelister-bench-')
+		start = time.perf_counter()
+		dirs, files = generate_tree(root, SHAPES[args.shape], args.scale, args.seed)
+		result.update(shape=args.shape, scale=args.scale, seed=args.seed, generate_seconds=time.perf_counter() - start)
+		print(f'生成 {args.shape} 目录树：{dirs} 个文件夹、{files} 个文件，用时 {result["generate_seconds"]:.1f} 秒', file=sys.stderr)
+	result['root'] = os.path.abspath(root)
+	try:
+		result['stages'] = run_benchmark(root, args.repeat, args.jobs, args.formats)
+	finally:
+		if args.root is None and not args.keep:
+			shutil.rmtree(root, ignore_errors=True)
+		elif args.root is None:
+			print(f'目录树保存在 {root}', file=sys.stderr)
+
+	for name, stage in result['stages'].items():
+		if 'error' in stage:
+			print(f'{name:<16}{stage["error"]}')
+		else:
+			print(f'{name:<16}{stage["seconds"]:8.3f} s{stage["items_per_sec"] or 0:12.0f} 个/秒{stage["peak_bytes"] / (1 << 20):9.1f} MB')
+	if baseline is not None:
+		print(f'\n与 {args.compare}（{baseline.get("version", {}).get("commit")}）对比：')
+		for name, time_ratio, memory_ratio, slower in compare(baseline, result):
+			time_text = f'{time_ratio:.2f}x' if time_ratio is not None else '-'
+			memory_text = f'{memory_ratio:.2f}x' if memory_ratio is not None else '-'
+			print(f'{name:<16}耗时 {time_text:>7}  内存 {memory_text:>7}{"  变慢" if slower else ""}')
+	if args.output:
+		with open(args.output, 'w', encoding='utf-8') as file:
+			json.dump(result, file, ensure_ascii=False, indent=2)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
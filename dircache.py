@@ -0,0 +1,164 @@
+"""会话内的目录缓存
+
+文件夹树、生成清单、还原树和反复点击“生成清单”都从同一份缓存读取目录，每个目录在一次会话中只读取一次。
+缓存以目录路径为键，每个目录是一个不可变的 DirNode，保存子文件夹和文件的目录项（scanner.CachedEntry）；
+子节点通过路径在缓存中查找，淘汰一个目录不影响其他目录，下次用到时重新读取。
+
+缓存不会自己发现磁盘上的变化，需要调用 invalidate 让某个目录及其子目录重新读取。
+总大小超过 max_bytes 时按最近最少使用的顺序淘汰，长时间没有访问的子树会整体移出。
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+import scanner
+
+
+DEFAULT_MAX_BYTES = 256 << 20
+# 一个目录项除名称和路径字符串之外的大致内存：CachedEntry 对象和 EntryStat
+ENTRY_OVERHEAD = 200
+NODE_OVERHEAD = 400
+# Windows 上 scandir 已经带有大小和时间，stat 不需要额外的系统调用，读取时总是保存下来
+STAT_IS_FREE = os.name == 'nt'
+_STR_OVERHEAD = sys.getsizeof('')
+
+DirNode = namedtuple('DirNode', ['path', 'dirs', 'files', 'has_stat', 'nbytes'])
+DirNode.__doc__ = '缓存中的一个目录，dirs 和 files 为 CachedEntry 的元组；has_stat 为 False 时还有文件没有 stat'
+
+
+def _file_entry(entry):
+	"""带 stat 的目录项，与 scanner.make_record 相同，文件已被删除时返回 None"""
+	try:
+		st = entry.stat()
+	except OSError:
+		try:
+			st = entry.stat(follow_symlinks=False)
+		except OSError:
+			return None
+	return scanner.CachedEntry(entry.name, entry.path, False, entry.is_symlink(),
+		scanner.EntryStat(st.st_size, st.st_ctime, st.st_mtime, st.st_atime))
+
+
+def _plain_entry(entry):
+	"""不 stat 的目录项；已经是 CachedEntry（例如来自增量索引或旧的节点）时原样保留，已有的属性不丢失"""
+	if isinstance(entry, scanner.CachedEntry):
+		return entry
+	return scanner.CachedEntry(entry.name, entry.path, False, entry.is_symlink())
+
+
+def _needs_stat(entry, want_stat):
+	return not (isinstance(entry, scanner.CachedEntry) and entry.has_stat()) and (want_stat is None or want_stat(entry.name))
+
+
+def make_node(folder_path, dirs, files, with_stat, want_stat=None):
+	"""由 reader 返回的目录项生成 DirNode
+
+	with_stat 为 True 时对 want_stat(name) 为 True 的文件（want_stat 为 None 时为全部文件）stat 一次，
+	其余文件不 stat，名称过滤掉的文件不会因为缓存而多做 stat；已经带有属性的目录项不重复 stat。
+	"""
+	cached = scanner.CachedEntry
+	dirs = tuple([cached(entry.name, entry.path, True, entry.is_symlink()) for entry in dirs])
+	if with_stat:
+		items = [_file_entry(entry) if _needs_stat(entry, want_stat) else _plain_entry(entry) for entry in files]
+		files = tuple([item for item in items if item is not None])
+	else:
+		files = tuple(map(_plain_entry, files))
+	# 名称和路径字符串的大小约为长度加上固定开销，不逐个调用 sys.getsizeof
+	text = sum(len(entry.path) + len(entry.name) for entry in dirs) + sum(len(entry.path) + len(entry.name) for entry in files)
+	nbytes = NODE_OVERHEAD + len(folder_path) + text + (ENTRY_OVERHEAD + 2 * _STR_OVERHEAD) * (len(dirs) + len(files))
+	return DirNode(folder_path, dirs, files, all(entry.has_stat() for entry in files), nbytes)
+
+
+class DirCache:
+	"""目录路径到 DirNode 的 LRU 缓存，线程安全
+
+	read_dir 与 scanner.read_dir 接口相同，可以作为 scanner.walk 的 reader；
+	返回的是新的列表，调用方排序或剪枝都不会改动缓存。
+	"""
+	def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+		self.max_bytes = max_bytes
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._nodes = OrderedDict()
+		self.lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._nodes)
+
+	def get(self, folder_path):
+		"""取已缓存的 DirNode，没有时返回 None，不读取磁盘"""
+		with self.lock:
+			node = self._nodes.get(folder_path)
+			if node is not None:
+				self._nodes.move_to_end(folder_path)
+			return node
+
+	def node(self, folder_path, need_stat=False, reader=scanner.read_dir, want_stat=None):
+		"""取目录的 DirNode，没有缓存时用 reader 读取
+
+		need_stat 为 True 时保证 want_stat(name) 为 True 的文件（want_stat 为 None 时为全部文件）已经 stat。
+		"""
+		node = self.get(folder_path)
+		if node is not None and (node.has_stat or not need_stat
+				or not any(_needs_stat(entry, want_stat) for entry in node.files)):
+			self.hits += 1
+			return node
+		self.misses += 1
+		if node is not None:
+			# 只缺文件属性：不必重新列目录，对已有的目录项补做 stat，生成新的节点
+			node = make_node(folder_path, node.dirs, node.files, True, want_stat)
+		else:
+			dirs, files = reader(folder_path)
+			node = make_node(folder_path, dirs, files, need_stat or STAT_IS_FREE, None if STAT_IS_FREE else want_stat)
+		self._Put(node)
+		return node
+
+	def _Put(self, node):
+		with self.lock:
+			old = self._nodes.pop(node.path, None)
+			if old is not None:
+				self.nbytes -= old.nbytes
+			self._nodes[node.path] = node
+			self.nbytes += node.nbytes
+			while self.nbytes > self.max_bytes and len(self._nodes) > 1:
+				_, evicted = self._nodes.popitem(last=False)
+				self.nbytes -= evicted.nbytes
+				self.evictions += 1
+
+	def read_dir(self, folder_path):
+		node = self.node(folder_path)
+		return list(node.dirs), list(node.files)
+
+	def list_subfolders(self, folder_path):
+		"""文件夹树使用的子文件夹列表，不需要文件属性"""
+		return list(self.node(folder_path).dirs)
+
+	def reader(self, reader=scanner.read_dir, need_stat=False, stat_filter=None):
+		"""返回供 scanner.walk 使用的 reader：先查缓存，没有时由 reader 读取（例如 ScanIndex.read_dir）
+
+		stat_filter(folder_path) 返回这个目录的 want_stat，只为通过名称过滤的文件 stat，见 node。
+		"""
+		def read_cached(folder_path):
+			node = self.node(folder_path, need_stat, reader, stat_filter(folder_path) if stat_filter is not None else None)
+			return list(node.dirs), list(node.files)
+		return read_cached
+
+	def invalidate(self, folder_path=None, recursive=True):
+		"""移出 folder_path 及其所有子目录（recursive 为 False 时只移出它本身），下次访问时重新读取；
+		folder_path 为 None 时清空缓存"""
+		with self.lock:
+			if folder_path is None:
+				self._nodes.clear()
+				self.nbytes = 0
+				return
+			if not recursive:
+				node = self._nodes.pop(folder_path, None)
+				if node is not None:
+					self.nbytes -= node.nbytes
+				return
+			prefix = folder_path if folder_path.endswith(os.sep) else folder_path + os.sep
+			for path in [path for path in self._nodes if path == folder_path or path.startswith(prefix)]:
+				self.nbytes -= self._nodes.pop(path).nbytes
@@ -0,0 +1,116 @@
+"""按文件夹汇总的报告
+
+像 du 一样把每个文件夹（含全部子文件夹）的文件数、总大小、最早和最新修改时间以及扩展名分布累计起来。
+scanner 按深度优先顺序产出 FileRecord，同一子树的文件总是连续出现，
+因此只需要保存从根到当前文件夹这一条路径上的累计值，额外内存为 O(深度)，边扫描边产出汇总。
+
+汇总只统计通过过滤的文件；不含任何这样的文件的文件夹不会出现在报告中。
+"""
+import os
+from collections import Counter, namedtuple
+
+from formatting import format_file_size
+
+
+DirSummary = namedtuple('DirSummary', 'path depth files size oldest newest extensions')
+REPORT_HEADER = ['文件夹', '层数', '文件数', '总大小', '字节数', '最早修改时间', '最新修改时间', '扩展名']
+# 扩展名一列只列出文件数最多的几种
+TOP_EXTENSIONS = 10
+NO_EXTENSION = '(无)'
+
+
+class _Folder:
+	__slots__ = ('path', 'prefix', 'depth', 'files', 'size', 'oldest', 'newest', 'extensions')
+
+	def __init__(self, path, depth):
+		self.path = path
+		self.prefix = path if path.endswith(os.sep) else path + os.sep
+		self.depth = depth
+		self.files = 0
+		self.size = 0
+		self.oldest = None
+		self.newest = None
+		self.extensions = Counter()
+
+	def merge(self, child):
+		self.files += child.files
+		self.size += child.size
+		if child.oldest is not None:
+			self.oldest = child.oldest if self.oldest is None else min(self.oldest, child.oldest)
+			self.newest = child.newest if self.newest is None else max(self.newest, child.newest)
+		self.extensions.update(child.extensions)
+
+	def summary(self):
+		return DirSummary(self.path, self.depth, self.files, self.size, self.oldest, self.newest, self.extensions)
+
+
+def report_options(options, root=None):
+	"""复制一份 ScanOptions，打开汇总需要的大小和修改时间，root 不为 None 时只汇总该子文件夹"""
+	options = options.replace(show_size=True, show_modify=True, show_hash=False, sort_key=None)
+	if root is not None:
+		options.root = root
+	return options
+
+
+def summarize(records, root):
+	"""逐个读取深度优先顺序的 FileRecord，产出每个文件夹的 DirSummary，子文件夹先于上级，root 最后产出"""
+	stack = [_Folder(root, 0)]
+	for record in records:
+		dirpath = record.dirpath
+		top = stack[-1]
+		if dirpath != top.path:
+			# 离开已经结束的子树，它们的累计值并入上级
+			while len(stack) > 1 and dirpath != top.path and not dirpath.startswith(top.prefix):
+				stack.pop()
+				yield top.summary()
+				stack[-1].merge(top)
+				top = stack[-1]
+			if dirpath != top.path:
+				for part in os.path.relpath(dirpath, top.path).split(os.sep):
+					top = _Folder(os.path.join(top.path, part), top.depth + 1)
+					stack.append(top)
+		top.files += 1
+		top.size += record.size
+		mtime = record.mtime
+		if top.oldest is None or mtime < top.oldest:
+			top.oldest = mtime
+		if top.newest is None or mtime > top.newest:
+			top.newest = mtime
+		top.extensions[os.path.splitext(record.name)[1].lstrip('.').lower() or NO_EXTENSION] += 1
+	while stack:
+		folder = stack.pop()
+		yield folder.summary()
+		if stack:
+			stack[-1].merge(folder)
+
+
+def format_extensions(extensions, top=TOP_EXTENSIONS):
+	"""扩展名分布格式化为 pdf:120 docx:30 其他:5"""
+	common = extensions.most_common(top)
+	text = ' '.join(f'{ext}:{count}' for ext, count in common)
+	others = sum(extensions.values()) - sum(count for _, count in common)
+	if others:
+		text += f' 其他:{others}'
+	return text
+
+
+def report_rows(summaries, options, max_depth=None):
+	"""把 DirSummary 格式化为报告的行，max_depth 不为 None 时只输出不超过该层数的文件夹"""
+	format_time = options.time_formatter
+	for summary in summaries:
+		if max_depth is not None and summary.depth > max_depth:
+			continue
+		if options.file_format == 2:
+			name = summary.path
+		else:
+			name = os.path.relpath(summary.path, options.root)
+		yield [
+			name,
+			str(summary.depth),
+			str(summary.files),
+			format_file_size(summary.size),
+			str(summary.size),
+			format_time(summary.oldest) if summary.oldest is not None else '',
+			format_time(summary.newest) if summary.newest is not None else '',
+			format_extensions(summary.extensions),
+		]
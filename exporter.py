@@ -0,0 +1,390 @@
+"""流式导出文件清单
+
+扫描得到的 FileRecord 按块格式化后直接写入带缓冲的文件，不需要先把整个清单放进内存，
+导出上千万个文件时内存占用也保持不变。本模块不依赖 wx，可以在无界面环境中使用。
+
+支持的格式：
+	csv、txt        与界面显示相同的格式化文本，txt 没有表头
+	jsonl           每行一个 JSON 对象，大小为字节数，时间为纪元秒
+	以上格式加 .gz 或 .zst 后缀时边写边压缩（zst 需要安装 zstandard）
+	parquet、arrow  列式存储，大小为 int64，时间为 UTC 时间戳，需要安装 pyarrow
+	flsnap          快照，见 snapshot
+"""
+import contextlib
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+from itertools import islice
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+import scanner
+import rowstore
+import dirreport
+import formatting
+import hashing
+import snapshot
+from formatting import format_file_size
+
+
+CHUNK_SIZE = 10000
+# 列式格式每块为一个 row group，块太小会降低压缩率和读取速度
+COLUMNAR_CHUNK_SIZE = 1 << 17
+DUPLICATE_HEADER = ['组', '文件数', '大小', '字节数', '内容哈希', '文件名']
+DIFF_HEADER = ['变化', '文件名', '原大小', '现大小', '原修改时间', '现修改时间']
+BUFFER_SIZE = 1 << 20
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+TEXT_FORMATS = ('csv', 'txt', 'jsonl')
+COMPRESSIONS = ('gz', 'zst')
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+FORMATS = TEXT_FORMATS + tuple(f'{base}.{compression}' for base in TEXT_FORMATS for compression in COMPRESSIONS) \
+	+ COLUMNAR_FORMATS + (snapshot.SNAPSHOT_EXT,)
+
+
+def detect_format(file_path, default='csv'):
+	"""按文件后缀判断导出格式，可以识别 .csv.gz 这样的双重后缀"""
+	name = os.path.basename(file_path).lower()
+	for fmt in sorted(FORMATS, key=len, reverse=True):
+		if name.endswith('.' + fmt):
+			return fmt
+	return default
+
+
+def _split_format(ext):
+	base, _, compression = ext.partition('.')
+	if base not in TEXT_FORMATS or compression not in ('',) + COMPRESSIONS:
+		raise ValueError(f'不支持的格式: {ext}')
+	return base, compression or None
+
+
+def _chunks(iterable, size):
+	iterator = iter(iterable)
+	while chunk := list(islice(iterator, size)):
+		yield chunk
+
+
+@contextlib.contextmanager
+def _open(file_path, compression=None):
+	"""打开文本输出，file_path 为 - 时写到标准输出，compression 为 gz 或 zst 时边写边压缩"""
+	if compression is None:
+		if file_path == '-':
+			yield sys.stdout
+			return
+		with open(file_path, 'w', newline='', encoding='utf-8', buffering=BUFFER_SIZE) as file:
+			yield file
+		return
+
+	if compression == 'zst' and zstandard is None:
+		raise ValueError('写 .zst 文件需要安装 zstandard')
+	to_stdout = file_path == '-'
+	binary = sys.stdout.buffer if to_stdout else open(file_path, 'wb', buffering=BUFFER_SIZE)
+	try:
+		if compression == 'gz':
+			stream = gzip.GzipFile(filename='', mode='wb', fileobj=binary, compresslevel=GZIP_LEVEL)
+		else:
+			stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(binary, closefd=False)
+		# 关闭 TextIOWrapper 时压缩流写出结尾，但不会关闭 binary
+		with io.TextIOWrapper(stream, encoding='utf-8', newline='') as file:
+			yield file
+	finally:
+		if to_stdout:
+			binary.flush()
+		else:
+			binary.close()
+
+
+def _write_txt(file, rows, first):
+	"""txt 格式每行以逗号分隔，行之间换行，没有表头"""
+	for row in rows:
+		if not first:
+			file.write('\n')
+		file.write(','.join(row))
+		first = False
+	return first
+
+
+class _TextWriter:
+	"""csv/txt/jsonl 的行写入器，jsonl 的键为 header；write_header 为 False 时 csv 不写表头"""
+	def __init__(self, file_path, ext, header, write_header=True):
+		self.base, compression = _split_format(ext)
+		self.header = list(header)
+		self._stack = contextlib.ExitStack()
+		self.file = self._stack.enter_context(_open(file_path, compression))
+		self._first = True
+		if self.base == 'csv':
+			self._csv = csv.writer(self.file)
+			if write_header:
+				self._csv.writerow(self.header)
+		elif self.base == 'jsonl':
+			self._encode = json.JSONEncoder(ensure_ascii=False).encode
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		self._stack.close()
+
+	def write(self, rows):
+		if self.base == 'csv':
+			self._csv.writerows(rows)
+		elif self.base == 'txt':
+			self._first = _write_txt(self.file, rows, self._first)
+		else:
+			header, encode, write = self.header, self._encode, self.file.write
+			for row in rows:
+				write(encode(dict(zip(header, row))))
+				write('\n')
+
+
+class _StoreTextWriter(_TextWriter):
+	"""把 RowStore 写成文本格式；raw 为 True 或 jsonl 时写原始数值，表头为列名（name、size、mtime 等）"""
+	def __init__(self, file_path, ext, store, raw=False, write_header=True):
+		base = _split_format(ext)[0]
+		self.raw = raw or base == 'jsonl'
+		super().__init__(file_path, ext, store.columns if self.raw else store.header(), write_header)
+
+	def write_store(self, store):
+		if not self.raw:
+			self.write(store)
+			return
+		for start in range(0, len(store), rowstore.ROW_BLOCK):
+			rows = store.raw_rows(start, start + rowstore.ROW_BLOCK)
+			if self.base == 'txt':
+				# 与 csv 相同，没有值（如无法读取的文件的哈希）时为空
+				rows = (['' if value is None else str(value) for value in row] for row in rows)
+			self.write(rows)
+
+
+class _ColumnarWriter:
+	"""用 pyarrow 把 RowStore 按块写成 Parquet 或 Arrow IPC 文件，每块为一个 row group / record batch"""
+	def __init__(self, file_path, ext, store):
+		try:
+			import pyarrow
+		except ImportError:
+			raise ValueError(f'导出 {ext} 需要安装 pyarrow') from None
+		if file_path == '-':
+			raise ValueError(f'{ext} 格式不能输出到标准输出')
+		self.pa = pyarrow
+		time_type = pyarrow.timestamp('us', tz='UTC')
+		types = {'name': pyarrow.string(), 'size': pyarrow.int64(), 'ctime': time_type, 'mtime': time_type,
+			'atime': time_type, 'hash': pyarrow.string()}
+		self.schema = pyarrow.schema([(column, types[column]) for column in store.columns])
+		if ext == 'parquet':
+			import pyarrow.parquet
+			self.writer = pyarrow.parquet.ParquetWriter(file_path, self.schema, compression='zstd')
+		else:
+			import pyarrow.ipc
+			self.writer = pyarrow.ipc.new_file(file_path, self.schema)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		self.writer.close()
+
+	def write_store(self, store):
+		arrays = []
+		for col, field in enumerate(self.schema):
+			values = store.raw_column(col, 0, len(store))
+			if field.name in ('ctime', 'mtime', 'atime'):
+				values = [round(value * 1000000) for value in values]
+			arrays.append(self.pa.array(values, type=field.type))
+		self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+
+def _store_writer(file_path, ext, store, raw=False, write_header=True):
+	if ext in COLUMNAR_FORMATS:
+		return _ColumnarWriter(file_path, ext, store)
+	return _StoreTextWriter(file_path, ext, store, raw, write_header)
+
+
+def write_store(store, file_path, ext, raw=False):
+	"""把内存中的 RowStore 写入文件，返回写入的行数"""
+	with _store_writer(file_path, ext, store, raw) as writer:
+		writer.write_store(store)
+	return len(store)
+
+
+def write_records(records, file_path, ext, options, chunk_size=CHUNK_SIZE, raw=False, write_header=True):
+	"""把 FileRecord 流按块格式化后写入文件，返回写入的行数
+
+	ext 为 FORMATS 之一；为 snapshot.SNAPSHOT_EXT 时写成快照，records 需要按 snapshot.snapshot_options 扫描得到。
+	raw 为 True 时 csv/txt 也写原始数值；write_header 为 False 时 csv 不写表头，用于之后拼接的分片。
+	"""
+	if ext == snapshot.SNAPSHOT_EXT:
+		return snapshot.write_snapshot(records, file_path, options)
+	if ext in COLUMNAR_FORMATS:
+		chunk_size = max(chunk_size, COLUMNAR_CHUNK_SIZE)
+	store = rowstore.RowStore(options)
+	count = 0
+	with _store_writer(file_path, ext, store, raw, write_header) as writer:
+		for chunk in _chunks(records, chunk_size):
+			store.clear()
+			store.extend(chunk)
+			writer.write_store(store)
+			count += len(store)
+	return count
+
+
+def _compress(data, compression):
+	if compression == 'gz':
+		return gzip.compress(data, compresslevel=GZIP_LEVEL)
+	if compression == 'zst':
+		return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+	return data
+
+
+class PartJoiner:
+	"""按顺序把分片分别导出的文件拼接为一个文件，用于批量任务
+
+	文本格式（含 .gz/.zst）按字节拼接：gzip 和 zstd 都允许多段首尾相接，csv 只应由第一个分片写表头，
+	txt 在非空的分片之间补一个换行；parquet/arrow 逐批读出再写入。
+	"""
+	def __init__(self, file_path, ext):
+		if ext not in FORMATS:
+			raise ValueError(f'批量任务不支持的格式: {ext}')
+		if ext in COLUMNAR_FORMATS and file_path == '-':
+			raise ValueError(f'{ext} 格式不能输出到标准输出')
+		self.file_path = file_path
+		self.ext = ext
+		self.count = 0
+		self._file = None
+		self._writer = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def append(self, part_path, count):
+		"""追加一个分片，count 为分片的行数"""
+		if self.ext in COLUMNAR_FORMATS:
+			self._AppendColumnar(part_path)
+		else:
+			if self._file is None:
+				self._file = sys.stdout.buffer if self.file_path == '-' else open(self.file_path, 'wb')
+			base, compression = _split_format(self.ext)
+			if base == 'txt' and count and self.count:
+				self._file.write(_compress(b'\n', compression))
+			with open(part_path, 'rb') as part:
+				shutil.copyfileobj(part, self._file, BUFFER_SIZE)
+		self.count += count
+
+	def _AppendColumnar(self, part_path):
+		import pyarrow
+		if self.ext == 'parquet':
+			import pyarrow.parquet
+			part = pyarrow.parquet.ParquetFile(part_path)
+			if self._writer is None:
+				self._writer = pyarrow.parquet.ParquetWriter(self.file_path, part.schema_arrow, compression='zstd')
+			for batch in part.iter_batches(batch_size=COLUMNAR_CHUNK_SIZE):
+				self._writer.write_batch(batch)
+		else:
+			import pyarrow.ipc
+			with pyarrow.memory_map(part_path) as source:
+				part = pyarrow.ipc.open_file(source)
+				if self._writer is None:
+					self._writer = pyarrow.ipc.new_file(self.file_path, part.schema)
+				for i in range(part.num_record_batches):
+					self._writer.write_batch(part.get_batch(i))
+
+	def close(self):
+		if self._writer is not None:
+			self._writer.close()
+		if self._file is not None:
+			if self._file is sys.stdout.buffer:
+				self._file.flush()
+			else:
+				self._file.close()
+
+
+def _write_report(rows, file_path, ext, header):
+	count = 0
+	with _TextWriter(file_path, ext, header) as writer:
+		for chunk in _chunks(rows, CHUNK_SIZE):
+			writer.write(chunk)
+			count += len(chunk)
+	return count
+
+
+def write_dir_report(options, file_path, ext, max_depth=None, stats=None):
+	"""按 ScanOptions 扫描并写出按文件夹汇总的报告，返回写入的行数"""
+	options = dirreport.report_options(options)
+	summaries = dirreport.summarize(scanner.scan_records(options, stats), options.root)
+	return _write_report(dirreport.report_rows(summaries, options, max_depth), file_path, ext, dirreport.REPORT_HEADER)
+
+
+def write_duplicates(records, file_path, ext, options):
+	"""查找 records 中内容相同的文件并逐个列出，同一组的文件相邻，返回写入的行数；records 需要带有大小和修改时间"""
+	store = rowstore.RowStore(options)
+	workers = max(hashing.DEFAULT_WORKERS, options.workers)
+	if options.hash_cache_path:
+		with hashing.HashCache(options.hash_cache_path) as cache:
+			groups = hashing.find_duplicates(records, hashing.Hasher(cache), workers)
+	else:
+		groups = hashing.find_duplicates(records, hashing.Hasher(), workers)
+
+	def rows():
+		for number, group in enumerate(groups, 1):
+			store.clear()
+			store.extend(group.records)
+			size = format_file_size(group.size)
+			for index in range(len(store)):
+				yield [str(number), str(len(group.records)), size, str(group.size), group.digest, store.display_name(index)]
+
+	return _write_report(rows(), file_path, ext, DUPLICATE_HEADER)
+
+
+def export_duplicates(options, file_path, ext=None, stats=None):
+	"""无界面入口：按 ScanOptions 扫描并写出重复文件报告"""
+	if ext is None:
+		ext = detect_format(file_path)
+	options = options.replace(show_size=True, show_modify=True, show_hash=False, sort_key=None)
+	return write_duplicates(scanner.scan_records(options, stats), file_path, ext, options)
+
+
+def write_diff(changes, file_path, ext, time_format=None):
+	"""把 snapshot.diff 产出的变化写入文件，返回各类变化的数目"""
+	format_time = formatting.time_formatter(time_format or formatting.TIME_FORMAT)
+	counts = dict.fromkeys(snapshot.CHANGE_TITLES, 0)
+
+	def rows():
+		for change in changes:
+			counts[change.kind] += 1
+			old, new = change.old, change.new
+			yield [
+				snapshot.CHANGE_TITLES[change.kind],
+				change.path.replace('/', os.sep),
+				format_file_size(old.size) if old else '',
+				format_file_size(new.size) if new else '',
+				format_time(old.mtime) if old else '',
+				format_time(new.mtime) if new else '',
+			]
+
+	_write_report(rows(), file_path, ext, DIFF_HEADER)
+	return counts
+
+
+def export_file_list(options, file_path, ext=None, stats=None, raw=False):
+	"""无界面入口：按 ScanOptions 扫描并直接导出，ext 缺省时按文件后缀判断"""
+	if ext is None:
+		ext = detect_format(file_path)
+	if ext == snapshot.SNAPSHOT_EXT:
+		options = snapshot.snapshot_options(options)
+	return write_records(scanner.scan_records(options, stats), file_path, ext, options, raw=raw)
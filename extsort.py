@@ -0,0 +1,84 @@
+"""按名称、路径、大小或时间对扫描结果排序
+
+排序键使用 FileRecord 中的原始值：大小为字节数，时间为纪元秒，不比较格式化后的文本，既快又不会出现
+“9 KB”排在“10 KB”后面、不同时间格式顺序不同的问题。
+
+记录不超过 run_size 条时在内存中排序；超过时每 run_size 条排序后写入临时文件（一个有序段），
+最后用 heapq.merge 同时顺序读取所有有序段，逐条产出，内存中只有每个有序段当前的一块。
+有序段超过 MERGE_WIDTH 个时先把它们归并为一个，同时打开的临时文件不会太多。
+排序是稳定的：键相同的文件保持扫描时的顺序。
+"""
+import heapq
+import operator
+import pickle
+import tempfile
+from itertools import islice
+
+
+RUN_SIZE = 500000
+CHUNK_SIZE = 4096
+MERGE_WIDTH = 64
+
+SORT_KEYS = {
+	'name': operator.attrgetter('name'),
+	'path': operator.attrgetter('path'),
+	'size': operator.attrgetter('size'),
+	'mtime': operator.attrgetter('mtime'),
+	'ctime': operator.attrgetter('ctime'),
+	'atime': operator.attrgetter('atime'),
+}
+SORT_TITLES = {'name': '名称', 'path': '路径', 'size': '大小', 'mtime': '修改时间', 'ctime': '创建时间', 'atime': '访问时间'}
+# 需要 stat 才有值的排序键
+STAT_KEYS = frozenset(('size', 'mtime', 'ctime', 'atime'))
+
+
+def _write_run(records, temp_dir):
+	"""把有序的记录分块写入临时文件，返回已回到开头的文件"""
+	file = tempfile.TemporaryFile(prefix='filelister-sort-', dir=temp_dir)
+	iterator = iter(records)
+	while chunk := list(islice(iterator, CHUNK_SIZE)):
+		pickle.dump(chunk, file, pickle.HIGHEST_PROTOCOL)
+	file.seek(0)
+	return file
+
+
+def _read_run(file):
+	try:
+		while True:
+			try:
+				chunk = pickle.load(file)
+			except EOFError:
+				return
+			yield from chunk
+	finally:
+		file.close()
+
+
+def sort_records(records, key, reverse=False, run_size=RUN_SIZE, temp_dir=None):
+	"""按 SORT_KEYS 中的 key 排序 records，返回逐条产出的迭代器；key 未知时立即抛出 ValueError"""
+	if key not in SORT_KEYS:
+		raise ValueError(f'未知的排序方式: {key}')
+	return _sort(iter(records), SORT_KEYS[key], reverse, run_size, temp_dir)
+
+
+def _sort(iterator, key_func, reverse, run_size, temp_dir):
+	run = list(islice(iterator, run_size))
+	run.sort(key=key_func, reverse=reverse)
+	if len(run) < run_size:
+		# 全部在内存中，不需要临时文件
+		yield from run
+		return
+	runs = []
+	try:
+		while run:
+			runs.append(_write_run(run, temp_dir))
+			run = None
+			if len(runs) >= MERGE_WIDTH:
+				# 归并得到的有序段包含最早的记录，放在最前面，键相同时仍保持原来的顺序
+				runs = [_write_run(heapq.merge(*map(_read_run, runs), key=key_func, reverse=reverse), temp_dir)]
+			run = list(islice(iterator, run_size))
+			run.sort(key=key_func, reverse=reverse)
+		yield from heapq.merge(*map(_read_run, runs), key=key_func, reverse=reverse)
+	finally:
+		for file in runs:
+			file.close()
@@ -0,0 +1,149 @@
+"""命令行生成文件清单
+
+与界面使用同一套扫描、过滤和导出逻辑，但不导入 wx，适合在服务器或容器中定时运行。
+
+	python filelist_cli.py D:\\share -o share.csv --columns size,mtime --include pdf,docx
+	python filelist_cli.py D:\\share -o 0601.flsnap                        保存快照
+	python filelist_cli.py --diff 0601.flsnap 0701.flsnap -o changes.csv    比较两个快照
+	python filelist_cli.py /srv/share --remote fs1:7788 -o share.csv        由远程扫描端扫描，见 remote.py
+"""
+import argparse
+import os
+import re
+import sys
+
+import scanner
+import exporter
+import extsort
+import filterexpr
+import remote
+import snapshot
+from pathtrie import PathTrie
+
+
+ORDERS = {'root-first': 0, 'subfolders-first': 1, 'root-only': 2}
+NAME_FORMATS = {'name': 0, 'relative': 1, 'absolute': 2}
+COLUMNS = ('size', 'ctime', 'mtime', 'atime', 'hash')
+
+
+def _split_list(value):
+	return [t for t in re.split(r'[,; ]+', value.strip()) if t]
+
+
+def build_parser():
+	parser = argparse.ArgumentParser(description='生成指定目录的文件清单')
+	parser.add_argument('root', nargs='?', help='目标文件夹，使用 --diff 时不需要')
+	parser.add_argument('-o', '--output', required=True, help='输出文件，- 表示标准输出')
+	parser.add_argument('-f', '--format', choices=exporter.FORMATS, metavar='FORMAT',
+		help=f'输出格式，缺省按输出文件后缀判断：{", ".join(exporter.FORMATS)}；{snapshot.SNAPSHOT_EXT} 为快照')
+	parser.add_argument('--raw', action='store_true', help='csv/txt 中的大小写成字节数、时间写成纪元秒；jsonl、parquet、arrow 总是如此')
+	parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), help='比较两个快照，输出新增、删除、大小变化和修改的文件')
+	parser.add_argument('--order', choices=ORDERS, default='root-first', help='文件顺序')
+	parser.add_argument('--name', choices=NAME_FORMATS, default='name', help='文件名显示方式')
+	parser.add_argument('--sort', choices=extsort.SORT_KEYS, help='按名称、路径、大小或时间排序，缺省为扫描顺序；文件很多时使用临时文件排序')
+	parser.add_argument('--reverse', action='store_true', help='与 --sort 一起使用，从大到小排序')
+	types = parser.add_mutually_exclusive_group()
+	types.add_argument('--include', type=filterexpr.split_terms, default=[], metavar='EXPR', help='只包含满足过滤表达式的文件，' + filterexpr.SYNTAX_HELP)
+	types.add_argument('--exclude', type=filterexpr.split_terms, default=None, metavar='EXPR', help='排除满足过滤表达式的文件')
+	parser.add_argument('-c', '--columns', type=_split_list, default=[], help=f'属性列，逗号分隔，可选 {",".join(COLUMNS)}')
+	parser.add_argument('-t', '--time-format', default='local', metavar='FORMAT',
+		help='时间列格式：local（缺省）、iso、epoch，或 strftime 格式如 "%%Y/%%m/%%d %%H:%%M"')
+	parser.add_argument('--skip', action='append', default=[], metavar='DIR', help='排除的子文件夹，可重复；相对路径以 root 为基准')
+	parser.add_argument('--skip-from', metavar='FILE', help='从文件读取排除的子文件夹，每行一个')
+	parser.add_argument('-j', '--jobs', type=int, default=1, help='同时读取的目录数，网络共享上可设为 8~32')
+	parser.add_argument('--index', metavar='FILE', help='增量扫描索引文件，只重新读取修改时间变化了的文件夹')
+	parser.add_argument('--report', choices=('files', 'dirs', 'dupes'), default='files',
+		help='files 逐个列出文件（缺省），dirs 按文件夹汇总文件数和大小，类似 du，dupes 列出内容相同的文件')
+	parser.add_argument('--report-depth', type=int, metavar='N', help='按文件夹汇总时只输出前 N 层文件夹，根目录为 0')
+	parser.add_argument('--hash-cache', metavar='FILE', help='内容哈希的缓存文件，未变化的文件不再重新计算哈希')
+	parser.add_argument('--remote', action='append', default=[], metavar='ADDR',
+		help='由远程扫描端扫描，host:port 或 unix:路径，可重复；写成 ADDR=DIR 时扫描端扫描对方机器上的 DIR')
+	parser.add_argument('-q', '--quiet', action='store_true', help='不输出统计信息')
+	return parser
+
+
+def options_from_args(args):
+	"""把命令行参数转换为 scanner.ScanOptions"""
+	# 远程扫描时 root 是扫描端机器上的路径，保持原样
+	root = args.root if args.remote else os.path.abspath(args.root)
+	unknown = set(args.columns) - set(COLUMNS)
+	if unknown:
+		raise ValueError(f'未知的属性列: {",".join(sorted(unknown))}')
+	excluded = PathTrie(os.path.join(root, path) for path in args.skip)
+	if args.skip_from:
+		excluded.load(args.skip_from, root=root)
+	return scanner.ScanOptions(
+		root,
+		priority=ORDERS[args.order],
+		file_format=NAME_FORMATS[args.name],
+		include_types=args.exclude is None,
+		type_filter=args.include if args.exclude is None else args.exclude,
+		show_size='size' in args.columns,
+		show_create='ctime' in args.columns,
+		show_modify='mtime' in args.columns,
+		show_access='atime' in args.columns,
+		show_hash='hash' in args.columns,
+		hash_cache_path=args.hash_cache,
+		excluded=excluded,
+		workers=max(1, args.jobs),
+		index_path=args.index,
+		time_format=args.time_format,
+		remote=[remote.parse_remote(address) for address in args.remote],
+		sort_key=args.sort,
+		sort_reverse=args.reverse,
+	)
+
+
+def main(argv=None):
+	parser = build_parser()
+	args = parser.parse_args(argv)
+	ext = args.format or exporter.detect_format(args.output)
+	if args.diff:
+		return diff_main(args, ext)
+	if args.root is None:
+		parser.error('需要指定目标文件夹')
+	if not args.remote and not os.path.isdir(args.root):
+		parser.error(f'文件夹不存在: {args.root}')
+	if args.remote and args.report == 'dupes':
+		parser.error('查找重复文件需要读取文件内容，不能使用 --remote')
+	try:
+		options = options_from_args(args)
+	except (ValueError, OSError) as e:
+		parser.error(str(e))
+
+	stats = scanner.ScanStats()
+	try:
+		if args.report == 'dirs':
+			count = exporter.write_dir_report(options, args.output, ext, args.report_depth, stats)
+		elif args.report == 'dupes':
+			count = exporter.export_duplicates(options, args.output, ext, stats)
+		else:
+			count = exporter.export_file_list(options, args.output, ext, stats, raw=args.raw)
+	except (OSError, ValueError) as e:
+		# 例如远程扫描端中途出错：不留下不完整的文件，定时任务重新运行即可
+		if args.output != '-' and os.path.exists(args.output):
+			os.remove(args.output)
+		print(f'导出失败: {e}', file=sys.stderr)
+		return 1
+	if not args.quiet:
+		noun = {'dirs': '行文件夹汇总', 'dupes': '个重复文件'}.get(args.report, '个文件')
+		print(f'{count} {noun}，{stats.dirs} 个文件夹，用时 {stats.elapsed():.1f} 秒'
+			f'（预筛选省去 {stats.stats_saved} 次 stat）', file=sys.stderr)
+		if stats.vanished:
+			print(f'{stats.vanished} 个文件在扫描过程中被删除，未列出', file=sys.stderr)
+	return 0
+
+
+def diff_main(args, ext):
+	try:
+		counts = exporter.write_diff(snapshot.diff_files(*args.diff), args.output, ext, args.time_format)
+	except (OSError, ValueError) as e:
+		print(f'比较失败: {e}', file=sys.stderr)
+		return 1
+	if not args.quiet:
+		print('，'.join(f'{snapshot.CHANGE_TITLES[kind]} {count}' for kind, count in counts.items()), file=sys.stderr)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,151 @@
+"""文件过滤表达式
+
+“文件类型”输入框中的每一项可以是：
+	pdf 或 .pdf           扩展名，不区分大小写
+	*.tmp、IMG_????.jpg   通配符，匹配文件名，不区分大小写
+	re:^IMG_\\d+          正则表达式，在文件名中查找
+	size>10M、size<=1G    文件大小，单位 K/M/G/T（1024 进制）
+	mtime>2024-01-01      修改时间晚于某日，时间可写作 2024-01-01T08:30
+	ctime<30d             创建时间早于 30 天前，也可用 h 表示小时
+	depth<=2              子文件夹层数，根目录下的文件为 0
+各项以逗号、分号或空格分隔，含空格的项可以用双引号括起来。
+扩展名、通配符和正则之间是“或”的关系，大小、时间和层数条件之间是“且”的关系，两组再取“且”。
+选择“排除的文件类型”时排除满足整个表达式的文件。
+
+表达式只编译一次：只看文件名和层数的检查在 stat 之前执行，需要大小或时间的检查在 stat 之后执行。
+"""
+import fnmatch
+import operator
+import os
+import re
+import time
+from datetime import datetime
+
+
+SYNTAX_HELP = ('可填写扩展名(pdf)、通配符(*.tmp)、正则(re:^IMG_\\d+)、'
+	'大小(size>10M)、时间(mtime>2024-01-01, ctime<30d)、层数(depth<=2)，以逗号或空格分隔')
+
+_TERM = re.compile(r'"([^"]*)"|([^,;\s]+)')
+_CONDITION = re.compile(r'^(size|mtime|ctime|depth)(<=|>=|<|>|=)(.+)$', re.IGNORECASE)
+_OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '=': operator.eq}
+_SIZE_UNITS = {'': 1, 'B': 1, 'K': 1 << 10, 'KB': 1 << 10, 'M': 1 << 20, 'MB': 1 << 20,
+	'G': 1 << 30, 'GB': 1 << 30, 'T': 1 << 40, 'TB': 1 << 40}
+_GLOB_CHARS = set('*?[')
+
+
+def split_terms(text):
+	"""把输入框的内容拆分为表达式项"""
+	return [quoted or plain for quoted, plain in _TERM.findall(text) if quoted or plain]
+
+
+def _parse_size(value):
+	m = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([A-Za-z]*)', value)
+	if not m or m.group(2).upper() not in _SIZE_UNITS:
+		raise ValueError(f'无法识别的大小: {value}')
+	return float(m.group(1)) * _SIZE_UNITS[m.group(2).upper()]
+
+
+def _parse_time(value, now):
+	m = re.fullmatch(r'(\d+(?:\.\d+)?)([dh])', value, re.IGNORECASE)
+	if m:
+		unit = 86400 if m.group(2).lower() == 'd' else 3600
+		return now - float(m.group(1)) * unit
+	try:
+		return datetime.fromisoformat(value).timestamp()
+	except ValueError:
+		raise ValueError(f'无法识别的时间: {value}') from None
+
+
+class FileFilter:
+	"""编译后的过滤器
+
+	accept_name(name, depth) 在 stat 之前调用；needs_stat 为 True 时，
+	对通过的文件再调用 accept_record(record, depth)。max_depth 不为 None 时可以据此剪掉更深的子文件夹。
+	"""
+	def __init__(self, name_pred=None, stat_pred=None, max_depth=None):
+		self._name_pred = name_pred
+		self._stat_pred = stat_pred
+		self.max_depth = max_depth
+
+	@property
+	def needs_name(self):
+		return self._name_pred is not None
+
+	@property
+	def needs_stat(self):
+		return self._stat_pred is not None
+
+	def accept_name(self, name, depth):
+		return self._name_pred is None or self._name_pred(name, depth)
+
+	def accept_record(self, record, depth):
+		return self._stat_pred is None or self._stat_pred(record, depth)
+
+
+def compile_filter(terms, include=True, now=None):
+	"""把表达式项编译为 FileFilter，表达式有误时抛出 ValueError"""
+	if now is None:
+		now = time.time()
+	extensions = set()
+	globs = []
+	regexes = []
+	depth_checks = []
+	stat_checks = []
+	for term in terms:
+		m = _CONDITION.match(term)
+		if m:
+			field, op, value = m.group(1).lower(), _OPERATORS[m.group(2)], m.group(3)
+			if field == 'depth':
+				if not value.isdigit():
+					raise ValueError(f'无法识别的层数: {value}')
+				depth_checks.append((op, int(value)))
+			elif field == 'size':
+				stat_checks.append(('size', op, _parse_size(value)))
+			else:
+				stat_checks.append((field, op, _parse_time(value, now)))
+		elif term[:3].lower() == 're:':
+			try:
+				regexes.append(re.compile(term[3:]))
+			except re.error as e:
+				raise ValueError(f'正则表达式有误: {term[3:]} ({e})') from None
+		elif _GLOB_CHARS & set(term):
+			globs.append(f'(?i:{fnmatch.translate(term)})')
+		else:
+			extensions.add(term.lstrip('.').lower())
+
+	glob_match = re.compile('|'.join(globs)).match if globs else None
+	regex_searches = [regex.search for regex in regexes]
+	has_patterns = bool(extensions or glob_match or regex_searches)
+
+	def name_matches(name):
+		if extensions and os.path.splitext(name)[1].lstrip('.').lower() in extensions:
+			return True
+		if glob_match is not None and glob_match(name):
+			return True
+		return any(search(name) for search in regex_searches)
+
+	def depth_matches(depth):
+		return all(op(depth, value) for op, value in depth_checks)
+
+	def stat_matches(record):
+		return all(op(getattr(record, field), value) for field, op, value in stat_checks)
+
+	if not has_patterns and not depth_checks and not stat_checks:
+		return FileFilter()
+
+	def name_part(name, depth):
+		return (not has_patterns or name_matches(name)) and depth_matches(depth)
+
+	if include:
+		max_depth = None
+		for op, value in depth_checks:
+			if op in (operator.lt, operator.le, operator.eq):
+				limit = value - 1 if op is operator.lt else value
+				max_depth = limit if max_depth is None else min(max_depth, limit)
+		stat_pred = (lambda record, depth: stat_matches(record)) if stat_checks else None
+		return FileFilter(name_part, stat_pred, max_depth)
+
+	# 排除模式：只有名称条件时在 stat 前就能决定，否则要等 stat 之后
+	if not stat_checks:
+		return FileFilter(lambda name, depth: not name_part(name, depth))
+	return FileFilter(None, lambda record, depth: not (name_part(record.name, depth) and stat_matches(record)))
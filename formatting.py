@@ -0,0 +1,255 @@
+"""文件大小和时间的格式化
+
+优先使用随 Windows 版发布的 formatter.pyd / formatter_64.pyd；找不到时（例如在 Linux 上）
+退回到纯 Python 实现，程序照常可以导入和运行。
+format_file_sizes / format_times 一次格式化一整列，省去逐个调用的开销。
+时间由 TimeFormatter 格式化：日期部分按天缓存，时分秒按当天的秒数直接算出，
+输出格式可以是本地时间、ISO-8601、纪元秒或自定义的 strftime 格式，格式只在构造时解析一次。
+
+	python formatting.py    对比逐个调用与批量调用的耗时
+"""
+import math
+import platform
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+try:
+	if platform.architecture()[0] == '32bit':
+		import formatter as _native
+	else:
+		import formatter_64 as _native
+	if not hasattr(_native, 'format_file_size'):
+		# 旧版 Python 标准库里也有一个 formatter 模块
+		_native = None
+except ImportError:
+	_native = None
+
+
+# 与 formatter.pyd 相同，最大的单位是 TB
+UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+_SCALES = [float(1 << (10 * i)) for i in range(len(UNITS))]
+_SUFFIXES = [' ' + unit for unit in UNITS]
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# 时间格式的名称，epoch 输出整数纪元秒
+TIME_FORMATS = {'local': TIME_FORMAT, 'iso': '%Y-%m-%dT%H:%M:%S', 'epoch': None}
+
+
+def _format_file_size(size):
+	"""纯 Python 实现，输出与 formatter.pyd 相同：一律保留两位小数，如 512.00 B、1.50 MB"""
+	# 按二进制位数直接确定单位，除以 1024 的整数次幂与逐次除以 1024 结果相同
+	unit = min(max(size.bit_length() - 1, 0) // 10, len(UNITS) - 1)
+	return f'{size / _SCALES[unit]:.2f}{_SUFFIXES[unit]}'
+
+
+format_file_size = _native.format_file_size if _native is not None else _format_file_size
+
+
+def _format_file_sizes_numpy(sizes):
+	"""用 NumPy 计算单位和缩放后的值，字符串仍逐个生成（np.char 逐元素调用，反而更慢）；没有 NumPy 时抛出 ImportError"""
+	# 只在批量格式化较多的大小时才用到，不拖慢启动
+	import numpy as np
+	values = np.asarray(sizes, dtype=np.int64)
+	if values.size == 0:
+		return []
+	units = np.zeros(values.shape, dtype=np.int64)
+	large = values >= 1024
+	units[large] = np.minimum((np.frexp(values[large].astype(np.float64))[1] - 1) // 10, len(UNITS) - 1)
+	# 转成浮点数时可能进位到下一个 1024 的整数次幂，按整数阈值校正
+	thresholds = np.array([1 << (10 * i) for i in range(len(UNITS))], dtype=np.int64)
+	units -= (values < thresholds[units]) & (units > 0)
+	scaled = (values / thresholds[units]).tolist()
+	suffixes = _SUFFIXES
+	return [f'{value:.2f}{suffixes[unit]}' for unit, value in zip(units.tolist(), scaled)]
+
+
+def format_file_sizes(sizes):
+	"""批量格式化一列文件大小，结果与逐个调用 format_file_size 相同"""
+	if _native is not None:
+		return [_native.format_file_size(size) for size in sizes]
+	if len(sizes) >= 1024:
+		try:
+			return _format_file_sizes_numpy(sizes)
+		except ImportError:
+			pass
+	return [_format_file_size(size) for size in sizes]
+
+
+# 只与日期有关的 strftime 指令，在一天之内保持不变
+_DAY_DIRECTIVES = set('aAbBCdDeFgGhjmuUVwWyY')
+_TIME_FIELDS = 'HMS'
+# 时分秒在按天的模板中的占位符，取 Unicode 私用区字符，不会与 strftime 的输出混淆
+_FIELD_MARK = '\ue000'
+_TWO_DIGITS = [f'{i:02d}' for i in range(60)]
+_EPOCH_DATE = datetime(1970, 1, 1)
+_MISSING = object()
+
+
+def _compile_pattern(pattern):
+	"""把 strftime 格式编译为 (按天使用的模板, 时分秒字段的顺序)
+
+	模板中的 %H %M %S 换成占位符，其余指令留给 strftime 按天求值；
+	含有其他指令（如 %I %p %f %z）时返回 None，只能逐个调用 strftime。
+	"""
+	parts = []
+	fields = []
+	i = 0
+	while i < len(pattern):
+		char = pattern[i]
+		if char != '%':
+			parts.append(char)
+			i += 1
+			continue
+		directive = pattern[i + 1:i + 2]
+		if directive and directive in _TIME_FIELDS:
+			parts.append(_FIELD_MARK)
+			fields.append(directive)
+		elif directive == '%' or directive in _DAY_DIRECTIVES:
+			parts.append('%' + directive)
+		else:
+			return None
+		i += 2
+	return ''.join(parts), tuple(fields)
+
+
+class TimeFormatter:
+	"""把时间戳格式化为本地时间字符串
+
+	pattern 可以是 TIME_FORMATS 中的名称，也可以是 strftime 格式。
+	只含日期指令和 %H %M %S 时，日期部分按本地日期缓存，时分秒由当天的秒数算出；
+	遇到夏令时切换的那一天或其他指令时退回 datetime.strftime，结果不变。
+	"""
+	def __init__(self, pattern=TIME_FORMAT):
+		if not pattern:
+			raise ValueError('时间格式不能为空')
+		self.pattern = TIME_FORMATS.get(pattern, pattern)
+		compiled = _compile_pattern(self.pattern) if self.pattern is not None else None
+		self._template, self._fields = compiled or (None, ())
+		self._hms = self._fields == ('H', 'M', 'S')
+		self._offsets = {}
+		self._days = {}
+
+	def _Offset(self, utc_day):
+		"""UTC 日序号当天的 UTC 偏移（秒），当天偏移有变化时返回 None"""
+		start = utc_day * 86400
+		try:
+			offset = time.localtime(start).tm_gmtoff
+			if time.localtime(start + 86399).tm_gmtoff != offset:
+				offset = None
+		except (OverflowError, OSError, ValueError):
+			offset = None
+		self._offsets[utc_day] = offset
+		return offset
+
+	def _Day(self, local_day):
+		"""本地日序号当天的模板，按占位符切开"""
+		chunks = self._days[local_day] = tuple((_EPOCH_DATE + timedelta(days=local_day)).strftime(self._template).split(_FIELD_MARK))
+		return chunks
+
+	def _Join(self, chunks, rest):
+		if self._hms:
+			return f'{chunks[0]}{_TWO_DIGITS[rest // 3600]}{chunks[1]}{_TWO_DIGITS[rest // 60 % 60]}{chunks[2]}{_TWO_DIGITS[rest % 60]}{chunks[3]}'
+		values = {'H': _TWO_DIGITS[rest // 3600], 'M': _TWO_DIGITS[rest // 60 % 60], 'S': _TWO_DIGITS[rest % 60]}
+		parts = [chunks[0]]
+		for field, chunk in zip(self._fields, chunks[1:]):
+			parts += (values[field], chunk)
+		return ''.join(parts)
+
+	def _Strftime(self, timestamp):
+		return datetime.fromtimestamp(timestamp).strftime(self.pattern)
+
+	def __call__(self, timestamp):
+		if self.pattern is None:
+			return str(math.floor(timestamp))
+		if self._template is None:
+			return self._Strftime(timestamp)
+		second = math.floor(timestamp)
+		utc_day = second // 86400
+		offset = self._offsets.get(utc_day, _MISSING)
+		if offset is _MISSING:
+			offset = self._Offset(utc_day)
+		if offset is None:
+			return self._Strftime(timestamp)
+		local_day, rest = divmod(second + offset, 86400)
+		return self._Join(self._days.get(local_day) or self._Day(local_day), rest)
+
+	def format_many(self, timestamps):
+		"""批量格式化一列时间戳，结果与逐个调用相同"""
+		if self.pattern is None:
+			return [str(math.floor(timestamp)) for timestamp in timestamps]
+		if self._template is None:
+			return [self._Strftime(timestamp) for timestamp in timestamps]
+		offsets, days, two, hms, join, floor = self._offsets, self._days, _TWO_DIGITS, self._hms, self._Join, math.floor
+		result = []
+		append = result.append
+		for timestamp in timestamps:
+			second = floor(timestamp)
+			offset = offsets.get(second // 86400, _MISSING)
+			if offset is _MISSING:
+				offset = self._Offset(second // 86400)
+			if offset is None:
+				append(self._Strftime(timestamp))
+				continue
+			local_day, rest = divmod(second + offset, 86400)
+			c = days.get(local_day) or self._Day(local_day)
+			if hms:
+				append(f'{c[0]}{two[rest // 3600]}{c[1]}{two[rest // 60 % 60]}{c[2]}{two[rest % 60]}{c[3]}')
+			else:
+				append(join(c, rest))
+		return result
+
+
+@lru_cache(maxsize=None)
+def time_formatter(pattern=TIME_FORMAT):
+	"""按格式共享 TimeFormatter，同一格式的日期缓存在各处复用"""
+	return TimeFormatter(pattern)
+
+
+def format_time(timestamp):
+	return time_formatter()(timestamp)
+
+
+def format_times(timestamps):
+	return time_formatter().format_many(timestamps)
+
+
+def benchmark(count=200000):
+	"""对比逐个调用与批量调用格式化 count 个随机大小和时间的耗时
+
+	time: repeated 中每个时间平均出现 20 次，time: unique 几乎没有重复；
+	两者都分布在 90 天之内，日期缓存都能命中。
+	"""
+	import random
+	import time
+	from array import array
+
+	sizes = array('q', (int(random.lognormvariate(10, 4)) for _ in range(count)))
+	now = time.time()
+	unique_times = array('d', (now - random.random() * 86400 * 90 for _ in range(count)))
+	pool = unique_times[:max(1, count // 20)]
+	repeated_times = array('d', (random.choice(pool) for _ in range(count)))
+	results = {}
+
+	def measure(name, func):
+		start = time.perf_counter()
+		func()
+		results[name] = time.perf_counter() - start
+
+	measure('size: per-call', lambda: [format_file_size(size) for size in sizes])
+	measure('size: batch', lambda: format_file_sizes(sizes))
+	for label, times in (('unique', unique_times), ('repeated', repeated_times)):
+		formatter = TimeFormatter()
+		measure(f'time: {label} strftime', lambda: [datetime.fromtimestamp(t).strftime(TIME_FORMAT) for t in times])
+		measure(f'time: {label} per-call', lambda: [formatter(t) for t in times])
+		measure(f'time: {label} batch', lambda: TimeFormatter().format_many(times))
+	return results
+
+
+if __name__ == '__main__':
+	try:
+		import numpy
+	except ImportError:
+		numpy = None
+	print(f'native extension: {"yes" if _native is not None else "no"}, numpy: {"yes" if numpy is not None else "no"}')
+	for name, seconds in benchmark().items():
+		print(f'{name:<26}{seconds:8.3f} s')
@@ -0,0 +1,204 @@
+"""文件内容哈希和重复文件查找
+
+查找重复文件分三步，每一步只处理上一步留下的候选：
+	1. 按大小分组，大小唯一的文件不可能重复；
+	2. 对同样大小的文件计算首尾两块的部分哈希；
+	3. 部分哈希也相同的文件才计算完整哈希。
+读文件在线程池中进行（hashlib 计算时释放 GIL），大文件使用 mmap。只读取普通文件，FIFO、设备等没有哈希。
+哈希可以按 (路径, 大小, 修改时间) 缓存在 SQLite 中，再次运行时不再读取未变化的文件。
+哈希算法为 SHA-256，与 sha256sum 等工具的结果一致。
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+import stat
+import threading
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+HASH_NAME = 'sha256'
+PARTIAL_BLOCK = 64 * 1024
+READ_SIZE = 1 << 20
+MMAP_THRESHOLD = 64 << 20
+DEFAULT_WORKERS = 4
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.filelister', 'hash_cache.sqlite')
+COMMIT_EVERY = 500
+
+DuplicateGroup = namedtuple('DuplicateGroup', ['size', 'digest', 'records'])
+# 以非阻塞方式打开，FIFO 没有写入方时 open 也会立即返回，随后按文件类型拒绝
+_OPEN_FLAGS = os.O_RDONLY | getattr(os, 'O_NONBLOCK', 0) | getattr(os, 'O_BINARY', 0)
+
+
+def _open_regular(path):
+	"""打开普通文件用于读取，不是普通文件时抛出 OSError"""
+	fd = os.open(path, _OPEN_FLAGS)
+	try:
+		if not stat.S_ISREG(os.fstat(fd).st_mode):
+			raise OSError(f'不是普通文件: {path}')
+	except BaseException:
+		os.close(fd)
+		raise
+	return open(fd, 'rb', buffering=0)
+
+
+def full_hash(path):
+	"""整个文件的哈希（十六进制），超过 MMAP_THRESHOLD 的文件使用 mmap 读取；不是普通文件时抛出 OSError"""
+	digest = hashlib.new(HASH_NAME)
+	with _open_regular(path) as file:
+		if os.fstat(file.fileno()).st_size >= MMAP_THRESHOLD:
+			try:
+				with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+					digest.update(view)
+				return digest.hexdigest()
+			except (OSError, ValueError, OverflowError):
+				# 32 位进程的地址空间不足等情况，退回到逐块读取
+				digest = hashlib.new(HASH_NAME)
+				file.seek(0)
+		buffer = bytearray(READ_SIZE)
+		view = memoryview(buffer)
+		while count := file.readinto(buffer):
+			digest.update(view[:count])
+	return digest.hexdigest()
+
+
+def partial_hash(path, size):
+	"""首尾各 PARTIAL_BLOCK 字节的哈希；文件不超过两块时等于 full_hash"""
+	if size <= 2 * PARTIAL_BLOCK:
+		return full_hash(path)
+	digest = hashlib.new(HASH_NAME)
+	with _open_regular(path) as file:
+		digest.update(file.read(PARTIAL_BLOCK))
+		file.seek(size - PARTIAL_BLOCK)
+		digest.update(file.read(PARTIAL_BLOCK))
+	return digest.hexdigest()
+
+
+class HashCache:
+	"""以路径为键保存部分哈希和完整哈希，大小或修改时间变化后自动失效，线程安全"""
+	def __init__(self, cache_path):
+		folder = os.path.dirname(cache_path)
+		if folder:
+			os.makedirs(folder, exist_ok=True)
+		self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self.conn.execute('CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, partial TEXT, full TEXT)')
+		self.lock = threading.Lock()
+		self._uncommitted = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		with self.lock:
+			self.conn.commit()
+			self.conn.close()
+
+	def get(self, record):
+		"""返回 (部分哈希, 完整哈希)，没有缓存或文件已变化时为 (None, None)"""
+		with self.lock:
+			row = self.conn.execute('SELECT size, mtime, partial, full FROM hashes WHERE path = ?', (record.path,)).fetchone()
+		if row is None or row[0] != record.size or row[1] != record.mtime:
+			return None, None
+		return row[2], row[3]
+
+	def put(self, record, partial, full):
+		with self.lock:
+			self.conn.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)', (record.path, record.size, record.mtime, partial, full))
+			self._uncommitted += 1
+			if self._uncommitted >= COMMIT_EVERY:
+				self.conn.commit()
+				self._uncommitted = 0
+
+
+class Hasher:
+	"""计算 FileRecord 的部分哈希和完整哈希，cache 为 HashCache 或 None；无法读取的文件返回 None"""
+	def __init__(self, cache=None):
+		self.cache = cache
+		self.hashed_bytes = 0
+		self.cache_hits = 0
+
+	def partial(self, record):
+		return self._Hash(record, False)
+
+	def full(self, record):
+		return self._Hash(record, True)
+
+	def _Hash(self, record, full):
+		partial = digest = None
+		if self.cache is not None:
+			partial, digest = self.cache.get(record)
+			if (digest if full else partial) is not None:
+				self.cache_hits += 1
+				return digest if full else partial
+		try:
+			if full or record.size <= 2 * PARTIAL_BLOCK:
+				digest = full_hash(record.path)
+				self.hashed_bytes += record.size
+				if record.size <= 2 * PARTIAL_BLOCK:
+					partial = digest
+			else:
+				partial = partial_hash(record.path, record.size)
+				self.hashed_bytes += 2 * PARTIAL_BLOCK
+		except OSError:
+			return None
+		if self.cache is not None:
+			self.cache.put(record, partial, digest)
+		return digest if full else partial
+
+
+def hash_records(records, hasher, workers=DEFAULT_WORKERS):
+	"""给每个 FileRecord 填上 hash 字段（无法读取时为空字符串），顺序不变
+
+	最多同时有 workers * 4 个文件在排队，不会因为哈希较慢而积压整个清单。
+	"""
+	pool = ThreadPoolExecutor(workers)
+	pending = deque()
+	try:
+		for record in records:
+			pending.append((record, pool.submit(hasher.full, record)))
+			if len(pending) >= workers * 4:
+				record, future = pending.popleft()
+				yield record._replace(hash=future.result() or '')
+		while pending:
+			record, future = pending.popleft()
+			yield record._replace(hash=future.result() or '')
+	finally:
+		for record, future in pending:
+			future.cancel()
+		pool.shutdown()
+
+
+def _regroup(groups, hash_func, pool):
+	"""按 hash_func 的结果把每组再细分，只保留仍有两个以上文件的组"""
+	records = [record for group in groups for record in group]
+	buckets = defaultdict(list)
+	for record, digest in zip(records, pool.map(hash_func, records)):
+		if digest is not None:
+			buckets[record.size, digest].append(record)
+	return [DuplicateGroup(size, digest, group) for (size, digest), group in buckets.items() if len(group) > 1]
+
+
+def find_duplicates(records, hasher, workers=DEFAULT_WORKERS, min_size=1):
+	"""返回内容相同的文件组，按可节省的空间从大到小排序
+
+	需要记住所有不小于 min_size 的文件才能按大小分组，内存与文件数成正比；空文件缺省不参与比较。
+	"""
+	by_size = defaultdict(list)
+	for record in records:
+		if record.size >= min_size:
+			by_size[record.size].append(record)
+	candidates = [group for group in by_size.values() if len(group) > 1]
+	del by_size
+
+	with ThreadPoolExecutor(workers) as pool:
+		groups = _regroup(candidates, hasher.partial, pool)
+		# 不超过两块的文件，部分哈希就是完整哈希
+		done = [group for group in groups if group.size <= 2 * PARTIAL_BLOCK]
+		done += _regroup([group.records for group in groups if group.size > 2 * PARTIAL_BLOCK], hasher.full, pool)
+	done.sort(key=lambda group: group.size * (len(group.records) - 1), reverse=True)
+	return done
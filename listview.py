@@ -0,0 +1,105 @@
+"""文件清单的虚拟列表控件
+
+只为屏幕上可见的行取文本，不论清单有多少行，打开窗口的耗时都一样。
+设置了 limit 时只预览前 limit 行，末尾加一行说明未显示的文件数和合计，排序也只对预览的行进行。
+"""
+import wx
+
+from rowstore import format_size
+
+
+class FileListView(wx.ListCtrl):
+	"""LC_VIRTUAL 模式的报表列表，直接读取 rowstore.RowStore，支持点击列头排序"""
+	def __init__(self, *args, **kwds):
+		kwds["style"] = kwds.get("style", 0) | wx.LC_REPORT | wx.LC_VIRTUAL
+		super().__init__(*args, **kwds)
+		self.rows = []
+		self.order = None  # 排序后的行号，None 表示原始顺序
+		self.sort_column = -1
+		self.sort_ascending = True
+		self.limit = None
+		self._summary = None  # (行数, 说明文字)
+		self._summary_attr = wx.ItemAttr()
+		self._summary_attr.SetTextColour(wx.SystemSettings.GetColour(wx.SYS_COLOUR_GRAYTEXT))
+		self.Bind(wx.EVT_LIST_COL_CLICK, self.OnColClick)
+
+	def SetSource(self, header, rows, limit=None):
+		"""设置列头和行数据，rows 为 RowStore，只被引用，不会复制；limit 为预览的最多行数"""
+		self.ClearAll()
+		for col, title in enumerate(header):
+			self.InsertColumn(col, title, width=400 if col == 0 else 160)
+		self.rows = rows
+		self.limit = limit
+		self._summary = None
+		self.order = None
+		self.sort_column = -1
+		self.RefreshRows()
+
+	def RefreshRows(self):
+		"""行数据增加后调用，只更新行数"""
+		shown = self.ShownCount()
+		if self.order is not None and len(self.order) < shown:
+			# 新到的行追加在末尾，之前的排序不再完整
+			self.order.extend(range(len(self.order), shown))
+			self.RemoveSortIndicator()
+			self.sort_column = -1
+		self.SetItemCount(shown + self.IsTruncated())
+		self.Refresh()
+
+	def ResetRows(self):
+		"""行被去掉或替换后调用：行号已经改变，按原来的列重新排序"""
+		self._summary = None
+		if self.sort_column >= 0:
+			self.order = sorted(range(self.ShownCount()), key=self.rows.sort_key(self.sort_column), reverse=not self.sort_ascending)
+		else:
+			self.order = None
+		self.SetItemCount(self.ShownCount() + self.IsTruncated())
+		self.Refresh()
+
+	def ShownCount(self):
+		"""预览的行数，不含末尾的说明行"""
+		return len(self.rows) if self.limit is None else min(len(self.rows), self.limit)
+
+	def IsTruncated(self):
+		return self.limit is not None and len(self.rows) > self.limit
+
+	def GetSelectedRows(self):
+		"""选中的行在 RowStore 中的行号，按显示顺序，不含说明行"""
+		shown = self.ShownCount()
+		selected = []
+		item = self.GetFirstSelected()
+		while item != -1 and item < shown:
+			selected.append(self.order[item] if self.order is not None else item)
+			item = self.GetNextSelected(item)
+		return selected
+
+	def _SummaryText(self):
+		# 扫描过程中行数不断增加，按行数缓存，重绘时不必每次重新合计
+		count = len(self.rows)
+		if self._summary is None or self._summary[0] != count:
+			text = f'…… 仅预览前 {self.limit} 行，另有 {count - self.limit} 个文件未显示；共 {count} 个文件'
+			if 'size' in self.rows.columns:
+				text += f'，合计 {format_size(self.rows.total_size())}'
+			self._summary = (count, text + '。复制和保存包含全部文件')
+		return self._summary[1]
+
+	def OnGetItemText(self, item, col):
+		if item >= self.ShownCount():
+			return self._SummaryText() if col == 0 else ''
+		if self.order is not None:
+			item = self.order[item]
+		return self.rows.cell(item, col)
+
+	def OnGetItemAttr(self, item):
+		return self._summary_attr if item >= self.ShownCount() else None
+
+	def OnColClick(self, evt):
+		col = evt.GetColumn()
+		if col < 0:
+			return
+		self.sort_ascending = not self.sort_ascending if col == self.sort_column else True
+		self.sort_column = col
+		# 按原始数值排序，而不是格式化后的字符串
+		self.order = sorted(range(self.ShownCount()), key=self.rows.sort_key(col), reverse=not self.sort_ascending)
+		self.ShowSortIndicator(col, self.sort_ascending)
+		self.Refresh()
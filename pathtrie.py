@@ -0,0 +1,63 @@
+"""按路径分量组织的前缀树，用于保存排除的子文件夹
+
+判断一个路径是否位于某个排除的子树下只需要沿路径分量走一遍，耗时 O(深度)，
+与排除项的数量无关；并且按完整分量匹配，/a/foo 不会误伤 /a/foobar。
+"""
+import os
+
+
+_END = object()
+
+
+def _parts(path):
+	return os.path.normcase(os.path.normpath(path)).split(os.sep)
+
+
+class PathTrie:
+	"""排除的子树集合，支持 add、in（路径本身或其任一上级被排除）和从文件导入"""
+	def __init__(self, paths=()):
+		self.root = {}
+		self._count = 0
+		for path in paths:
+			self.add(path)
+
+	def add(self, path):
+		node = self.root
+		for part in _parts(path):
+			node = node.setdefault(part, {})
+		if _END not in node:
+			node[_END] = path
+			self._count += 1
+
+	def covers(self, path):
+		"""path 本身或它的某个上级目录是否被排除"""
+		node = self.root
+		for part in _parts(path):
+			node = node.get(part)
+			if node is None:
+				return False
+			if _END in node:
+				return True
+		return False
+
+	__contains__ = covers
+
+	def __len__(self):
+		return self._count
+
+	def __iter__(self):
+		stack = [self.root]
+		while stack:
+			node = stack.pop()
+			if _END in node:
+				yield node[_END]
+			stack.extend(child for key, child in node.items() if key is not _END)
+
+	def load(self, file_path, root=''):
+		"""从文本文件导入排除项，每行一个路径；空行和 # 开头的行忽略，相对路径以 root 为基准"""
+		with open(file_path, encoding='utf-8-sig') as file:
+			for line in file:
+				line = line.strip()
+				if line and not line.startswith('#'):
+					self.add(os.path.join(root, line))
+		return self
@@ -0,0 +1,538 @@
+"""分布式扫描：扫描端在数据所在的机器上运行，把文件记录分批发送给汇总端
+
+	python remote.py --listen 0.0.0.0:7788 --allow /srv/share     在文件服务器上启动扫描端
+	python remote.py --listen unix:/run/filelister.sock --allow /data
+	python filelist_cli.py /srv/share --remote fs1:7788 -o share.csv 汇总端
+
+汇总端（filelist_cli.py 的 --remote 或界面中的“远程扫描端”）把扫描设置发给各个扫描端，按顺序接收记录，
+之后的格式化、显示和导出与本地扫描相同。扫描端的地址为 host:port 或 unix:路径，
+可以写成 地址=目录，指定这个扫描端扫描的目录（扫描端机器上的路径）：
+	没有指定目录时各扫描端扫描同一个目标文件夹，汇总端按一级子文件夹把它分给各个扫描端，
+	适合在同一台服务器或本机上启动多个扫描端；
+	指定了目录时每个扫描端扫描各自的目录，结果按地址的顺序前后相接，这时文件名建议使用绝对路径。
+
+协议：每帧为 1 字节类型 + 4 字节长度 + 内容。
+	汇总端 -> 扫描端：b'J' 扫描任务（JSON），b'L' 列出子文件夹（JSON）
+	扫描端 -> 汇总端：b'H' 扫描端信息（JSON），b'B'/b'Z' 一批记录（b'Z' 为 zlib 压缩），
+		b'R' 子文件夹列表（JSON），b'E' 扫描结束，b'X' 错误信息
+一批记录以 16 字节的文件夹数、文件数、stat 次数和省去的 stat 次数（自上一批起的增量）开头，文件夹路径只在变化时记录一次：
+	b'D' + 4 字节长度 + 文件夹路径
+	b'F' + 1 字节标志 + 2 字节名称长度 + 文件名 [+ 8 字节大小 + 3 个 8 字节时间] [+ 1 字节长度 + 哈希]
+协议没有认证，扫描端只接受 --allow 之下的目录，只应在可信的网络中使用。
+"""
+import argparse
+import json
+import math
+import os
+import queue
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import namedtuple
+from itertools import chain
+
+import extsort
+import scanner
+
+
+DEFAULT_PORT = 7788
+BATCH_SIZE = 4096
+BATCH_INTERVAL = 0.25
+# 每个任务在汇总端最多缓存的批数，排在后面的任务缓存满后扫描端暂停，内存不会无限增长
+QUEUE_BATCHES = 64
+SHARDS_PER_REMOTE = 4
+CONNECT_TIMEOUT = 10.0
+COMPRESS_LEVEL = 1
+
+_HEADER = struct.Struct('<cI')
+_LENGTH = struct.Struct('<I')
+_PROGRESS = struct.Struct('<IIII')
+_FILE = struct.Struct('<BH')
+_STAT = struct.Struct('<qddd')
+HAS_STAT = 1
+HAS_HASH = 2
+
+# 发给扫描端的扫描设置，只包含影响遍历和过滤的部分，格式化在汇总端进行
+_JOB_FIELDS = ('priority', 'include_types', 'type_filter', 'show_size', 'show_create', 'show_modify', 'show_access',
+	'workers', 'show_hash', 'sort_entries')
+
+RemoteJob = namedtuple('RemoteJob', ['remote', 'root', 'tops', 'root_only'])
+RemoteJob.__doc__ = '一个扫描任务；remote 为指定的扫描端序号，None 表示任一扫描端；tops 为遍历起点列表，None 表示整个 root'
+
+
+def _encode(text):
+	return text.encode('utf-8', 'surrogateescape')
+
+
+def _decode(data):
+	return bytes(data).decode('utf-8', 'surrogateescape')
+
+
+def parse_remote(text):
+	"""解析 host:port、unix:路径，可带 =目录，返回 (地址, 目录或 None)；地址为 (host, port) 或 Unix 套接字路径"""
+	text, _, root = text.partition('=')
+	if text.startswith('unix:'):
+		address = text[len('unix:'):]
+		if not address:
+			raise ValueError(f'远程扫描端地址有误: {text}')
+	else:
+		host, _, port = text.rpartition(':')
+		if not host:
+			host, port = port, DEFAULT_PORT
+		try:
+			address = (host.strip('[]'), int(port))
+		except ValueError:
+			raise ValueError(f'远程扫描端地址有误: {text}') from None
+	return address, root or None
+
+
+def parse_remotes(text):
+	"""解析空格分隔的多个远程扫描端，见 parse_remote"""
+	return tuple(parse_remote(item) for item in text.split())
+
+
+def format_address(address):
+	return f'unix:{address}' if isinstance(address, str) else f'{address[0]}:{address[1]}'
+
+
+def send_frame(file, tag, payload=b''):
+	file.write(_HEADER.pack(tag, len(payload)))
+	file.write(payload)
+
+
+def read_frame(file):
+	header = file.read(_HEADER.size)
+	if len(header) < _HEADER.size:
+		raise ConnectionError('连接意外关闭')
+	tag, length = _HEADER.unpack(header)
+	payload = file.read(length)
+	if len(payload) < length:
+		raise ConnectionError('连接意外关闭')
+	return tag, payload
+
+
+def encode_records(records, progress=(0, 0, 0, 0)):
+	"""把一批 FileRecord 编码为 bytes，progress 为这批记录期间的 (文件夹数, 文件数, stat 次数, 省去的 stat 次数)"""
+	out = bytearray(_PROGRESS.pack(*progress))
+	dirpath = None
+	for record in records:
+		if record.dirpath != dirpath:
+			dirpath = record.dirpath
+			data = _encode(dirpath)
+			out += b'D' + _LENGTH.pack(len(data)) + data
+		name = _encode(record.name)
+		flags = (HAS_STAT if record.size is not None else 0) | (HAS_HASH if record.hash is not None else 0)
+		out += b'F' + _FILE.pack(flags, len(name)) + name
+		if flags & HAS_STAT:
+			out += _STAT.pack(record.size, record.ctime, record.mtime, record.atime)
+		if flags & HAS_HASH:
+			digest = record.hash.encode('ascii')
+			out += bytes((len(digest),)) + digest
+	return bytes(out)
+
+
+def decode_records(data, sep=os.sep):
+	"""encode_records 的逆过程，返回 (FileRecord 列表, progress)；sep 为扫描端的路径分隔符"""
+	data = memoryview(data)
+	progress = _PROGRESS.unpack_from(data)
+	offset = _PROGRESS.size
+	records = []
+	record = scanner.FileRecord
+	dirpath = prefix = ''
+	end = len(data)
+	while offset < end:
+		tag = data[offset]
+		offset += 1
+		if tag == 0x44:  # b'D'
+			length, = _LENGTH.unpack_from(data, offset)
+			offset += _LENGTH.size
+			dirpath = _decode(data[offset:offset + length])
+			prefix = dirpath if dirpath.endswith(sep) else dirpath + sep
+			offset += length
+		elif tag == 0x46:  # b'F'
+			flags, length = _FILE.unpack_from(data, offset)
+			offset += _FILE.size
+			name = _decode(data[offset:offset + length])
+			offset += length
+			size = ctime = mtime = atime = digest = None
+			if flags & HAS_STAT:
+				size, ctime, mtime, atime = _STAT.unpack_from(data, offset)
+				offset += _STAT.size
+			if flags & HAS_HASH:
+				length = data[offset]
+				digest = _decode(data[offset + 1:offset + 1 + length])
+				offset += 1 + length
+			records.append(record(prefix + name, dirpath, name, size, ctime, mtime, atime, digest))
+		else:
+			raise ValueError('远程扫描端发来的数据有误')
+	return records, progress
+
+
+def options_from_job(job, index_path=None, hash_cache_path=None):
+	"""在扫描端由任务生成 ScanOptions；索引和哈希缓存只使用扫描端自己的设置"""
+	kwargs = {name: job[name] for name in _JOB_FIELDS if name in job}
+	if job.get('root_only'):
+		kwargs['priority'] = 2
+	return scanner.ScanOptions(job['root'], excluded=job.get('excluded', ()), index_path=index_path,
+		hash_cache_path=hash_cache_path, **kwargs)
+
+
+class _ScanHandler(socketserver.StreamRequestHandler):
+	def handle(self):
+		try:
+			tag, payload = read_frame(self.rfile)
+			request = json.loads(payload)
+			send_frame(self.wfile, b'H', json.dumps({'sep': os.sep}).encode())
+			if tag == b'L':
+				folder = self.server.check_path(request['path'])
+				names = [entry.name for entry in scanner.list_subfolders(folder) if not entry.is_symlink()]
+				send_frame(self.wfile, b'R', json.dumps(names, ensure_ascii=False).encode('utf-8', 'surrogateescape'))
+			elif tag == b'J':
+				if self.server.index_path or self.server.hash_cache_path:
+					# 索引和哈希缓存文件不能同时由多个任务写入
+					with self.server.lock:
+						self._Scan(request)
+				else:
+					self._Scan(request)
+			else:
+				raise ValueError(f'未知的请求: {tag!r}')
+		except OSError as e:
+			# 汇总端断开时无法再发送
+			if not isinstance(e, (BrokenPipeError, ConnectionResetError)):
+				self._SendError(str(e))
+		except Exception as e:
+			# 其他错误也告诉汇总端，不让它只看到连接意外关闭
+			self._SendError(str(e) or type(e).__name__)
+
+	def _SendError(self, message):
+		try:
+			send_frame(self.wfile, b'X', message.encode('utf-8', 'surrogateescape'))
+		except OSError:
+			pass
+
+	def _Scan(self, job):
+		job['root'] = self.server.check_path(job['root'])
+		tops = [self.server.check_path(top) for top in job.get('tops') or ()]
+		options = options_from_job(job, self.server.index_path, self.server.hash_cache_path)
+		stats = scanner.ScanStats()
+		if tops:
+			records = chain.from_iterable(scanner.scan_records(options, stats, top) for top in tops)
+		else:
+			records = scanner.scan_records(options, stats)
+		compress = job.get('compress', True)
+		sent = (0, 0, 0, 0)
+		batch = []
+		last_send = time.monotonic()
+		for record in chain(records, [None]):
+			if record is not None:
+				batch.append(record)
+				if len(batch) < BATCH_SIZE and time.monotonic() - last_send < BATCH_INTERVAL:
+					continue
+			# 文件数也按扫描端的统计，与在本机扫描时含义相同
+			current = (stats.dirs, stats.files, stats.stat_calls, stats.stats_saved)
+			data = encode_records(batch, [now - before for now, before in zip(current, sent)])
+			if compress:
+				send_frame(self.wfile, b'Z', zlib.compress(data, COMPRESS_LEVEL))
+			else:
+				send_frame(self.wfile, b'B', data)
+			self.wfile.flush()
+			sent = current
+			batch = []
+			last_send = time.monotonic()
+		send_frame(self.wfile, b'E')
+
+
+class _ServerMixin:
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def setup_scan(self, allow, index_path=None, hash_cache_path=None):
+		self.allow = [os.path.realpath(path) for path in allow]
+		self.index_path = index_path
+		self.hash_cache_path = hash_cache_path
+		self.lock = threading.Lock()
+
+	def check_path(self, path):
+		"""只允许扫描 allow 之下的文件夹，返回原来的路径，记录中的路径与汇总端请求的一致"""
+		real = os.path.realpath(path)
+		if not any(real == allowed or real.startswith(os.path.join(allowed, '')) for allowed in self.allow):
+			raise ValueError(f'不允许扫描的文件夹: {path}')
+		if not os.path.isdir(path):
+			raise ValueError(f'文件夹不存在: {path}')
+		return path
+
+
+class ScanServer(_ServerMixin, socketserver.ThreadingTCPServer):
+	pass
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+	class UnixScanServer(_ServerMixin, socketserver.ThreadingUnixStreamServer):
+		pass
+else:
+	UnixScanServer = None
+
+
+def make_server(address, allow, index_path=None, hash_cache_path=None):
+	"""创建扫描端，address 见 parse_remote；调用 serve_forever 开始服务，每个连接在单独的线程中处理"""
+	if isinstance(address, str):
+		if UnixScanServer is None:
+			raise OSError('当前系统不支持 Unix 套接字')
+		# 上次异常退出留下的套接字文件
+		try:
+			if stat.S_ISSOCK(os.stat(address).st_mode):
+				os.remove(address)
+		except FileNotFoundError:
+			pass
+		server = UnixScanServer(address, _ScanHandler)
+	else:
+		server = ScanServer(address, _ScanHandler)
+	server.setup_scan(allow, index_path, hash_cache_path)
+	return server
+
+
+class _Connection:
+	def __init__(self, address):
+		self.address = address
+		try:
+			if isinstance(address, str):
+				self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+				self.sock.settimeout(CONNECT_TIMEOUT)
+				self.sock.connect(address)
+			else:
+				self.sock = socket.create_connection(address, CONNECT_TIMEOUT)
+			# 连接之后不限时：过滤掉大部分文件时，两批记录之间可能很久
+			self.sock.settimeout(None)
+		except OSError as e:
+			raise self.Error(e) from None
+		self.rfile = self.sock.makefile('rb')
+		self.wfile = self.sock.makefile('wb')
+		self.sep = os.sep
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def Error(self, message):
+		return OSError(f'{format_address(self.address)}: {message}')
+
+	def request(self, tag, payload):
+		send_frame(self.wfile, tag, json.dumps(payload, ensure_ascii=False).encode('utf-8', 'surrogateescape'))
+		self.wfile.flush()
+		tag, payload = self.read()
+		if tag == b'H':
+			self.sep = json.loads(payload)['sep']
+
+	def read(self):
+		try:
+			tag, payload = read_frame(self.rfile)
+		except OSError as e:
+			raise self.Error(e) from None
+		if tag == b'X':
+			raise self.Error(_decode(payload))
+		return tag, payload
+
+	def shutdown(self):
+		"""由其他线程中止连接，阻塞在 read 中的线程随即出错返回，扫描端发送失败后也停止扫描"""
+		try:
+			self.sock.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+
+	def close(self):
+		for file in (self.rfile, self.wfile, self.sock):
+			try:
+				file.close()
+			except OSError:
+				pass
+
+
+def list_remote_subfolders(address, folder_path):
+	"""由扫描端列出 folder_path 的子文件夹（不含符号链接），返回路径列表"""
+	with _Connection(address) as connection:
+		connection.request(b'L', {'path': folder_path})
+		tag, payload = connection.read()
+		if tag != b'R':
+			raise connection.Error('远程扫描端的回应有误')
+		names = json.loads(_decode(payload))
+	prefix = folder_path if folder_path.endswith(connection.sep) else folder_path + connection.sep
+	return [prefix + name for name in names]
+
+
+def plan_jobs(options, top=None):
+	"""按 options.remote 把扫描分成多个 RemoteJob，顺序与本地扫描的输出顺序相同"""
+	remotes = options.remote
+	if any(root for _, root in remotes):
+		if top is not None:
+			raise ValueError('指定了目录的远程扫描端不能只扫描其中的子文件夹')
+		return [RemoteJob(i, root or options.root, None, False) for i, (_, root) in enumerate(remotes)]
+	if top is not None:
+		return [RemoteJob(None, options.root, [top], False)]
+	if len(remotes) == 1 or options.priority == 2 or options.file_filter.max_depth == 0:
+		return [RemoteJob(None, options.root, None, False)]
+	skip = options.excluded.covers if options.excluded else None
+	tops = [path for path in list_remote_subfolders(remotes[0][0], options.root) if not (skip and skip(path))]
+	if not tops:
+		return [RemoteJob(None, options.root, None, False)]
+	if options.sort_entries:
+		# 路径的前缀相同，按路径排序即按名称排序
+		tops.sort()
+	size = math.ceil(len(tops) / (len(remotes) * SHARDS_PER_REMOTE))
+	jobs = [RemoteJob(None, options.root, tops[i:i + size], False) for i in range(0, len(tops), size)]
+	# 根目录本身的文件单独一个任务，按 priority 放在子文件夹之前或之后
+	root_files = RemoteJob(None, options.root, None, True)
+	return [root_files] + jobs if options.priority == 0 else jobs + [root_files]
+
+
+def _job_request(options, job, address):
+	request = {name: getattr(options, name) for name in _JOB_FIELDS}
+	# 排序在汇总端进行，扫描端只需要提供排序用的大小和时间
+	request['show_size'] = options.show_size or options.sort_key in extsort.STAT_KEYS
+	request.update(root=job.root, tops=job.tops, root_only=job.root_only, excluded=list(options.excluded),
+		compress=not isinstance(address, str))
+	return request
+
+
+class _JobDone:
+	pass
+
+
+def _run_jobs(index, address, options, jobs, queues, take, stopping, connections, lock):
+	"""扫描端线程：依次取得任务，把解码后的记录放入任务对应的队列，出错时把异常放入队列
+
+	打开的连接登记在 connections 中（由 lock 保护），汇总端停止时由 scan_remote 逐个 shutdown。
+	"""
+	def put(q, item):
+		while not stopping.is_set():
+			try:
+				q.put(item, timeout=0.2)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	while not stopping.is_set():
+		job_index = take(index)
+		if job_index is None:
+			return
+		q = queues[job_index]
+		try:
+			with _Connection(address) as connection:
+				with lock:
+					connections.add(connection)
+				try:
+					# 登记之前已经停止时 scan_remote 不会再 shutdown 这个连接
+					if stopping.is_set():
+						return
+					connection.request(b'J', _job_request(options, jobs[job_index], address))
+					while True:
+						tag, payload = connection.read()
+						if tag == b'E':
+							break
+						if tag == b'Z':
+							payload = zlib.decompress(payload)
+						elif tag != b'B':
+							raise connection.Error('远程扫描端的回应有误')
+						if not put(q, decode_records(payload, connection.sep)):
+							return
+				finally:
+					with lock:
+						connections.discard(connection)
+		except Exception as e:
+			# 交给汇总端的调用方，在按顺序读到这个任务时抛出
+			put(q, e)
+			return
+		put(q, _JobDone)
+
+
+def scan_remote(options, stats=None, top=None):
+	"""由 options.remote 中的扫描端扫描，按任务顺序产出 FileRecord；扫描端出错时抛出 OSError"""
+	if stats is None:
+		stats = scanner.ScanStats()
+	jobs = plan_jobs(options, top)
+	queues = [queue.Queue(QUEUE_BATCHES) for _ in jobs]
+	lock = threading.Lock()
+	taken = [False] * len(jobs)
+
+	def take(remote):
+		# 按顺序取第一个还没有开始的任务，排在前面的任务总会先被取走，读取时不会死等
+		with lock:
+			for i, job in enumerate(jobs):
+				if not taken[i] and job.remote in (None, remote):
+					taken[i] = True
+					return i
+		return None
+
+	stopping = threading.Event()
+	connections = set()
+	for index, (address, _) in enumerate(options.remote):
+		threading.Thread(target=_run_jobs, args=(index, address, options, jobs, queues, take, stopping, connections, lock),
+			daemon=True).start()
+	try:
+		for q in queues:
+			while True:
+				try:
+					item = q.get(timeout=BATCH_INTERVAL)
+				except queue.Empty:
+					# 等待扫描端的下一批时也让调用方有机会更新进度或取消
+					stats.add_dirs(0)
+					continue
+				if item is _JobDone:
+					break
+				if isinstance(item, Exception):
+					raise item
+				records, (dirs, files, stat_calls, stats_saved) = item
+				stats.files += files
+				stats.stat_calls += stat_calls
+				stats.stats_saved += stats_saved
+				stats.add_dirs(dirs)
+				yield from records
+	finally:
+		# 取消、出错或调用方提前关闭时中止所有连接，扫描端线程和扫描端的扫描随之结束
+		stopping.set()
+		with lock:
+			for connection in connections:
+				connection.shutdown()
+
+
+def build_parser():
+	parser = argparse.ArgumentParser(description='文件清单的远程扫描端，把扫描结果分批发送给汇总端')
+	parser.add_argument('--listen', default=f'127.0.0.1:{DEFAULT_PORT}',
+		help=f'监听地址，host:port 或 unix:路径，缺省为 127.0.0.1:{DEFAULT_PORT}；协议没有认证，只应在可信的网络中监听')
+	parser.add_argument('--allow', action='append', required=True, metavar='DIR', help='允许扫描的文件夹，可重复')
+	parser.add_argument('--index', metavar='FILE', help='增量扫描索引文件')
+	parser.add_argument('--hash-cache', metavar='FILE', help='内容哈希的缓存文件')
+	return parser
+
+
+def main(argv=None):
+	parser = build_parser()
+	args = parser.parse_args(argv)
+	try:
+		address, root = parse_remote(args.listen)
+		if root:
+			raise ValueError('监听地址不能指定目录')
+		server = make_server(address, args.allow, args.index, args.hash_cache)
+	except (OSError, ValueError) as e:
+		parser.error(str(e))
+	print(f'远程扫描端已启动: {format_address(server.server_address if not isinstance(address, str) else address)}', file=sys.stderr)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		if isinstance(address, str):
+			os.remove(address)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
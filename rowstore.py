@@ -0,0 +1,217 @@
+"""列式存储的扫描结果
+
+目录前缀只保存一份，每个文件只记录目录序号和文件名，大小和时间以原始数值存放在 array 中，
+只有在显示或导出时才格式化为字符串。
+"""
+import os
+from array import array
+
+import extsort
+import formatting
+from formatting import format_file_size as format_size
+
+
+COLUMN_TITLES = {'name': '文件名', 'size': '大小', 'ctime': '创建时间', 'mtime': '修改时间', 'atime': '访问时间', 'hash': '内容哈希'}
+ROW_BLOCK = 4096
+# 估计文本大小时抽样的行数
+SIZE_SAMPLES = 500
+
+
+class RowStore:
+	"""按列保存 scanner.FileRecord，按行号取格式化后的行
+
+	列由 ScanOptions 决定：文件名，以及勾选的大小/创建时间/修改时间/访问时间/内容哈希。
+	keep_sorted 为 True 且设置了 sort_key 时另外保存每行的排序键，监视模式更新之后按它重新排序。
+	"""
+	def __init__(self, options, keep_sorted=False):
+		self.root = options.root
+		self.file_format = options.file_format
+		self.time_formatter = options.time_formatter
+		self.sort_key = options.sort_key if keep_sorted else None
+		self.sort_reverse = options.sort_reverse
+		self.columns = ['name']
+		if options.show_size:
+			self.columns.append('size')
+		if options.show_create:
+			self.columns.append('ctime')
+		if options.show_modify:
+			self.columns.append('mtime')
+		if options.show_access:
+			self.columns.append('atime')
+		if options.show_hash:
+			self.columns.append('hash')
+
+		self.clear()
+
+	def clear(self):
+		self.dirs = []
+		self._dir_ids = {}
+		self._rel_dirs = {}
+		self.dir_index = array('L')
+		self.names = []
+		self.size = array('q')
+		self.ctime = array('d')
+		self.mtime = array('d')
+		self.atime = array('d')
+		self.hash = []
+		self.sort_values = []
+		self._value_columns = [getattr(self, col) for col in self.columns[1:]]
+
+	def header(self):
+		return [COLUMN_TITLES[col] for col in self.columns]
+
+	def __len__(self):
+		return len(self.names)
+
+	def __getitem__(self, index):
+		return self.row(index)
+
+	def __iter__(self):
+		"""逐行产出格式化后的行，内部按块整列批量格式化"""
+		for start in range(0, len(self.names), ROW_BLOCK):
+			yield from self.rows(start, start + ROW_BLOCK)
+
+	def append(self, record):
+		dir_id = self._dir_ids.get(record.dirpath)
+		if dir_id is None:
+			dir_id = self._dir_ids[record.dirpath] = len(self.dirs)
+			self.dirs.append(record.dirpath)
+		self.dir_index.append(dir_id)
+		self.names.append(record.name)
+		for col, values in zip(self.columns[1:], self._value_columns):
+			values.append(getattr(record, col))
+		if self.sort_key:
+			self.sort_values.append(extsort.SORT_KEYS[self.sort_key](record))
+
+	def extend(self, records):
+		for record in records:
+			self.append(record)
+
+	def replace_folders(self, folders):
+		"""监视模式的增量更新，folders 为 scanner.rescan_folders 产出的 (文件夹, FileRecord 列表或 None)
+
+		先去掉这些文件夹中原有的行（None 时连同子文件夹中的行），再把新的行追加在末尾，
+		设置了 sort_key 时再整体按排序键重新排序。返回 (去掉的行数, 追加的行数)。
+		"""
+		folders = list(folders)
+		replaced = {folder for folder, records in folders if records is not None}
+		removed = tuple(os.path.join(folder, '') for folder, records in folders if records is None)
+		drop = {dir_id for dirpath, dir_id in self._dir_ids.items()
+			if dirpath in replaced or removed and os.path.join(dirpath, '').startswith(removed)}
+		rows = [index for index, dir_id in enumerate(self.dir_index) if dir_id in drop] if drop else []
+		if rows:
+			self._RemoveRows(rows)
+		added = 0
+		for folder, records in folders:
+			if records:
+				self.extend(records)
+				added += len(records)
+		if self.sort_key and (rows or added):
+			self._SortRows()
+		return len(rows), added
+
+	def _StoredColumns(self):
+		return ['dir_index', 'names'] + self.columns[1:] + (['sort_values'] if self.sort_key else [])
+
+	def _SortRows(self):
+		"""按排序键稳定排序全部行，原有的行已经有序，键相同时新的行排在后面"""
+		order = sorted(range(len(self.names)), key=self.sort_values.__getitem__, reverse=self.sort_reverse)
+		for col in self._StoredColumns():
+			values = getattr(self, col)
+			ordered = values[:0]
+			ordered.extend(map(values.__getitem__, order))
+			setattr(self, col, ordered)
+		self._value_columns = [getattr(self, col) for col in self.columns[1:]]
+
+	def _RemoveRows(self, rows):
+		"""按升序的行号去掉若干行，每一列按保留的区间整段复制"""
+		starts = [0] + [index + 1 for index in rows]
+		stops = rows + [len(self.names)]
+		ranges = [(start, stop) for start, stop in zip(starts, stops) if start < stop]
+		for col in self._StoredColumns():
+			values = getattr(self, col)
+			kept = values[:0]
+			for start, stop in ranges:
+				kept += values[start:stop]
+			setattr(self, col, kept)
+		self._value_columns = [getattr(self, col) for col in self.columns[1:]]
+
+	def path(self, index):
+		return os.path.join(self.dirs[self.dir_index[index]], self.names[index])
+
+	def display_name(self, index):
+		"""按 file_format 生成文件名列：0 仅文件名, 1 相对路径, 2 绝对路径"""
+		if self.file_format == 2:
+			return self.path(index)
+		name = self.names[index]
+		if self.file_format == 1:
+			dir_id = self.dir_index[index]
+			rel_dir = self._rel_dirs.get(dir_id)
+			if rel_dir is None:
+				rel_dir = self._rel_dirs[dir_id] = os.path.relpath(self.dirs[dir_id], self.root)
+			return name if rel_dir == os.curdir else os.path.join(rel_dir, name)
+		return name
+
+	def cell(self, index, col):
+		"""取单元格的显示文本"""
+		column = self.columns[col]
+		if column == 'name':
+			return self.display_name(index)
+		if column == 'size':
+			return format_size(self.size[index])
+		if column == 'hash':
+			return self.hash[index]
+		return self.time_formatter(getattr(self, column)[index])
+
+	def row(self, index):
+		return [self.cell(index, col) for col in range(len(self.columns))]
+
+	def format_column(self, col, start, stop):
+		"""批量格式化一列中 [start, stop) 范围的单元格"""
+		column = self.columns[col]
+		if column == 'name':
+			return [self.display_name(index) for index in range(start, min(stop, len(self.names)))]
+		values = getattr(self, column)[start:stop]
+		if column == 'size':
+			return formatting.format_file_sizes(values)
+		if column == 'hash':
+			return values
+		return self.time_formatter.format_many(values)
+
+	def rows(self, start, stop):
+		"""格式化 [start, stop) 范围的行"""
+		return [list(row) for row in zip(*(self.format_column(col, start, stop) for col in range(len(self.columns))))]
+
+	def raw_column(self, col, start, stop):
+		"""取一列中 [start, stop) 范围的原始值：文件名同显示，大小为字节数，时间为纪元秒"""
+		column = self.columns[col]
+		if column == 'name':
+			return self.format_column(col, start, stop)
+		return getattr(self, column)[start:stop]
+
+	def raw_rows(self, start, stop):
+		"""[start, stop) 范围内未格式化的行，用于 jsonl 等面向程序的导出格式"""
+		return list(zip(*(self.raw_column(col, start, stop) for col in range(len(self.columns)))))
+
+	def text_block(self, start, stop, sep=','):
+		"""[start, stop) 范围的行以 sep 连接单元格、每行以换行结尾，用于复制到剪贴板"""
+		return ''.join(sep.join(row) + '\n' for row in self.rows(start, stop))
+
+	def estimate_text_size(self, sep=',', samples=SIZE_SAMPLES):
+		"""按均匀抽样的行估计全部行拼接成文本后的字节数（UTF-8），不必格式化整个清单"""
+		count = len(self.names)
+		if not count:
+			return 0
+		picked = range(0, count, max(1, count // samples))
+		sample_size = sum(len((sep.join(self.row(index)) + '\n').encode('utf-8', 'surrogateescape')) for index in picked)
+		return sample_size * count // len(picked)
+
+	def sort_key(self, col):
+		"""返回按原始值排序用的 key 函数，参数为行号"""
+		column = self.columns[col]
+		if column == 'name':
+			return self.display_name
+		return getattr(self, column).__getitem__
+
+	def total_size(self):
+		return sum(self.size)
@@ -0,0 +1,140 @@
+"""持久化的增量扫描索引
+
+以目录路径为键，在 SQLite 中保存每个目录的 mtime 和目录项（名称、类型、大小和时间）。
+再次扫描时只重新读取 mtime 变化了的目录，其余目录直接从索引返回，
+反复列出几乎不变的大型共享目录时只需要对每个目录做一次 stat。
+
+只为需要属性的文件（通过名称过滤的文件）做 stat 并保存属性，其余文件只保存名称，用到时再 stat。
+完整扫描（没有排除和层数限制）之后，索引中这个目录之下没有遍历到的目录（已删除或改名）会被删除。
+
+注意：目录的 mtime 只在增删、改名目录项时变化，文件内容被改写时不会变化，
+因此对未变化的目录，索引中的文件大小和时间可能落后于磁盘。
+"""
+import marshal
+import os
+import sqlite3
+import threading
+import time
+
+import scanner
+
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.filelister', 'scan_index.sqlite')
+# 在这个时间窗口内修改过的目录不信任索引，避免与 mtime 精度相关的竞争
+RACY_WINDOW_NS = 2 * 10**9
+COMMIT_EVERY = 500
+
+
+class ScanIndex:
+	"""目录索引，read_dir 可以直接作为 scanner.walk 的 reader 使用，线程安全
+
+	列出目录之后、stat 之前被删除的文件不写入索引，计入 stats.vanished（stats 为 scanner.ScanStats 或 None）。
+	"""
+	def __init__(self, index_path, stats=None):
+		folder = os.path.dirname(index_path)
+		if folder:
+			os.makedirs(folder, exist_ok=True)
+		self.conn = sqlite3.connect(index_path, check_same_thread=False)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self.conn.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER, indexed_ns INTEGER, entries BLOB)')
+		self.lock = threading.Lock()
+		self.stats = stats
+		self.hits = 0
+		self.misses = 0
+		self._uncommitted = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		with self.lock:
+			self.conn.commit()
+			self.conn.close()
+
+	def read_dir(self, folder_path, want_stat=None):
+		"""返回 (子文件夹列表, 文件列表)，目录未变化时来自索引，否则重新读取并更新索引
+
+		want_stat(name) 为 False 的文件不 stat，索引中也不保存它的属性；为 None 时保存全部文件的属性。
+		"""
+		try:
+			mtime_ns = os.stat(folder_path).st_mtime_ns
+		except OSError:
+			return [], []
+
+		with self.lock:
+			row = self.conn.execute('SELECT mtime_ns, indexed_ns, entries FROM dirs WHERE path = ?', (folder_path,)).fetchone()
+		if row is not None and row[0] == mtime_ns and row[1] - mtime_ns > RACY_WINDOW_NS:
+			self.hits += 1
+			return self._Unpack(folder_path, row[2])
+
+		self.misses += 1
+		indexed_ns = time.time_ns()
+		dirs, files = scanner.read_dir(folder_path)
+		entries = [self._Pack(entry, True) for entry in dirs]
+		for entry in files:
+			packed = self._Pack(entry, False, want_stat is None or want_stat(entry.name))
+			if packed is not None:
+				entries.append(packed)
+			elif self.stats is not None:
+				self.stats.vanished += 1
+		with self.lock:
+			self.conn.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)', (folder_path, mtime_ns, indexed_ns, marshal.dumps(entries)))
+			self._uncommitted += 1
+			if self._uncommitted >= COMMIT_EVERY:
+				self.conn.commit()
+				self._uncommitted = 0
+		return self._Unpack(folder_path, entries)
+
+	def reader(self, stat_filter=None):
+		"""返回供 scanner.walk 使用的 reader；stat_filter(folder_path) 返回这个目录的 want_stat，见 read_dir"""
+		if stat_filter is None:
+			return self.read_dir
+		return lambda folder_path: self.read_dir(folder_path, stat_filter(folder_path))
+
+	def prune(self, root, visited):
+		"""删除索引中 root 之下（含 root）不在 visited 中的目录，只应在完整扫描 root 之后调用"""
+		prefix = root if root.endswith(os.sep) else root + os.sep
+		with self.lock:
+			stale = [(path,) for path, in self.conn.execute('SELECT path FROM dirs')
+				if (path == root or path.startswith(prefix)) and path not in visited]
+			if stale:
+				self.conn.executemany('DELETE FROM dirs WHERE path = ?', stale)
+				self.conn.commit()
+				self._uncommitted = 0
+		return len(stale)
+
+	@staticmethod
+	def _Pack(entry, is_dir, want_stat=True):
+		"""索引中保存的目录项，与 scanner.make_record 相同，文件已被删除时返回 None"""
+		if is_dir:
+			return (entry.name, True, entry.is_symlink(), 0, 0.0, 0.0, 0.0)
+		if not want_stat:
+			# 不需要属性的文件只保存名称，属性为 None
+			return (entry.name, False, entry.is_symlink(), None, None, None, None)
+		try:
+			st = entry.stat()
+		except OSError:
+			try:
+				st = entry.stat(follow_symlinks=False)
+			except OSError:
+				return None
+		return (entry.name, False, entry.is_symlink(), st.st_size, st.st_ctime, st.st_mtime, st.st_atime)
+
+	@staticmethod
+	def _Unpack(folder_path, entries):
+		if isinstance(entries, bytes):
+			entries = marshal.loads(entries)
+		dirs, files = [], []
+		for name, is_dir, is_symlink, size, ctime, mtime, atime in entries:
+			path = os.path.join(folder_path, name)
+			if is_dir:
+				dirs.append(scanner.CachedEntry(name, path, True, is_symlink))
+			elif size is None:
+				# 保存时没有 stat，需要时由 CachedEntry.stat 当场读取
+				files.append(scanner.CachedEntry(name, path, False, is_symlink))
+			else:
+				files.append(scanner.CachedEntry(name, path, False, is_symlink, scanner.EntryStat(size, ctime, mtime, atime)))
+		return dirs, files
@@ -0,0 +1,574 @@
+"""基于 os.scandir 的目录扫描引擎
+
+每个文件只做一次 DirEntry.stat()，并复用 scandir 缓存的 d_type 区分文件和文件夹，
+不再像 os.walk + os.path.getsize/getctime/getmtime/getatime 那样对同一个文件反复 stat。
+"""
+import copy
+import heapq
+import operator
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import extsort
+import filterexpr
+import formatting
+import hashing
+import scanindex
+from pathtrie import PathTrie
+
+
+FileRecord = namedtuple('FileRecord', ['path', 'dirpath', 'name', 'size', 'ctime', 'mtime', 'atime', 'hash'], defaults=(None,))
+FileRecord.__doc__ = '扫描得到的文件记录，所有属性来自同一次 stat；不需要属性时为 None，hash 只在需要内容哈希时填写'
+
+EntryStat = namedtuple('EntryStat', ['st_size', 'st_ctime', 'st_mtime', 'st_atime'])
+
+
+class CachedEntry:
+	"""从缓存恢复的目录项，接口与 os.DirEntry 相同（只提供扫描用到的部分）"""
+	__slots__ = ('name', 'path', '_is_dir', '_is_symlink', '_stat')
+
+	def __init__(self, name, path, is_dir, is_symlink, stat=None):
+		self.name = name
+		self.path = path
+		self._is_dir = is_dir
+		self._is_symlink = is_symlink
+		self._stat = stat
+
+	def is_dir(self, follow_symlinks=True):
+		return self._is_dir
+
+	def is_symlink(self):
+		return self._is_symlink
+
+	def has_stat(self):
+		"""是否已经带有属性，为 False 时 stat 会当场读取"""
+		return self._stat is not None
+
+	def stat(self, follow_symlinks=True):
+		if self._stat is None:
+			st = os.stat(self.path, follow_symlinks=follow_symlinks)
+			return EntryStat(st.st_size, st.st_ctime, st.st_mtime, st.st_atime)
+		return self._stat
+
+
+class ScanCancelled(Exception):
+	"""由 ScanStats.progress 抛出，中止正在进行的扫描"""
+
+
+class ScanStats:
+	"""扫描过程计数，stats_saved 为先按文件名过滤而省去的 stat 次数，vanished 为列出目录之后、stat 之前被删除的文件数
+
+	progress(stats) 在每读完一个目录时调用，即使这个目录没有产出任何记录（过滤条件很严或排序时还在读取），
+	界面可以借此更新进度，或抛出 ScanCancelled 立即中止扫描。
+	"""
+	def __init__(self, progress=None):
+		self.progress = progress
+		self.dirs = 0
+		self.files = 0
+		self.stat_calls = 0
+		self.stats_saved = 0
+		self.vanished = 0
+		self.started = time.monotonic()
+
+	def add_dirs(self, count=1):
+		"""记录读完的目录数并调用 progress"""
+		self.dirs += count
+		if self.progress is not None:
+			self.progress(self)
+
+	def elapsed(self):
+		return time.monotonic() - self.started
+
+	def files_per_sec(self):
+		elapsed = self.elapsed()
+		return self.files / elapsed if elapsed > 0 else 0.0
+
+
+class ScanOptions:
+	"""一次扫描的全部设置，取值与界面控件一致，可以安全地交给后台线程使用
+
+	priority: 0 根目录文件在前, 1 子文件夹文件在前, 2 仅根目录的文件
+	file_format: 0 仅文件名, 1 相对路径, 2 绝对路径
+	type_filter: 过滤表达式的各项，编译为 file_filter，见 filterexpr；表达式有误时抛出 ValueError
+	excluded: 排除的子文件夹，保存为 pathtrie.PathTrie
+	workers: 同时读取的目录数，大于 1 时使用 parallel_walk
+	index_path: 增量扫描索引文件，设置后未变化的目录直接从索引读取，见 scanindex
+	time_format: 时间列的格式，formatting.TIME_FORMATS 中的名称或 strftime 格式
+	show_hash: 增加内容哈希列，hash_cache_path 为哈希缓存文件，见 hashing
+	sort_entries: 每个目录中的文件和子文件夹按名称排序后再遍历，见 snapshot
+	dir_cache: 会话内共享的 dircache.DirCache，设置后已读取过的目录直接从内存返回
+	remote: 远程扫描端 [(地址, 目录或 None)]，设置后由这些扫描端扫描 root，见 remote
+	sort_key: 结果按 extsort.SORT_KEYS 中的键排序，None 为扫描顺序；sort_reverse 为 True 时从大到小
+	"""
+	def __init__(self, root, priority=0, file_format=0, include_types=True, type_filter=(),
+			show_size=False, show_create=False, show_modify=False, show_access=False, excluded=(), workers=1,
+			index_path=None, time_format=formatting.TIME_FORMAT, show_hash=False, hash_cache_path=None,
+			sort_entries=False, dir_cache=None, remote=(), sort_key=None, sort_reverse=False):
+		self.root = root
+		self.priority = priority
+		self.file_format = file_format
+		self.include_types = include_types
+		self.type_filter = list(type_filter)
+		self.file_filter = filterexpr.compile_filter(self.type_filter, include_types)
+		self.show_size = show_size
+		self.show_create = show_create
+		self.show_modify = show_modify
+		self.show_access = show_access
+		self.excluded = PathTrie(excluded)
+		self.workers = workers
+		self.index_path = index_path
+		self.time_format = time_format
+		self.time_formatter = formatting.time_formatter(time_format)
+		self.show_hash = show_hash
+		self.hash_cache_path = hash_cache_path
+		self.sort_entries = sort_entries
+		self.dir_cache = dir_cache
+		self.remote = tuple(remote)
+		self.sort_key = sort_key
+		self.sort_reverse = sort_reverse
+
+	@property
+	def need_stat(self):
+		return (self.show_size or self.show_create or self.show_modify or self.show_access or self.show_hash
+			or self.sort_key in extsort.STAT_KEYS)
+
+	def replace(self, **changes):
+		"""复制一份设置并修改其中的显示和输出属性，用于派生的扫描（如汇总报告）"""
+		options = copy.copy(self)
+		for name, value in changes.items():
+			setattr(options, name, value)
+		return options
+
+
+_entry_name = operator.attrgetter('name')
+
+
+def sorted_reader(reader):
+	"""包装 reader，返回按名称排序的子文件夹和文件列表"""
+	def read_sorted(folder_path):
+		dirs, files = reader(folder_path)
+		dirs.sort(key=_entry_name)
+		files.sort(key=_entry_name)
+		return dirs, files
+	return read_sorted
+
+
+def read_dir(folder_path):
+	"""读取单个目录，返回 (子文件夹列表, 文件列表)，元素均为 os.DirEntry"""
+	dirs, files = [], []
+	try:
+		with os.scandir(folder_path) as it:
+			for entry in it:
+				try:
+					is_dir = entry.is_dir()
+				except OSError:
+					is_dir = False
+				if is_dir:
+					dirs.append(entry)
+				else:
+					files.append(entry)
+	except OSError:
+		# 与 os.walk 一致，无法读取的目录直接跳过
+		pass
+	return dirs, files
+
+
+def walk(top, topdown=True, reader=read_dir, skip=None):
+	"""与 os.walk 顺序相同的遍历，产出 (dirpath, 子文件夹 DirEntry 列表, 文件 DirEntry 列表)
+
+	topdown 为 True 时可以原地修改子文件夹列表来剪枝；skip(path) 为 True 的子文件夹在两种顺序下都不进入。
+	不跟随指向文件夹的符号链接，使用显式栈，不受递归深度限制。
+	reader 为读取单个目录的函数，缺省为 read_dir，可换成 scanindex.ScanIndex.read_dir 等。
+	"""
+	if topdown:
+		stack = [top]
+		while stack:
+			dirpath = stack.pop()
+			dirs, files = reader(dirpath)
+			yield dirpath, dirs, files
+			for entry in reversed(dirs):
+				if not entry.is_symlink() and not (skip and skip(entry.path)):
+					stack.append(entry.path)
+		return
+
+	stack = [(top, None)]
+	while stack:
+		dirpath, listing = stack.pop()
+		if listing is not None:
+			yield dirpath, listing[0], listing[1]
+			continue
+		dirs, files = reader(dirpath)
+		stack.append((dirpath, (dirs, files)))
+		for entry in reversed(dirs):
+			if not entry.is_symlink() and not (skip and skip(entry.path)):
+				stack.append((entry.path, None))
+
+
+class _ReadAheadPool:
+	"""parallel_walk 使用的目录预读线程池
+
+	待读目录放在按遍历顺序排序的堆里（key 为从根开始的子文件夹序号元组），
+	工作线程总是先读最靠近遍历位置的目录；读完后把子文件夹放回堆里。
+	遍历线程取到还没开始读的目录时直接自己读，不排队等待。
+	"""
+	_RUNNING = object()
+
+	def __init__(self, workers, max_pending, skip, reader):
+		self.reader = reader
+		self.max_pending = max_pending
+		self.skip = skip
+		self.cond = threading.Condition()
+		self.heap = []
+		self.results = {}  # 正在读或已读完、尚未取走的目录
+		self.taken = set()  # 已由遍历线程直接读取的目录
+		self.closed = False
+		for i in range(workers):
+			threading.Thread(target=self._Work, name=f'walk-{i}', daemon=True).start()
+
+	def _Expand(self, key, path, listing):
+		# 调用时持有 self.cond
+		for i, entry in enumerate(listing[0]):
+			if not entry.is_symlink() and not (self.skip and self.skip(entry.path)):
+				heapq.heappush(self.heap, (key + (i,), entry.path))
+		self.cond.notify_all()
+
+	def _Work(self):
+		while True:
+			with self.cond:
+				while not self.closed and (not self.heap or len(self.results) >= self.max_pending):
+					self.cond.wait()
+				if self.closed:
+					return
+				key, path = heapq.heappop(self.heap)
+				if path in self.taken:
+					self.taken.discard(path)
+					continue
+				self.results[path] = self._RUNNING
+			listing = self.reader(path)
+			with self.cond:
+				if path in self.results:
+					self.results[path] = listing
+					self._Expand(key, path, listing)
+				self.cond.notify_all()
+
+	def take(self, key, path):
+		"""取目录内容，必要时等待工作线程读完"""
+		with self.cond:
+			while True:
+				listing = self.results.get(path)
+				if listing is None:
+					# 还没开始读，堆里的那一份以后会被跳过
+					self.taken.add(path)
+					break
+				if listing is not self._RUNNING:
+					del self.results[path]
+					self.cond.notify_all()
+					return listing
+				self.cond.wait()
+		listing = self.reader(path)
+		with self.cond:
+			self._Expand(key, path, listing)
+		return listing
+
+	def drop(self, paths):
+		"""丢弃被剪掉的子文件夹及其整个子树的预读：堆中待读的、正在读的和已读完的都去掉
+
+		正在读的目录从 results 中去掉后，读完的结果不再保存，也不会展开它的子文件夹。
+		"""
+		paths = set(paths)
+		prefixes = tuple(path + os.sep for path in paths)
+
+		def pruned(path):
+			return path in paths or path.startswith(prefixes)
+
+		with self.cond:
+			self.heap = [item for item in self.heap if not pruned(item[1])]
+			heapq.heapify(self.heap)
+			for path in [path for path in self.results if pruned(path)]:
+				del self.results[path]
+			self.taken = {path for path in self.taken if not pruned(path)}
+			self.cond.notify_all()
+
+	def close(self):
+		with self.cond:
+			self.closed = True
+			self.heap.clear()
+			self.results.clear()
+			self.cond.notify_all()
+
+
+def parallel_walk(top, topdown=True, workers=8, skip=None, max_pending=None, reader=read_dir):
+	"""多线程预读目录的 walk，产出顺序与 walk 完全相同
+
+	目录读完后立即把它的子文件夹放入工作队列，网络文件系统上多个目录的读取可以同时进行。
+	已读完未取走的目录数上限为 max_pending（缺省 workers * 32）。
+	skip(path) 为 True 的子文件夹不读取也不进入；topdown 模式下调用方剪掉的子文件夹，其预读结果会被丢弃。
+	"""
+	if max_pending is None:
+		max_pending = workers * 32
+	pool = _ReadAheadPool(workers, max_pending, skip, reader)
+	try:
+		if topdown:
+			stack = [((), top)]
+			while stack:
+				key, dirpath = stack.pop()
+				dirs, files = pool.take(key, dirpath)
+				listed = {entry.path: i for i, entry in enumerate(dirs)}
+				yield dirpath, dirs, files
+				if len(dirs) != len(listed):
+					pool.drop(set(listed) - {entry.path for entry in dirs})
+				for entry in reversed(dirs):
+					if not entry.is_symlink() and not (skip and skip(entry.path)):
+						stack.append((key + (listed.get(entry.path, 0),), entry.path))
+			return
+
+		stack = [((), top, None)]
+		while stack:
+			key, dirpath, listing = stack.pop()
+			if listing is not None:
+				yield dirpath, listing[0], listing[1]
+				continue
+			dirs, files = pool.take(key, dirpath)
+			stack.append((key, dirpath, (dirs, files)))
+			for i in range(len(dirs) - 1, -1, -1):
+				if not dirs[i].is_symlink() and not (skip and skip(dirs[i].path)):
+					stack.append((key + (i,), dirs[i].path, None))
+	finally:
+		pool.close()
+
+
+def filter_entries(entries, name_filter, stats=None):
+	"""过滤管线的第一级：name_filter(name) 只看 DirEntry.name，在任何 stat 之前丢弃不需要的文件"""
+	if name_filter is None:
+		yield from entries
+		return
+	for entry in entries:
+		if name_filter(entry.name):
+			yield entry
+		elif stats is not None:
+			stats.stats_saved += 1
+
+
+def make_record(entry, dirpath, need_stat=True, stats=None):
+	"""生成 FileRecord；need_stat 为 True 时做一次 stat 填好全部属性，否则不访问元数据
+
+	文件在列出目录之后已被删除、无法 stat 时返回 None，计入 stats.vanished。
+	"""
+	if not need_stat:
+		if stats is not None:
+			stats.files += 1
+		return FileRecord(entry.path, dirpath, entry.name, None, None, None, None)
+	if stats is not None:
+		stats.stat_calls += 1
+	try:
+		st = entry.stat()
+	except OSError:
+		# 失效的符号链接等，退回到链接本身的信息
+		try:
+			st = entry.stat(follow_symlinks=False)
+		except OSError:
+			if stats is not None:
+				stats.vanished += 1
+			return None
+	if stats is not None:
+		stats.files += 1
+	return FileRecord(entry.path, dirpath, entry.name, st.st_size, st.st_ctime, st.st_mtime, st.st_atime)
+
+
+def list_subfolders(folder_path):
+	"""返回目录下的子文件夹 DirEntry 列表"""
+	return read_dir(folder_path)[0]
+
+
+class SubfolderPrefetcher:
+	"""在后台线程提前读取下一层子文件夹，树节点展开时直接取用
+
+	prefetch/get/reset 只应在同一个线程（界面线程）中调用。
+	最多保留 max_pending 个预读，超出时取消最早的，只保留最近展开的节点下的子文件夹。
+	"""
+	def __init__(self, workers=2, enabled=True, lister=list_subfolders, max_pending=256):
+		self.enabled = enabled
+		self.workers = workers
+		self.lister = lister
+		self.max_pending = max_pending
+		self._executor = None
+		self._futures = {}
+
+	def prefetch(self, folder_path):
+		if not self.enabled or folder_path in self._futures:
+			return
+		if self._executor is None:
+			self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='prefetch')
+		self._futures[folder_path] = self._executor.submit(self.lister, folder_path)
+		while len(self._futures) > self.max_pending:
+			# dict 按加入顺序排列，第一个是最早的
+			self._futures.pop(next(iter(self._futures))).cancel()
+
+	def get(self, folder_path):
+		"""取子文件夹列表，已预读的直接返回，否则当场读取"""
+		future = self._futures.pop(folder_path, None)
+		if future is not None and not future.cancel():
+			return future.result()
+		return self.lister(folder_path)
+
+	def reset(self):
+		for future in self._futures.values():
+			future.cancel()
+		self._futures.clear()
+
+
+def scan_records(options, stats=None, top=None):
+	"""按 ScanOptions 遍历目录，产出通过过滤的 FileRecord
+
+	top 为 root 下的某个子文件夹时只遍历这个子树，层数和相对路径仍以 root 为基准，用于把一次扫描分片。
+	设置了 sort_key 时扫描完成后才开始产出，记录较多时排序会用到临时文件，见 extsort。
+	"""
+	if stats is None:
+		stats = ScanStats()
+	records = _scan_unsorted(options, stats, top)
+	if options.sort_key:
+		records = extsort.sort_records(records, options.sort_key, options.sort_reverse)
+	return records
+
+
+def _scan_unsorted(options, stats, top=None):
+	if options.remote:
+		# remote 依赖本模块，用到时才导入
+		import remote
+		yield from remote.scan_remote(options, stats, top)
+	elif options.show_hash:
+		yield from _hash_records(options, stats, top)
+	elif options.index_path:
+		with scanindex.ScanIndex(options.index_path, stats) as index:
+			# 完整扫描时记下遍历到的目录，扫描结束后从索引中删除其余的（已删除或改名的）目录
+			full = top is None and not options.excluded and options.file_filter.max_depth is None and options.priority != 2
+			visited = set() if full else None
+			yield from _scan_records(options, stats, index.reader(_stat_filter(options)), top, visited)
+			if full:
+				index.prune(options.root, visited)
+	else:
+		yield from _scan_records(options, stats, read_dir, top)
+
+
+def _hash_records(options, stats, top=None):
+	# 哈希需要文件大小，与显示哪些属性列无关
+	records = _scan_unsorted(options.replace(show_hash=False, show_size=True), stats, top)
+	workers = max(hashing.DEFAULT_WORKERS, options.workers)
+	if options.hash_cache_path:
+		with hashing.HashCache(options.hash_cache_path) as cache:
+			yield from hashing.hash_records(records, hashing.Hasher(cache), workers)
+	else:
+		yield from hashing.hash_records(records, hashing.Hasher(), workers)
+
+
+def _stat_filter(options):
+	"""增量索引和目录缓存的 stat_filter：不需要属性时不为任何文件 stat，否则只为通过名称过滤的文件 stat"""
+	file_filter = options.file_filter
+	if not (options.need_stat or file_filter.needs_stat):
+		return lambda folder_path: lambda name: False
+	if not file_filter.needs_name:
+		return None
+	root = options.root
+
+	def stat_filter(folder_path):
+		depth = folder_depth(folder_path, root)
+		return lambda name: file_filter.accept_name(name, depth)
+	return stat_filter
+
+
+def folder_depth(dirpath, root):
+	"""dirpath 相对 root 的层数，root 本身为 0"""
+	rel = os.path.relpath(dirpath, root)
+	return 0 if rel == os.curdir else rel.count(os.sep) + 1
+
+
+def _filter_dir(file_entries, dirpath, depth, file_filter, need_stat, stats):
+	"""对一个目录的文件依次执行名称过滤、stat 和依赖 stat 的过滤"""
+	name_filter = None
+	if file_filter.needs_name:
+		name_filter = lambda name: file_filter.accept_name(name, depth)
+	for entry in filter_entries(file_entries, name_filter, stats):
+		record = make_record(entry, dirpath, need_stat, stats)
+		if record is not None and file_filter.accept_record(record, depth):
+			yield record
+
+
+def rescan_folders(options, folders, stats=None):
+	"""重新读取 folders 中每个文件夹本身的文件（不含子文件夹），按 options 过滤，用于监视模式的增量更新
+
+	产出 (文件夹, FileRecord 列表)；文件夹已经不存在时列表为 None，表示应去掉它和它的子文件夹中的文件。
+	不在扫描范围内（被排除、超过层数限制、仅根目录时的子文件夹）的文件夹得到空列表。
+	显示内容哈希时与完整扫描一样计算哈希，设置了 hash_cache_path 时使用哈希缓存。
+	"""
+	if stats is None:
+		stats = ScanStats()
+	root = options.root
+	file_filter = options.file_filter
+	need_stat = options.need_stat or file_filter.needs_stat
+	prefix = os.path.join(root, '')
+	workers = max(hashing.DEFAULT_WORKERS, options.workers)
+	with hashing.HashCache(options.hash_cache_path) if options.show_hash and options.hash_cache_path else nullcontext() as cache:
+		hasher = hashing.Hasher(cache) if options.show_hash else None
+		for folder in folders:
+			if options.dir_cache is not None:
+				options.dir_cache.invalidate(folder, recursive=not os.path.isdir(folder))
+			if not os.path.isdir(folder):
+				yield folder, None
+				continue
+			depth = folder_depth(folder, root)
+			if (folder != root and not folder.startswith(prefix) or options.priority == 2 and folder != root
+					or options.excluded.covers(folder)
+					or file_filter.max_depth is not None and depth > file_filter.max_depth):
+				yield folder, []
+				continue
+			reader = options.dir_cache.reader(read_dir, need_stat, _stat_filter(options)) if options.dir_cache is not None else read_dir
+			stats.add_dirs()
+			records = _filter_dir(reader(folder)[1], folder, depth, file_filter, need_stat, stats)
+			if hasher is not None:
+				records = hashing.hash_records(records, hasher, workers)
+			yield folder, list(records)
+
+
+def _scan_records(options, stats, reader, top=None, visited=None):
+	root = options.root
+	root_file_before = options.priority == 0
+	# 先按文件名过滤，只有留下的文件且需要属性列或按大小/时间过滤时才 stat
+	file_filter = options.file_filter
+	need_stat = options.need_stat or file_filter.needs_stat
+	if options.dir_cache is not None:
+		reader = options.dir_cache.reader(reader, need_stat, _stat_filter(options))
+	if options.sort_entries:
+		reader = sorted_reader(reader)
+	excluded = options.excluded
+
+	# 处理根目录文件，子文件夹中的文件都不列出
+	if options.priority == 2:
+		if top is not None and top != root:
+			return
+		stats.add_dirs()
+		yield from _filter_dir(reader(root)[1], root, 0, file_filter, need_stat, stats)
+		return
+
+	# 递归处理文件夹，排除的子文件夹和超过层数限制的子文件夹在遍历时直接剪掉，两种顺序都不会进入
+	max_depth = file_filter.max_depth
+	if max_depth is not None:
+		skip = lambda path: folder_depth(path, root) > max_depth or path in excluded
+	else:
+		skip = excluded.covers if excluded else None
+	if top is None:
+		top = root
+	elif skip and skip(top):
+		return
+	if options.workers > 1:
+		tree = parallel_walk(top, topdown=root_file_before, workers=options.workers, skip=skip, reader=reader)
+	else:
+		tree = walk(top, topdown=root_file_before, reader=reader, skip=skip)
+	for dirpath, dir_entries, file_entries in tree:
+		stats.add_dirs()
+		if visited is not None:
+			visited.add(dirpath)
+		yield from _filter_dir(file_entries, dirpath, folder_depth(dirpath, root), file_filter, need_stat, stats)
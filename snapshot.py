@@ -0,0 +1,183 @@
+"""文件清单快照和快照比较
+
+快照按固定顺序保存文件的相对路径、大小和修改时间：每个文件夹中先是按名称排序的文件，
+再依次是按名称排序的子文件夹。同一文件夹的文件只在开头记录一次文件夹路径，文件只记录名称。
+这个顺序等价于按 (文件夹路径的各级名称, 文件名) 排序，两个快照可以像归并排序一样同时顺序读取、逐项比较，
+无论快照有多大，比较时内存中都只有当前的两项。
+
+文件格式：MAGIC，4 字节长度加 JSON 元数据，之后是记录：
+	b'D' + 4 字节长度 + 文件夹相对路径（以 / 分隔，根目录为空）
+	b'F' + 2 字节名称长度 + 8 字节大小 + 8 字节修改时间 + 文件名
+"""
+import json
+import os
+import struct
+import time
+from collections import namedtuple
+
+
+MAGIC = b'FLSNAP1\n'
+SNAPSHOT_EXT = 'flsnap'
+BUFFER_SIZE = 1 << 20
+
+_LENGTH = struct.Struct('<I')
+_FILE = struct.Struct('<Hqd')
+
+SnapshotEntry = namedtuple('SnapshotEntry', ['folder', 'name', 'size', 'mtime', 'key'])
+SnapshotEntry.__doc__ = '快照中的一个文件，folder 为以 / 分隔的相对路径，key 为比较顺序用的 (各级文件夹名称, 文件名)'
+
+Change = namedtuple('Change', ['kind', 'path', 'old', 'new'])
+ADDED, REMOVED, RESIZED, MODIFIED = 'added', 'removed', 'resized', 'modified'
+CHANGE_TITLES = {ADDED: '新增', REMOVED: '删除', RESIZED: '大小变化', MODIFIED: '修改'}
+
+
+def _encode(text):
+	# Linux 上无法解码的文件名由 os.fsdecode 保留为代理字符，原样写回
+	return text.encode('utf-8', 'surrogateescape')
+
+
+def _decode(data):
+	return data.decode('utf-8', 'surrogateescape')
+
+
+def _folder_key(folder):
+	return tuple(folder.split('/')) if folder else ()
+
+
+def snapshot_options(options):
+	"""复制 ScanOptions，按快照需要的顺序遍历并取得大小和修改时间"""
+	return options.replace(
+		priority=2 if options.priority == 2 else 0,
+		show_size=True,
+		show_modify=True,
+		show_hash=False,
+		sort_entries=True,
+		sort_key=None,
+	)
+
+
+class SnapshotWriter:
+	"""按快照顺序依次写入文件；顺序不对时抛出 ValueError，避免写出无法比较的快照"""
+	def __init__(self, file_path, root, **meta):
+		self.root = root
+		self.file = open(file_path, 'wb', buffering=BUFFER_SIZE)
+		header = _encode(json.dumps(dict(meta, root=root, created=time.time()), ensure_ascii=False))
+		self.file.write(MAGIC + _LENGTH.pack(len(header)) + header)
+		self.count = 0
+		self._dirpath = None
+		self._last_key = None
+		self._last_name = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		self.file.close()
+
+	def write(self, record):
+		if record.dirpath != self._dirpath:
+			rel = os.path.relpath(record.dirpath, self.root)
+			folder = '' if rel == os.curdir else rel.replace(os.sep, '/')
+			key = _folder_key(folder)
+			if self._last_key is not None and key <= self._last_key:
+				raise ValueError(f'快照中的文件夹顺序有误: {folder}')
+			data = _encode(folder)
+			self.file.write(b'D' + _LENGTH.pack(len(data)) + data)
+			self._dirpath = record.dirpath
+			self._last_key = key
+			self._last_name = None
+		elif record.name <= self._last_name:
+			raise ValueError(f'快照中的文件顺序有误: {record.path}')
+		name = _encode(record.name)
+		self.file.write(b'F' + _FILE.pack(len(name), record.size, record.mtime) + name)
+		self._last_name = record.name
+		self.count += 1
+
+
+def write_snapshot(records, file_path, options):
+	"""把按 snapshot_options 扫描得到的 FileRecord 写成快照，返回文件数"""
+	with SnapshotWriter(file_path, options.root, type_filter=options.type_filter, include_types=options.include_types) as writer:
+		for record in records:
+			writer.write(record)
+	return writer.count
+
+
+def _read_header(file, file_path):
+	if file.read(len(MAGIC)) != MAGIC:
+		raise ValueError(f'不是文件清单快照: {file_path}')
+	length, = _LENGTH.unpack(file.read(_LENGTH.size))
+	return json.loads(_decode(file.read(length)))
+
+
+def read_meta(file_path):
+	"""读取快照的元数据（root、created 和过滤条件），不是快照时抛出 ValueError"""
+	with open(file_path, 'rb') as file:
+		return _read_header(file, file_path)
+
+
+def read_snapshot(file_path):
+	"""按顺序逐个产出快照中的 SnapshotEntry"""
+	with open(file_path, 'rb', buffering=BUFFER_SIZE) as file:
+		_read_header(file, file_path)
+		read = file.read
+		folder = ''
+		folder_key = ()
+		while tag := read(1):
+			if tag == b'D':
+				length, = _LENGTH.unpack(read(_LENGTH.size))
+				folder = _decode(read(length))
+				folder_key = _folder_key(folder)
+			elif tag == b'F':
+				length, size, mtime = _FILE.unpack(read(_FILE.size))
+				name = _decode(read(length))
+				yield SnapshotEntry(folder, name, size, mtime, (folder_key, name))
+			else:
+				raise ValueError(f'快照文件已损坏: {file_path}')
+
+
+def _path(entry):
+	return f'{entry.folder}/{entry.name}' if entry.folder else entry.name
+
+
+def diff(old_entries, new_entries):
+	"""归并比较两个按快照顺序排列的序列，产出新增、删除、大小变化和修改的 Change"""
+	old_entries = iter(old_entries)
+	new_entries = iter(new_entries)
+	old = next(old_entries, None)
+	new = next(new_entries, None)
+	while old is not None and new is not None:
+		# 同一文件夹中只需比较文件名，不必逐级比较文件夹名称
+		if old.folder == new.folder:
+			removed, added = old.name < new.name, new.name < old.name
+		else:
+			removed = old.key < new.key
+			added = not removed
+		if removed:
+			yield Change(REMOVED, _path(old), old, None)
+			old = next(old_entries, None)
+		elif added:
+			yield Change(ADDED, _path(new), None, new)
+			new = next(new_entries, None)
+		else:
+			if old.size != new.size:
+				yield Change(RESIZED, _path(new), old, new)
+			elif old.mtime != new.mtime:
+				yield Change(MODIFIED, _path(new), old, new)
+			old = next(old_entries, None)
+			new = next(new_entries, None)
+	while old is not None:
+		yield Change(REMOVED, _path(old), old, None)
+		old = next(old_entries, None)
+	while new is not None:
+		yield Change(ADDED, _path(new), None, new)
+		new = next(new_entries, None)
+
+
+def diff_files(old_path, new_path):
+	"""比较两个快照文件；先检查文件头，文件有误时在开始输出之前就抛出 ValueError"""
+	read_meta(old_path)
+	read_meta(new_path)
+	return diff(read_snapshot(old_path), read_snapshot(new_path))
@@ -0,0 +1,281 @@
+"""监视目标文件夹的变化
+
+生成清单之后打开监视，磁盘上的变化以“哪些文件夹的内容变了”的形式报告，
+界面只重新读取这些文件夹本身，更新文件夹树和清单，不必重新扫描整个目标文件夹。
+
+Linux 上通过 ctypes 调用 inotify，每个文件夹一个 watch；没有 inotify 或 watch 数量超过系统上限时，
+退回到定时检查每个文件夹的修改时间。轮询只能发现文件的增删和改名，文件内容被改写不会改变文件夹的修改时间。
+
+一连串的事件会被合并：DEBOUNCE 秒内没有新的事件时才报告一次；持续写入时最迟 MAX_DELAY 秒报告一次。
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+
+import scanner
+
+
+DEBOUNCE = 0.5
+MAX_DELAY = 3.0
+POLL_INTERVAL = 2.0
+READ_SIZE = 64 * 1024
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+	| IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT = struct.Struct('iIII')
+
+
+def _load_libc():
+	if not hasattr(os, 'uname') or os.uname().sysname != 'Linux':
+		return None
+	try:
+		libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+		libc.inotify_init1.argtypes = [ctypes.c_int]
+		libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+		libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+	except (OSError, AttributeError):
+		return None
+	return libc
+
+
+_libc = _load_libc()
+
+
+class Watcher(threading.Thread):
+	"""监视线程的基类：子类的 _Wait(timeout) 返回这段时间内内容有变化的文件夹
+
+	callback(folders) 在监视线程中调用，folders 为排好序的文件夹路径列表，其中可能有已经删除的文件夹；
+	监视因错误停止时调用 on_error(OSError)，例如 inotify watch 数量超过系统上限，可以改用 PollingWatcher。
+	skip(path) 为 True 的子文件夹不监视；recursive 为 False 时只监视 root 本身。
+	lister 为开始监视时列出子文件夹的函数，可以换成 dircache.DirCache.list_subfolders，不必重新读取磁盘；
+	之后新出现的文件夹总是从磁盘读取。
+	"""
+	def __init__(self, root, callback, skip=None, recursive=True, lister=scanner.list_subfolders,
+			debounce=DEBOUNCE, max_delay=MAX_DELAY, on_error=None):
+		super().__init__(daemon=True)
+		self.root = root
+		self.callback = callback
+		self.skip = skip
+		self.recursive = recursive
+		self.lister = lister
+		self.debounce = debounce
+		self.max_delay = max_delay
+		self.on_error = on_error
+		self.error = None
+		self._stopping = threading.Event()
+
+	def stop(self):
+		self._stopping.set()
+
+	def _Folders(self, top, lister=scanner.list_subfolders):
+		"""top 及其下所有需要监视的文件夹"""
+		folders = [top]
+		if not self.recursive:
+			return folders
+		pending = [top]
+		while pending:
+			for entry in lister(pending.pop()):
+				if not entry.is_symlink() and not (self.skip and self.skip(entry.path)):
+					folders.append(entry.path)
+					pending.append(entry.path)
+		return folders
+
+	def _Start(self):
+		"""开始监视之前的准备，在监视线程中调用"""
+
+	def _Wait(self, timeout):
+		raise NotImplementedError
+
+	def _Close(self):
+		pass
+
+	def run(self):
+		try:
+			self._Start()
+			dirty = set()
+			first = last = None
+			while not self._stopping.is_set():
+				now = time.monotonic()
+				if dirty and (now - last >= self.debounce or now - first >= self.max_delay):
+					self.callback(sorted(dirty))
+					dirty = set()
+					continue
+				timeout = self.debounce if dirty else 0.2
+				changed = self._Wait(timeout)
+				if changed:
+					now = time.monotonic()
+					if not dirty:
+						first = now
+					last = now
+					dirty.update(changed)
+		except OSError as e:
+			self.error = e
+			if self.on_error is not None:
+				self.on_error(e)
+		finally:
+			self._Close()
+
+
+class InotifyWatcher(Watcher):
+	"""基于 inotify 的监视，每个文件夹一个 watch，新建的文件夹随时加入"""
+	def __init__(self, *args, **kwargs):
+		if _libc is None:
+			raise OSError(errno.ENOSYS, '当前系统不支持 inotify')
+		super().__init__(*args, **kwargs)
+		self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self.fd < 0:
+			code = ctypes.get_errno()
+			raise OSError(code, os.strerror(code))
+		self._paths = {}  # wd -> 文件夹路径
+		self._wds = {}    # 文件夹路径 -> wd
+
+	def _AddWatch(self, folder_path):
+		wd = _libc.inotify_add_watch(self.fd, os.fsencode(folder_path), WATCH_MASK)
+		if wd < 0:
+			code = ctypes.get_errno()
+			if code == errno.ENOSPC:
+				# 超过 fs.inotify.max_user_watches，无法完整监视
+				raise OSError(code, f'inotify watch 数量超过系统上限: {folder_path}')
+			return False
+		self._paths[wd] = folder_path
+		self._wds[folder_path] = wd
+		return True
+
+	def _AddTree(self, top, lister=scanner.list_subfolders):
+		"""监视 top 及其子文件夹，返回加入的文件夹，这些文件夹在 watch 建立之前的变化需要重新读取"""
+		return [folder for folder in self._Folders(top, lister) if self._AddWatch(folder)]
+
+	def _RemoveTree(self, top):
+		prefix = os.path.join(top, '')
+		for folder in [folder for folder in self._wds if folder == top or folder.startswith(prefix)]:
+			wd = self._wds.pop(folder)
+			self._paths.pop(wd, None)
+			_libc.inotify_rm_watch(self.fd, wd)
+
+	def _Start(self):
+		self._AddTree(self.root, self.lister)
+
+	def _Wait(self, timeout):
+		readable, _, _ = select.select([self.fd], [], [], timeout)
+		if not readable:
+			return ()
+		try:
+			data = os.read(self.fd, READ_SIZE)
+		except BlockingIOError:
+			return ()
+		changed = set()
+		offset = 0
+		while offset < len(data):
+			wd, mask, _, length = _EVENT.unpack_from(data, offset)
+			offset += _EVENT.size
+			name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+			offset += length
+			if mask & IN_Q_OVERFLOW:
+				# 事件丢失，只能把所有文件夹都当作有变化
+				changed.update(self._wds)
+				continue
+			folder = self._paths.get(wd)
+			if folder is None:
+				continue
+			if mask & IN_IGNORED:
+				self._paths.pop(wd, None)
+				if self._wds.get(folder) == wd:
+					del self._wds[folder]
+				continue
+			if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+				changed.add(folder)
+				continue
+			changed.add(folder)
+			if not name or not mask & IN_ISDIR:
+				continue
+			path = os.path.join(folder, name)
+			if mask & (IN_DELETE | IN_MOVED_FROM):
+				self._RemoveTree(path)
+				changed.add(path)
+			elif mask & (IN_CREATE | IN_MOVED_TO) and self.recursive and not (self.skip and self.skip(path)):
+				changed.update(self._AddTree(path))
+		return changed
+
+	def _Close(self):
+		os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+	"""定时比较每个文件夹的修改时间，用于没有 inotify 的系统"""
+	def __init__(self, *args, interval=POLL_INTERVAL, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.interval = interval
+		self._mtimes = {}
+
+	def _Track(self, top, lister=scanner.list_subfolders):
+		"""记录 top 及其子文件夹的修改时间，返回记录的文件夹"""
+		folders = []
+		for folder in self._Folders(top, lister):
+			try:
+				self._mtimes[folder] = os.stat(folder).st_mtime_ns
+			except OSError:
+				continue
+			folders.append(folder)
+		return folders
+
+	def _Start(self):
+		self._Track(self.root, self.lister)
+
+	def _Wait(self, timeout):
+		if self._stopping.wait(max(timeout, self.interval)):
+			return ()
+		changed = set()
+		for folder, mtime_ns in list(self._mtimes.items()):
+			if folder not in self._mtimes:
+				continue
+			try:
+				current = os.stat(folder).st_mtime_ns
+			except OSError:
+				current = None
+			if current == mtime_ns:
+				continue
+			changed.add(folder)
+			if current is None:
+				prefix = os.path.join(folder, '')
+				for path in [path for path in self._mtimes if path == folder or path.startswith(prefix)]:
+					del self._mtimes[path]
+					changed.add(path)
+				continue
+			self._mtimes[folder] = current
+			if self.recursive:
+				# 新的子文件夹要加入监视，其中已有的文件也需要读取
+				for entry in scanner.list_subfolders(folder):
+					if entry.path not in self._mtimes and not entry.is_symlink() and not (self.skip and self.skip(entry.path)):
+						changed.update(self._Track(entry.path))
+		return changed
+
+
+def create_watcher(root, callback, **kwargs):
+	"""优先使用 inotify，不可用时使用轮询；参数见 Watcher"""
+	if _libc is not None:
+		try:
+			return InotifyWatcher(root, callback, **kwargs)
+		except OSError:
+			pass
+	return PollingWatcher(root, callback, **kwargs)